@@ -0,0 +1,274 @@
+"""Local mock of the radio-browser API for the benchmarks.
+
+The station catalog is generated from a seed, so every run sees the same
+data. Only the endpoints radioactive uses are served. Each response can be
+delayed to simulate the round trip to a real server.
+
+    python benchmarks/mock_api.py --port 8080 --stations 10000
+    RADIOACTIVE_API_URL=http://127.0.0.1:8080 radio --search jazz
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WORDS = [
+    "jazz",
+    "rock",
+    "classic",
+    "news",
+    "talk",
+    "pop",
+    "radio",
+    "fm",
+    "city",
+    "country",
+    "blues",
+    "soul",
+    "dance",
+    "metal",
+    "indie",
+    "folk",
+    "chill",
+    "lounge",
+    "hits",
+    "retro",
+    "public",
+    "community",
+    "sports",
+    "world",
+]
+COUNTRIES = [
+    ("Germany", "DE", "German"),
+    ("United States Of America", "US", "english"),
+    ("India", "IN", "hindi"),
+    ("France", "FR", "french"),
+    ("United Kingdom", "GB", "english"),
+    ("Brazil", "BR", "portuguese"),
+    ("Japan", "JP", "japanese"),
+    ("Spain", "ES", "spanish"),
+]
+STATES = ["North", "South", "East", "West", "Central"]
+CODECS = [("MP3", "mp3", 128), ("AAC", "aac", 64), ("MP3", "mp3", 192)]
+
+
+def generate_stations(count, stream_base, seed=42):
+    rng = random.Random(seed)
+    stations = []
+    for index in range(count):
+        name = " ".join(rng.choice(WORDS).title() for _ in range(2))
+        country, code, language = rng.choice(COUNTRIES)
+        codec, extension, bitrate = rng.choice(CODECS)
+        station_uuid = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        url = "{}/{}.{}".format(stream_base, station_uuid, extension)
+        stations.append(
+            {
+                "changeuuid": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                "stationuuid": station_uuid,
+                "serveruuid": None,
+                "name": "{} {}".format(name, index),
+                "url": url,
+                "url_resolved": url,
+                "homepage": "http://example.org/{}".format(index),
+                "favicon": "",
+                "tags": ",".join(sorted(set(rng.sample(WORDS, 3)))),
+                "country": country,
+                "countrycode": code,
+                "iso_3166_2": None,
+                "state": rng.choice(STATES),
+                "language": language,
+                "languagecodes": "",
+                "votes": rng.randint(0, 5000),
+                "lastchangetime": "2024-01-01 00:00:00",
+                "lastchangetime_iso8601": "2024-01-01T00:00:00Z",
+                "codec": codec,
+                "bitrate": bitrate,
+                "hls": 0,
+                "lastcheckok": 1,
+                "lastchecktime": "2024-01-01 00:00:00",
+                "lastchecktime_iso8601": "2024-01-01T00:00:00Z",
+                "lastcheckoktime": "2024-01-01 00:00:00",
+                "lastcheckoktime_iso8601": "2024-01-01T00:00:00Z",
+                "lastlocalchecktime": "",
+                "lastlocalchecktime_iso8601": None,
+                "clicktimestamp": "",
+                "clicktimestamp_iso8601": None,
+                "clickcount": rng.randint(0, 20000),
+                "clicktrend": rng.randint(-50, 50),
+                "ssl_error": 0,
+                "geo_lat": round(rng.uniform(-60, 70), 4),
+                "geo_long": round(rng.uniform(-180, 180), 4),
+                "has_extended_info": False,
+            }
+        )
+    return stations
+
+
+def matches(value, wanted, exact):
+    value = (value or "").lower()
+    wanted = wanted.lower()
+    return value == wanted if exact else wanted in value
+
+
+def search(stations, params):
+    def flag(name):
+        return params.get(name, "false").lower() == "true"
+
+    results = stations
+    for field in ["name", "country", "state", "language"]:
+        if params.get(field):
+            exact = flag(field + "_exact")
+            results = [s for s in results if matches(s[field], params[field], exact)]
+    if params.get("countrycode"):
+        code = params["countrycode"].upper()
+        results = [s for s in results if s["countrycode"] == code]
+    if params.get("tag"):
+        tag = params["tag"].lower()
+        if flag("tag_exact"):
+            results = [s for s in results if tag in s["tags"].split(",")]
+        else:
+            results = [s for s in results if tag in s["tags"]]
+
+    order = params.get("order", "name")
+    if order in ("votes", "clickcount", "bitrate", "name"):
+        results = sorted(results, key=lambda s: s[order], reverse=flag("reverse"))
+    offset = int(params.get("offset", 0))
+    limit = int(params.get("limit", 100000))
+    return results[offset : offset + limit]
+
+
+def facet(stations, field, key="name"):
+    counts = {}
+    for station in stations:
+        values = station[field].split(",") if field == "tags" else [station[field]]
+        for value in values:
+            counts[value] = counts.get(value, 0) + 1
+    return [{key: value, "stationcount": count} for value, count in counts.items()]
+
+
+class MockAPI:
+    def __init__(
+        self,
+        stations=1000,
+        stream_base="http://127.0.0.1:8000",
+        delay=0.0,
+        port=0,
+        seed=42,
+    ):
+        self.stations = generate_stations(stations, stream_base, seed)
+        self.by_uuid = {s["stationuuid"]: s for s in self.stations}
+        self.delay = delay
+        self.requests = 0
+        self.clicks = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self.handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/".format(self.server.server_address[1])
+
+    def route(self, path, params):
+        parts = [p for p in path.split("/") if p]
+        if parts[:2] == ["json", "stations"] and len(parts) >= 3:
+            if parts[2] == "search":
+                return search(self.stations, params)
+            if parts[2] == "byuuid":
+                uuids = parts[3:4] or params.get("uuids", "").split(",")
+                return [self.by_uuid[u] for u in uuids if u in self.by_uuid]
+        if parts[:2] == ["json", "url"] and len(parts) == 3:
+            station = self.by_uuid.get(parts[2])
+            self.clicks += 1
+            return {
+                "ok": station is not None,
+                "message": "retrieved station url",
+                "stationuuid": parts[2],
+                "name": station["name"] if station else "",
+                "url": station["url"] if station else "",
+            }
+        if parts[:2] == ["json", "countries"]:
+            names = {s["countrycode"]: s["country"] for s in self.stations}
+            return [
+                {
+                    "name": names[entry["name"]],
+                    "iso_3166_1": entry["name"],
+                    "stationcount": entry["stationcount"],
+                }
+                for entry in facet(self.stations, "countrycode")
+            ]
+        if parts[:2] == ["json", "countrycodes"]:
+            return facet(self.stations, "countrycode")
+        if parts[:2] == ["json", "tags"]:
+            return facet(self.stations, "tags")
+        if parts[:2] == ["json", "languages"]:
+            return facet(self.stations, "language")
+        if parts[:2] == ["json", "states"]:
+            return facet(self.stations, "state")
+        return None
+
+    def handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                api.requests += 1
+                if api.delay:
+                    time.sleep(api.delay)
+                url = urlparse(self.path)
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                try:
+                    result = api.route(url.path, params)
+                except (KeyError, ValueError):
+                    result = None
+                if result is None:
+                    self.send_error(404)
+                    return
+                body = json.dumps(result).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_POST = do_GET
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="mock radio-browser API")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--stations", type=int, default=1000)
+    parser.add_argument("--stream-base", default="http://127.0.0.1:8000")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds")
+    args = parser.parse_args()
+    api = MockAPI(args.stations, args.stream_base, args.delay, args.port)
+    print("mock radio-browser API on {}".format(api.url))
+    try:
+        api.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""Local mock of an Icecast server for the benchmarks.
+
+It serves generated silent audio, so no media files are needed:
+
+    /<anything>.mp3     MPEG-1 Layer III, 128kbps, 44.1kHz
+    /<anything>.aac     AAC-LC in ADTS frames, 44.1kHz mono
+    /<anything>.m3u     a playlist pointing at /<anything>.mp3
+
+Like Icecast, a burst of audio is sent on connect and the rest is paced at
+the bitrate. Each connection can be delayed to simulate the time to reach a
+real server. ?fast=1 sends as fast as the client reads, for throughput
+tests. Clients sending "Icy-MetaData: 1" get ICY StreamTitle metadata every
+icy-metaint bytes.
+"""
+
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# 128kbps at 44.1kHz, no padding: 144 * 128000 / 44100 bytes per frame
+MP3_HEADER = b"\xff\xfb\x90\x00"
+MP3_FRAME_SIZE = 417
+MP3_FRAMES_PER_SECOND = 44100 / 1152
+
+# a silent mono AAC-LC raw data block
+AAC_SILENCE = b"\x01\x40\x20\x07"
+AAC_FRAMES_PER_SECOND = 44100 / 1024
+
+ICY_METAINT = 16000
+BURST_SECONDS = 2
+SEND_INTERVAL = 0.1
+
+
+def mp3_frame():
+    return MP3_HEADER + bytes(MP3_FRAME_SIZE - len(MP3_HEADER))
+
+
+def adts_frame(payload=AAC_SILENCE, sample_rate_index=4, channels=1):
+    """wraps a raw AAC-LC block in a 7 byte ADTS header"""
+    length = 7 + len(payload)
+    header = bytes(
+        [
+            0xFF,
+            0xF1,  # MPEG-4, layer 0, no CRC
+            (1 << 6) | (sample_rate_index << 2) | (channels >> 2),  # LC
+            ((channels & 3) << 6) | (length >> 11),
+            (length >> 3) & 0xFF,
+            ((length & 7) << 5) | 0x1F,
+            0xFC,
+        ]
+    )
+    return header + payload
+
+
+def icy_block(title):
+    text = "StreamTitle='{}';".format(title).encode("utf-8")
+    blocks = (len(text) + 15) // 16
+    return bytes([blocks]) + text.ljust(blocks * 16, b"\0")
+
+
+class IcyWriter:
+    """inserts a metadata block every ICY_METAINT bytes of audio"""
+
+    def __init__(self, write, metaint=ICY_METAINT):
+        self.write_raw = write
+        self.metaint = metaint
+        self.until_meta = metaint
+        self.blocks = 0
+
+    def write(self, data):
+        while data:
+            part, data = data[: self.until_meta], data[self.until_meta :]
+            self.write_raw(part)
+            self.until_meta -= len(part)
+            if self.until_meta == 0:
+                self.blocks += 1
+                self.write_raw(icy_block("Mock Artist - Track {}".format(self.blocks)))
+                self.until_meta = self.metaint
+
+
+class MockIcecast:
+    def __init__(self, port=0, burst=BURST_SECONDS, delay=0.0):
+        self.burst = burst
+        self.delay = delay
+        self.connections = 0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self.handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server.server_address[1])
+
+    def count(self, sent):
+        with self.lock:
+            self.bytes_sent += sent
+
+    def handler_class(self):
+        icecast = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if icecast.delay:
+                    time.sleep(icecast.delay)
+                url = urlparse(self.path)
+                params = parse_qs(url.query)
+                if url.path.endswith(".m3u"):
+                    return self.playlist(url.path[: -len(".m3u")] + ".mp3")
+                if url.path.endswith(".aac"):
+                    frame, per_second = adts_frame(), AAC_FRAMES_PER_SECOND
+                    content_type, bitrate = "audio/aac", 64
+                else:
+                    frame, per_second = mp3_frame(), MP3_FRAMES_PER_SECOND
+                    content_type, bitrate = "audio/mpeg", 128
+                self.stream(
+                    frame,
+                    per_second,
+                    content_type,
+                    bitrate,
+                    fast=params.get("fast", ["0"])[0] == "1",
+                )
+
+            def playlist(self, path):
+                body = "#EXTM3U\n#EXTINF:-1,Mock\n{}{}\n".format(icecast.url, path)
+                body = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "audio/x-mpegurl")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def stream(self, frame, per_second, content_type, bitrate, fast):
+                icecast.connections += 1
+                metadata = self.headers.get("Icy-MetaData") == "1"
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("icy-name", "radioactive mock")
+                self.send_header("icy-br", str(bitrate))
+                if metadata:
+                    self.send_header("icy-metaint", str(ICY_METAINT))
+                self.end_headers()
+
+                writer = IcyWriter(self.wfile.write) if metadata else self.wfile
+                started = time.monotonic()
+                sent_frames = 0
+                try:
+                    # the burst on connect lets players start right away
+                    burst = int(per_second * icecast.burst)
+                    writer.write(frame * burst)
+                    sent_frames += burst
+                    icecast.count(len(frame) * burst)
+                    while True:
+                        if fast:
+                            frames = int(per_second)
+                        else:
+                            time.sleep(SEND_INTERVAL)
+                            elapsed = time.monotonic() - started
+                            due = int(per_second * (icecast.burst + elapsed))
+                            frames = due - sent_frames
+                        if frames > 0:
+                            writer.write(frame * frames)
+                            sent_frames += frames
+                            icecast.count(len(frame) * frames)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="mock Icecast server")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--burst", type=float, default=BURST_SECONDS)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds")
+    args = parser.parse_args()
+    icecast = MockIcecast(args.port, args.burst, args.delay)
+    print("mock Icecast server on {}".format(icecast.url))
+    try:
+        icecast.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
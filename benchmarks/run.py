@@ -0,0 +1,344 @@
+"""Reproducible benchmarks of radioactive.
+
+Everything runs against local servers (benchmarks/mock_api.py and
+benchmarks/mock_icecast.py) and fake ffplay/ffmpeg (benchmarks/shims), in a
+throw-away HOME and cache directory, so no network or audio device is used
+and runs on the same machine are comparable.
+
+    python benchmarks/run.py                      # results/<date>-<commit>.json
+    python benchmarks/run.py --compare results/baseline.json
+    python benchmarks/run.py --only search_latency --repeat 20
+
+Measured:
+    cold_start          `radio --search ... --json` with an empty cache
+    warm_start          the same with the cache filled by the previous run
+    search_latency      Handler.find_stations, first call and cached calls
+    first_audio         Player start to the first byte read by the player,
+                        from the URL and from a warm (zapping) stream
+    record_throughput   record_audio_from_url copying a fast stream
+    memory              peak RSS of the CLI and of a 10k station search
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+SHIMS_DIR = os.path.join(BENCH_DIR, "shims")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from mock_api import MockAPI  # noqa: E402
+from mock_icecast import MockIcecast  # noqa: E402
+from zenlog import log  # noqa: E402
+
+DEFAULT_REPEAT = 5
+DEFAULT_STATIONS = 10000
+DEFAULT_API_DELAY = 0.02
+DEFAULT_STREAM_DELAY = 0.1
+DEFAULT_THRESHOLD = 0.10
+RECORD_BYTES = 8 * 1024 * 1024
+FIRST_AUDIO_TIMEOUT = 10
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def metric(value, unit, better="lower"):
+    return {"value": round(value, 3), "unit": unit, "better": better}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_DIR,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    peak = resource.getrusage(who).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class Bench:
+    def __init__(self, repeat, stations, api_delay, stream_delay):
+        self.repeat = repeat
+        self.workdir = tempfile.mkdtemp(prefix="radioactive-bench-")
+        self.icecast = MockIcecast(delay=stream_delay).start()
+        self.api = MockAPI(stations, self.icecast.url, api_delay).start()
+        self.env = self.isolate()
+
+    def isolate(self):
+        """points HOME, the cache and the API at the sandbox, this process
+        and the CLI children both use it"""
+        home = os.path.join(self.workdir, "home")
+        os.makedirs(home)
+        os.environ["HOME"] = home
+        os.environ["XDG_CACHE_HOME"] = os.path.join(self.workdir, "cache")
+        os.environ["RADIOACTIVE_API_URL"] = self.api.url
+        os.environ["PATH"] = SHIMS_DIR + os.pathsep + os.environ.get("PATH", "")
+        os.environ["PYTHONPATH"] = REPO_DIR
+        return dict(os.environ)
+
+    def clear_cache(self):
+        shutil.rmtree(os.environ["XDG_CACHE_HOME"], ignore_errors=True)
+
+    def close(self):
+        self.api.stop()
+        self.icecast.stop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    # ----------------------------- benchmarks ----------------------------- #
+    def run_cli(self, *args):
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "radioactive"] + list(args),
+            env=self.env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+        return (time.perf_counter() - started) * 1000
+
+    def bench_cold_start(self):
+        cold, warm = [], []
+        for _ in range(self.repeat):
+            self.clear_cache()
+            cold.append(self.run_cli("--search", "jazz", "--limit", "50", "--json"))
+            warm.append(self.run_cli("--search", "jazz", "--limit", "50", "--json"))
+        return {
+            "cold_start": metric(statistics.median(cold), "ms"),
+            "warm_start": metric(statistics.median(warm), "ms"),
+            "cli_peak_rss": metric(peak_rss_mb(resource.RUSAGE_CHILDREN), "MB"),
+        }
+
+    def bench_search_latency(self):
+        from radioactive.handler import Handler
+        from radioactive.session import build_session
+
+        self.clear_cache()
+        handler = Handler(build_session(budget=0))
+        first, cached = [], []
+        for index in range(self.repeat):
+            name = "rock {}".format(index)  # a new query misses the cache
+            started = time.perf_counter()
+            handler.find_stations(name=name, name_exact=False, limit=100)
+            first.append((time.perf_counter() - started) * 1000)
+            for _ in range(5):
+                started = time.perf_counter()
+                handler.find_stations(name=name, name_exact=False, limit=100)
+                cached.append((time.perf_counter() - started) * 1000)
+        handler.session.close()
+        return {
+            "search_first": metric(statistics.median(first), "ms"),
+            "search_cached_p50": metric(percentile(cached, 50), "ms"),
+            "search_cached_p95": metric(percentile(cached, 95), "ms"),
+        }
+
+    def time_first_audio(self, url, source=None):
+        from radioactive.player import Player
+
+        mark = os.path.join(self.workdir, "first-audio")
+        if os.path.exists(mark):
+            os.remove(mark)
+        os.environ["RADIOACTIVE_BENCH_MARK"] = mark
+        started = time.time()
+        player = Player(url, 80, "error", station_name="bench", source=source)
+        try:
+            while not os.path.exists(mark):
+                if time.time() - started > FIRST_AUDIO_TIMEOUT:
+                    raise RuntimeError("no audio from {}".format(url))
+                time.sleep(0.002)
+            time.sleep(0.005)  # let the shim finish writing the mark
+            with open(mark) as f:
+                return (float(f.read()) - started) * 1000
+        finally:
+            player.close()
+            del os.environ["RADIOACTIVE_BENCH_MARK"]
+
+    def bench_first_audio(self):
+        from radioactive.zapper import WarmStream
+
+        url = self.api.stations[0]["url_resolved"]
+        cold, warm = [], []
+        for _ in range(self.repeat):
+            cold.append(self.time_first_audio(url))
+            stream = WarmStream({"name": "bench", "url": url}).start()
+            deadline = time.time() + FIRST_AUDIO_TIMEOUT
+            while not stream.ready and time.time() < deadline:
+                time.sleep(0.01)
+            warm.append(self.time_first_audio(url, source=stream))
+        return {
+            "first_audio_cold": metric(statistics.median(cold), "ms"),
+            "first_audio_warm": metric(statistics.median(warm), "ms"),
+        }
+
+    def bench_record_throughput(self):
+        from radioactive.recorder import record_audio_from_url
+
+        url = self.icecast.url + "/record.mp3?fast=1"
+        output = os.path.join(self.workdir, "record.mp3")
+        os.environ["RADIOACTIVE_BENCH_BYTES"] = str(RECORD_BYTES)
+        rates = []
+        try:
+            for _ in range(self.repeat):
+                started = time.perf_counter()
+                record_audio_from_url(url, output, "error")
+                elapsed = time.perf_counter() - started
+                rates.append(os.path.getsize(output) / elapsed / (1024 * 1024))
+                os.remove(output)
+        finally:
+            del os.environ["RADIOACTIVE_BENCH_BYTES"]
+        return {"record_throughput": metric(statistics.median(rates), "MB/s", "higher")}
+
+    def bench_memory(self):
+        from radioactive.handler import Handler
+        from radioactive.session import build_session
+
+        handler = Handler(build_session(budget=0))
+        before = peak_rss_mb()
+        stations = handler.find_stations(limit=len(self.api.stations))
+        after = peak_rss_mb()
+        handler.session.close()
+        return {
+            "search_10k_stations": metric(len(stations), "stations", "higher"),
+            "search_10k_peak_rss_growth": metric(after - before, "MB"),
+            "bench_peak_rss": metric(after, "MB"),
+        }
+
+
+BENCHMARKS = {
+    "cold_start": Bench.bench_cold_start,
+    "search_latency": Bench.bench_search_latency,
+    "first_audio": Bench.bench_first_audio,
+    "record_throughput": Bench.bench_record_throughput,
+    # last, it is about the peak memory of this process
+    "memory": Bench.bench_memory,
+}
+
+
+def compare(baseline, results, threshold=DEFAULT_THRESHOLD):
+    """prints the change of every metric, returns the names of the ones
+    that got worse by more than the threshold"""
+    regressions = []
+    print("{:<28} {:>12} {:>12} {:>9}".format("metric", "baseline", "now", "change"))
+    for name, now in results["metrics"].items():
+        old = baseline["metrics"].get(name)
+        if old is None:
+            print("{:<28} {:>12} {:>12.3f}".format(name, "-", now["value"]))
+            continue
+        change = (now["value"] - old["value"]) / old["value"] if old["value"] else 0
+        worse = change if now["better"] == "lower" else -change
+        flag = "  REGRESSION" if worse > threshold else ""
+        if flag:
+            regressions.append(name)
+        print(
+            "{:<28} {:>12.3f} {:>12.3f} {:>+8.1%}{}".format(
+                name, old["value"], now["value"], change, flag
+            )
+        )
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="radioactive benchmarks")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--stations", type=int, default=DEFAULT_STATIONS)
+    parser.add_argument(
+        "--api-delay",
+        type=float,
+        default=DEFAULT_API_DELAY,
+        help="seconds the mock API waits before each response",
+    )
+    parser.add_argument(
+        "--stream-delay",
+        type=float,
+        default=DEFAULT_STREAM_DELAY,
+        help="seconds the mock Icecast server waits before each stream",
+    )
+    parser.add_argument("--only", choices=list(BENCHMARKS), action="append")
+    parser.add_argument("--output", help="where to write the results (JSON)")
+    parser.add_argument("--compare", help="results of an earlier run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="relative change counted as a regression (default 0.10)",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    log.level("error")
+    bench = Bench(args.repeat, args.stations, args.api_delay, args.stream_delay)
+    metrics = {}
+    try:
+        for name in args.only or list(BENCHMARKS):
+            print("running {}...".format(name), file=sys.stderr)
+            metrics.update(BENCHMARKS[name](bench))
+    finally:
+        bench.close()
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "stations": args.stations,
+            "api_delay": args.api_delay,
+            "stream_delay": args.stream_delay,
+        },
+        "metrics": metrics,
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(
+            RESULTS_DIR,
+            "{}-{}.json".format(
+                datetime.datetime.now().strftime("%Y%m%d-%H%M%S"),
+                results["meta"]["commit"],
+            ),
+        )
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("results written to {}".format(output), file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, results, args.threshold):
+            return 1
+    else:
+        for name, value in metrics.items():
+            print("{:<28} {:>12.3f} {}".format(name, value["value"], value["unit"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
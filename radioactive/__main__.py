@@ -10,21 +10,33 @@ from radioactive.alias import Alias
 from radioactive.app import App
 from radioactive.args import Parser
 from radioactive.handler import Handler
+from radioactive.daemon import run_daemon
+from radioactive.errors import PlayerError
 from radioactive.help import show_help
 from radioactive.last_station import Last_station
-from radioactive.player import Player, kill_background_ffplays
+from radioactive.metrics import serve_metrics
+from radioactive.player import Player, get_backend, kill_background_ffplays
+from radioactive.session import build_session, parse_timeout
+from radioactive.telemetry import Sampler
+from radioactive.transcoder import TranscodeQueue, Transcoder
 from radioactive.utilities import (handle_add_station, handle_add_to_favorite,
+                                   handle_cache_command,
                                    handle_current_play_panel,
-                                   handle_direct_play, handle_favorite_table,
+                                   handle_direct_play, handle_export,
+                                   handle_favorite_table, handle_import,
+                                   handle_json_output, handle_library,
+                                   handle_library_scan, handle_library_usage,
                                    handle_listen_keypress, handle_log_level,
                                    handle_play_last_station, handle_record,
+                                   handle_refresh_favorites,
                                    handle_save_last_station,
                                    handle_search_stations,
                                    handle_station_selection_menu,
-                                   handle_station_uuid_play,
-                                   handle_update_screen,
+                                   handle_station_uuid_play, handle_status,
+                                   handle_transcode, handle_update_screen,
                                    handle_user_choice_from_search_result,
-                                   handle_welcome_screen)
+                                   handle_welcome_screen, handle_zapper,
+                                   station_codec)
 
 # globally needed as signal handler needs it
 # to terminate main() properly
@@ -41,7 +53,17 @@ def final_step(options, last_station, alias, handler):
     if options["curr_station_name"].strip() == "":
         options["curr_station_name"] = "N/A"
 
-    player = Player(options["target_url"], options["volume"], options["loglevel"])
+    try:
+        player = Player(
+            options["target_url"],
+            options["volume"],
+            options["loglevel"],
+            station_name=options["curr_station_name"],
+            backend=get_backend(options["player"], options["pcm_output"]),
+        )
+    except PlayerError as e:
+        log.critical(str(e))
+        sys.exit(1)
 
     handle_save_last_station(
         last_station, options["curr_station_name"], options["target_url"]
@@ -54,6 +76,14 @@ def final_step(options, last_station, alias, handler):
 
     handle_current_play_panel(options["curr_station_name"])
 
+    # favorites played from old snapshots are looked up again, in one go
+    handle_refresh_favorites(handler, alias)
+
+    # converts the recordings of this run and the ones left by earlier runs
+    transcoder = Transcoder(options["transcode_workers"])
+    if TranscodeQueue().pending():
+        transcoder.start()
+
     if options["record_stream"]:
         handle_record(
             options["target_url"],
@@ -62,8 +92,23 @@ def final_step(options, last_station, alias, handler):
             options["record_file"],
             options["record_file_format"],
             options["loglevel"],
+            transcoder,
+            current_station_uuid(handler, options["target_url"]),
+            station_codec(current_station(handler, options["target_url"])),
+            track_titles=options["track_titles"],
         )
 
+    zapper = handle_zapper(
+        handler,
+        alias,
+        options["curr_station_name"],
+        options["target_url"],
+        warm=options["warm"],
+    )
+
+    def switch(station, stream):
+        return switch_station(options, last_station, handler, station, stream)
+
     handle_listen_keypress(
         alias,
         target_url=options["target_url"],
@@ -73,7 +118,62 @@ def final_step(options, last_station, alias, handler):
         record_file=options["record_file"],
         record_file_format=options["record_file_format"],
         loglevel=options["loglevel"],
+        zapper=zapper,
+        switch=switch,
+        transcoder=transcoder,
+        station_uuid=current_station_uuid(handler, options["target_url"]),
+        station=current_station(handler, options["target_url"]),
+        tui=options["tui"],
+        track_titles=options["track_titles"],
+        progress=lambda: player.progress if player is not None else None,
+    )
+
+
+def current_station(handler, url):
+    """API record of the station picked from a list or by uuid, None for
+    stations played from a URL"""
+    station = handler.target_station
+    if station and url in (station.get("url"), station.get("url_resolved")):
+        return station
+    return None
+
+
+def current_station_uuid(handler, url):
+    """uuid of the station picked from a list or by uuid, for the recording
+    library. stations played from a URL have none"""
+    station = current_station(handler, url)
+    return (station.get("stationuuid") or "") if station else ""
+
+
+def switch_station(options, last_station, handler, station, stream=None):
+    """replaces the running player with the next/previous station, a warm
+    stream starts playing from its buffer"""
+    global player
+    if player is not None:
+        player.close()
+
+    options["curr_station_name"] = station["name"]
+    options["target_url"] = station["url"]
+    try:
+        player = Player(
+            options["target_url"],
+            options["volume"],
+            options["loglevel"],
+            station_name=options["curr_station_name"],
+            backend=get_backend(options["player"], options["pcm_output"]),
+            source=stream,
+        )
+    except PlayerError as e:
+        log.critical(str(e))
+        sys.exit(1)
+
+    if station.get("stationuuid"):
+        handler.vote_for_uuid(station["stationuuid"])
+    handle_save_last_station(
+        last_station, options["curr_station_name"], options["target_url"]
     )
+    handle_current_play_panel(options["curr_station_name"])
+    return options["curr_station_name"], options["target_url"]
 
 
 def main():
@@ -95,6 +195,9 @@ def main():
     options["discover_state"] = args.discover_state
     options["discover_language"] = args.discover_language
     options["discover_tag"] = args.discover_tag
+    options["discover_tags"] = args.discover_tags
+    options["discover_near"] = args.discover_near
+    options["radius"] = args.radius
 
     limit = args.limit
     options["limit"] = int(limit) if limit else 100
@@ -114,10 +217,55 @@ def main():
 
     options["target_url"] = ""
     options["volume"] = args.volume
+    options["prefetch"] = args.prefetch
+    options["player"] = args.player
+    options["pcm_output"] = args.pcm_output
+    if args.player == "pcm" and args.pcm_output in (None, "-"):
+        # the audio would be mixed with the tables, logs and status line
+        log.error("--player pcm needs --pcm-output with a file or FIFO")
+        sys.exit(1)
+    options["warm"] = args.warm
+    options["transcode_workers"] = args.transcode_workers
+    options["tui"] = not args.no_tui
+    options["track_titles"] = args.track_titles
 
     VERSION = app.get_version()
 
-    handler = Handler()
+    # for unattended players and recorders, the daemon included
+    if args.metrics_port:
+        serve_metrics(args.metrics_port, Sampler(args.sample_interval))
+
+    if args.daemon:
+        handle_log_level(args)
+        sys.exit(run_daemon(args.sample_interval))
+
+    session = build_session(
+        timeout=parse_timeout(args.timeout),
+        retries=args.retries,
+        pool_size=args.pool_size,
+        budget=args.budget,
+        cache_size=args.cache_size,
+    )
+
+    # cache commands work without reaching the API
+    if args.cache_command:
+        sys.exit(handle_cache_command(session, args.cache_command))
+
+    # so do the recording library commands
+    if args.library_scan is not None:
+        sys.exit(handle_library_scan(args.library_scan or None))
+    if args.library_usage:
+        sys.exit(handle_library_usage())
+    if args.library_filter is not None:
+        sys.exit(handle_library(args.library_filter, options["limit"]))
+
+    handler = Handler(session)
+    handler.rank_results = not args.no_rank
+
+    # machine readable output, nothing else is printed to stdout
+    if args.json_output:
+        sys.exit(handle_json_output(handler, options))
+
     alias = Alias()
     alias.generate_map()
     last_station = Last_station()
@@ -142,10 +290,24 @@ def main():
         kill_background_ffplays()
         sys.exit(0)
 
+    if args.transcode:
+        handle_transcode(options["transcode_workers"])
+        sys.exit(0)
+
+    if args.show_status:
+        handle_status(args.sample_interval)
+        sys.exit(0)
+
     if options["show_favorite_list"]:
         handle_favorite_table(alias)
         sys.exit(0)
 
+    if args.import_path:
+        sys.exit(handle_import(handler, alias, args.import_path))
+
+    if args.export_path:
+        sys.exit(handle_export(handler, alias, args.export_path))
+
     if options["add_station"]:
         handle_add_station(alias)
 
@@ -160,7 +322,9 @@ def main():
             (
                 options["curr_station_name"],
                 options["target_url"],
-            ) = handle_user_choice_from_search_result(handler, response)
+            ) = handle_user_choice_from_search_result(
+                handler, response, options["prefetch"]
+            )
             final_step(options, last_station, alias, handler)
         else:
             sys.exit(0)
@@ -174,7 +338,9 @@ def main():
             (
                 options["curr_station_name"],
                 options["target_url"],
-            ) = handle_user_choice_from_search_result(handler, response)
+            ) = handle_user_choice_from_search_result(
+                handler, response, options["prefetch"]
+            )
             final_step(options, last_station, alias, handler)
         else:
             sys.exit(0)
@@ -188,7 +354,9 @@ def main():
             (
                 options["curr_station_name"],
                 options["target_url"],
-            ) = handle_user_choice_from_search_result(handler, response)
+            ) = handle_user_choice_from_search_result(
+                handler, response, options["prefetch"]
+            )
             final_step(options, last_station, alias, handler)
         else:
             sys.exit(0)
@@ -200,7 +368,39 @@ def main():
             (
                 options["curr_station_name"],
                 options["target_url"],
-            ) = handle_user_choice_from_search_result(handler, response)
+            ) = handle_user_choice_from_search_result(
+                handler, response, options["prefetch"]
+            )
+            final_step(options, last_station, alias, handler)
+        else:
+            sys.exit(0)
+
+    # ----------- tag query ----------- #
+    if options["discover_tags"]:
+        response = handler.discover_by_tags(options["discover_tags"], options["limit"])
+        if response is not None:
+            (
+                options["curr_station_name"],
+                options["target_url"],
+            ) = handle_user_choice_from_search_result(
+                handler, response, options["prefetch"]
+            )
+            final_step(options, last_station, alias, handler)
+        else:
+            sys.exit(0)
+
+    # -------------- near ------------- #
+    if options["discover_near"]:
+        response = handler.discover_near(
+            options["discover_near"], options["radius"], options["limit"]
+        )
+        if response is not None:
+            (
+                options["curr_station_name"],
+                options["target_url"],
+            ) = handle_user_choice_from_search_result(
+                handler, response, options["prefetch"]
+            )
             final_step(options, last_station, alias, handler)
         else:
             sys.exit(0)
@@ -241,7 +441,9 @@ def main():
             (
                 options["curr_station_name"],
                 options["target_url"],
-            ) = handle_user_choice_from_search_result(handler, response)
+            ) = handle_user_choice_from_search_result(
+                handler, response, options["prefetch"]
+            )
             # options["codec"] = response["codec"]
             # print(response)
             final_step(options, last_station, alias, handler)
@@ -250,7 +452,7 @@ def main():
     # ------------------------- direct play ------------------------#
     if options["direct_play"] is not None:
         options["curr_station_name"], options["target_url"] = handle_direct_play(
-            alias, options["direct_play"]
+            alias, options["direct_play"], handler
         )
         final_step(options, last_station, alias, handler)
 
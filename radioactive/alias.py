@@ -70,6 +70,26 @@ class Alias:
                 log.info("Current station added to your favorite list")
             return True
 
+    def add_entries(self, entries):
+        """Adds many (name, uuid_or_url) pairs at once, skips the names that
+        are already in the fav list. returns the number of entries added"""
+        names = {alias["name"].strip() for alias in self.alias_map}
+        lines = []
+        for left, right in entries:
+            # "==" separates the fields and each entry is one line
+            left = " ".join(left.replace("==", "=").split())
+            right = right.strip()
+            if left == "" or right == "" or left in names:
+                log.debug("Skipping favorite: {}=={}".format(left, right))
+                continue
+            names.add(left)
+            self.alias_map.append({"name": left, "uuid_or_url": right})
+            lines.append("{}=={}\n".format(left, right))
+        if lines:
+            with open(self.alias_path, "a+") as f:
+                f.writelines(lines)
+        return len(lines)
+
     def flush(self):
         """deletes all the entries in the fav list"""
         try:
@@ -26,7 +26,7 @@ class App:
         """
 
         try:
-            remote_data = requests.get(self.pypi_api)
+            remote_data = requests.get(self.pypi_api, timeout=5)
             remote_data = remote_data.content.decode("utf8")
             remote_data = json.loads(remote_data)
             self.remote_version = remote_data["info"]["version"]
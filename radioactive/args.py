@@ -3,6 +3,14 @@ import sys
 
 from zenlog import log
 
+from radioactive.cache import DEFAULT_CACHE_SIZE
+from radioactive.player import BACKENDS, DEFAULT_BACKEND
+from radioactive.prefetch import DEFAULT_PREFETCH
+from radioactive.session import DEFAULT_BUDGET, DEFAULT_POOL_SIZE, DEFAULT_RETRIES
+from radioactive.telemetry import DEFAULT_SAMPLE_INTERVAL
+from radioactive.transcoder import DEFAULT_TRANSCODE_WORKERS
+from radioactive.zapper import DEFAULT_WARM
+
 
 class Parser:
 
@@ -84,6 +92,13 @@ class Parser:
             help="Discover stations with tag",
         )
 
+        self.parser.add_argument(
+            "--tags",
+            action="store",
+            dest="discover_tags",
+            help='Discover stations with a tag query: "jazz AND NOT smooth jazz"',
+        )
+
         self.parser.add_argument(
             "--state",
             action="store",
@@ -97,6 +112,23 @@ class Parser:
             dest="discover_language",
             help="Discover stations with state name",
         )
+
+        self.parser.add_argument(
+            "--near",
+            action="store",
+            dest="discover_near",
+            help="Discover stations close to a city, state, country or lat,lon",
+        )
+
+        self.parser.add_argument(
+            "--radius",
+            action="store",
+            dest="radius",
+            type=float,
+            default=None,
+            help="With --near, only stations within this many km",
+        )
+
         self.parser.add_argument(
             "--limit",
             "-L",
@@ -106,6 +138,14 @@ class Parser:
             help="Limit of entries in discover table",
         )
 
+        self.parser.add_argument(
+            "--no-rank",
+            action="store_true",
+            dest="no_rank",
+            default=False,
+            help="Show the results in API order, with the duplicates",
+        )
+
         self.parser.add_argument(
             "--add",
             "-A",
@@ -139,6 +179,48 @@ class Parser:
             help="Flush your favorite list",
         )
 
+        self.parser.add_argument(
+            "--import",
+            action="store",
+            dest="import_path",
+            help="Add the stations of an M3U, PLS or OPML file to your favorite list",
+        )
+
+        self.parser.add_argument(
+            "--export",
+            action="store",
+            dest="export_path",
+            help="Save your favorite list as an M3U, PLS or OPML file",
+        )
+
+        self.parser.add_argument(
+            "--library",
+            action="store",
+            nargs="?",
+            const="",
+            default=None,
+            dest="library_filter",
+            help="List your recordings, optionally those of a station or track",
+        )
+
+        self.parser.add_argument(
+            "--library-usage",
+            action="store_true",
+            default=False,
+            dest="library_usage",
+            help="Show the disk space your recordings take per station",
+        )
+
+        self.parser.add_argument(
+            "--library-scan",
+            action="store",
+            nargs="?",
+            const="",
+            default=None,
+            dest="library_scan",
+            help="Add the recordings of a directory to the library index",
+        )
+
         self.parser.add_argument(
             "--volume",
             "-V",
@@ -159,6 +241,49 @@ class Parser:
             help="kill all the ffplay process initiated by radioactive",
         )
 
+        self.parser.add_argument(
+            "--status",
+            action="store_true",
+            dest="show_status",
+            default=False,
+            help="show the radios and recordings started by radioactive",
+        )
+
+        self.parser.add_argument(
+            "--sample-interval",
+            action="store",
+            type=float,
+            dest="sample_interval",
+            default=DEFAULT_SAMPLE_INTERVAL,
+            help="seconds between resource samples of the children",
+        )
+
+        self.parser.add_argument(
+            "--player",
+            action="store",
+            dest="player",
+            choices=sorted(BACKENDS),
+            default=DEFAULT_BACKEND,
+            help="how to play: ffplay, null (decode only) or pcm (raw audio)",
+        )
+
+        self.parser.add_argument(
+            "--pcm-output",
+            action="store",
+            dest="pcm_output",
+            default=None,
+            help="file or FIFO for the pcm player",
+        )
+
+        self.parser.add_argument(
+            "--warm",
+            action="store",
+            type=int,
+            dest="warm",
+            default=DEFAULT_WARM,
+            help="neighbor stations kept buffered for next/previous",
+        )
+
         self.parser.add_argument(
             "--record",
             "-R",
@@ -191,7 +316,126 @@ class Parser:
             action="store",
             dest="record_file_format",
             default="mp3",
-            help="specify the audio format for recording. auto/mp3",
+            help="specify the audio format for recording. auto/mp3/opus",
+        )
+
+        self.parser.add_argument(
+            "--transcode",
+            action="store_true",
+            dest="transcode",
+            default=False,
+            help="convert the recordings waiting in the queue and exit",
+        )
+
+        self.parser.add_argument(
+            "--transcode-workers",
+            action="store",
+            type=int,
+            dest="transcode_workers",
+            default=DEFAULT_TRANSCODE_WORKERS,
+            help="recordings converted at the same time",
+        )
+
+        self.parser.add_argument(
+            "--timeout",
+            action="store",
+            dest="timeout",
+            default=None,
+            help="API timeouts in seconds. 'read' or 'connect,read'",
+        )
+
+        self.parser.add_argument(
+            "--retries",
+            action="store",
+            dest="retries",
+            default=DEFAULT_RETRIES,
+            type=int,
+            help="retry failed API calls this many times with backoff",
+        )
+
+        self.parser.add_argument(
+            "--pool-size",
+            action="store",
+            dest="pool_size",
+            default=DEFAULT_POOL_SIZE,
+            type=int,
+            help="number of keep-alive connections kept for the API",
+        )
+
+        self.parser.add_argument(
+            "--budget",
+            action="store",
+            dest="budget",
+            default=DEFAULT_BUDGET,
+            type=float,
+            help="total seconds the API calls may take in this run. 0 to disable",
+        )
+
+        self.parser.add_argument(
+            "--cache",
+            action="store",
+            dest="cache_command",
+            choices=["stats", "clear"],
+            help="show statistics of the API cache or clear it",
+        )
+
+        self.parser.add_argument(
+            "--cache-size",
+            action="store",
+            dest="cache_size",
+            default=DEFAULT_CACHE_SIZE,
+            type=int,
+            help="maximum size of the API cache in MB",
+        )
+
+        self.parser.add_argument(
+            "--prefetch",
+            action="store",
+            dest="prefetch",
+            default=DEFAULT_PREFETCH,
+            type=int,
+            help="probe the top N results while you pick one, 0 to disable",
+        )
+
+        self.parser.add_argument(
+            "--no-tui",
+            action="store_true",
+            dest="no_tui",
+            default=False,
+            help="read the commands line by line, without the status line",
+        )
+
+        self.parser.add_argument(
+            "--track-titles",
+            action="store_true",
+            dest="track_titles",
+            default=False,
+            help="read the track titles over a second connection to the stream",
+        )
+
+        self.parser.add_argument(
+            "--json",
+            action="store_true",
+            dest="json_output",
+            default=False,
+            help="print search/discover results as NDJSON and exit",
+        )
+
+        self.parser.add_argument(
+            "--metrics-port",
+            action="store",
+            dest="metrics_port",
+            default=None,
+            type=int,
+            help="serve OpenMetrics on http://127.0.0.1:PORT/metrics",
+        )
+
+        self.parser.add_argument(
+            "--daemon",
+            action="store_true",
+            dest="daemon",
+            default=False,
+            help="run as a daemon controlled with radioctl",
         )
 
     def parse(self):
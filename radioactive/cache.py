@@ -0,0 +1,220 @@
+""" HTTP cache policy for the radio-browser API.
+
+The cache lives in a stable XDG cache directory instead of the current working
+directory. Every endpoint gets its own expiry, the SQLite store runs in WAL mode
+so several radioactive processes can share it, and the total size is capped by
+evicting the least recently used responses. Access times and hit/miss
+counts are collected in memory and written in one transaction when the size
+is checked, at exit.
+"""
+
+import atexit
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+from requests_cache import DO_NOT_CACHE
+from zenlog import log
+
+DEFAULT_CACHE_SIZE = 50  # MB
+
+DEFAULT_EXPIRY = datetime.timedelta(days=1)
+
+# first matching pattern wins
+ENDPOINT_EXPIRY = {
+    # click counter must always reach the server
+    "*/json/url/": DO_NOT_CACHE,
+    # search results change quickly (votes, broken stations)
+    "*/json/stations/search": datetime.timedelta(hours=1),
+    "*/json/stations/byuuid": datetime.timedelta(days=1),
+    # these lists rarely change
+    "*/json/countries": datetime.timedelta(days=30),
+    "*/json/countrycodes": datetime.timedelta(days=30),
+    "*/json/states": datetime.timedelta(days=30),
+    "*/json/languages": datetime.timedelta(days=30),
+    "*/json/tags": datetime.timedelta(days=7),
+    "*/json/codecs": datetime.timedelta(days=30),
+}
+
+
+def cache_dir():
+    """returns (and creates) radioactive's cache directory"""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    path = os.path.join(base, "radioactive")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def cache_path():
+    return os.path.join(cache_dir(), "http_cache.sqlite")
+
+
+def human_size(size):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024 or unit == "GB":
+            return "{:.1f} {}".format(size, unit)
+        size /= 1024
+
+
+class CachePolicy:
+    """Keeps the access times and hit/miss counters of the HTTP cache
+    in its own tables next to the requests_cache responses. The connection
+    is shared by the threads of the session, it is only used under lock
+    """
+
+    def __init__(self, cache, max_size=DEFAULT_CACHE_SIZE):
+        self.cache = cache
+        self.max_size = max_size * 1024 * 1024
+        self.db_path = str(cache.responses.db_path)
+        self.table_name = cache.responses.table_name
+        self.connection = None
+        self.lock = threading.RLock()
+        # not written yet: counter name -> increment, key -> last used
+        self.counts = {}
+        self.accessed = {}
+
+        try:
+            self.connect()
+        except sqlite3.Error as e:
+            log.debug("Cache policy disabled: {}".format(e))
+            self.connection = None
+        atexit.register(self.enforce)
+
+    def connect(self):
+        self.connection = sqlite3.connect(
+            self.db_path, timeout=5, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS radioactive_access "
+            "(key TEXT PRIMARY KEY, last_used REAL)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS radioactive_stats "
+            "(name TEXT PRIMARY KEY, value INTEGER)"
+        )
+        self.connection.commit()
+
+    def record(self, response):
+        """called for every API response, cached or not. only counts in
+        memory, see flush()"""
+        if self.connection is None:
+            return
+        key = getattr(response, "cache_key", None)
+        counter = "hits" if getattr(response, "from_cache", False) else "misses"
+        with self.lock:
+            self.counts[counter] = self.counts.get(counter, 0) + 1
+            if key:
+                self.accessed[key] = time.time()
+
+    def touch(self, key):
+        """an access to a response that was stored without request()"""
+        if self.connection is None:
+            return
+        with self.lock:
+            self.accessed[key] = time.time()
+
+    def flush(self):
+        """writes the recorded accesses in one transaction"""
+        if self.connection is None:
+            return
+        with self.lock:
+            if not self.counts and not self.accessed:
+                return
+            counts, self.counts = self.counts, {}
+            accessed, self.accessed = self.accessed, {}
+            try:
+                with self.connection:
+                    self.connection.executemany(
+                        "INSERT INTO radioactive_stats VALUES (?, ?) "
+                        "ON CONFLICT(name) DO UPDATE SET value = value + ?",
+                        [(name, n, n) for name, n in counts.items()],
+                    )
+                    self.connection.executemany(
+                        "INSERT OR REPLACE INTO radioactive_access VALUES (?, ?)",
+                        list(accessed.items()),
+                    )
+            except sqlite3.Error as e:
+                log.debug("Could not record cache access: {}".format(e))
+
+    def size(self):
+        """total bytes of the cached responses"""
+        row = self.connection.execute(
+            "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM {}".format(self.table_name)
+        ).fetchone()
+        return row[0]
+
+    def enforce(self):
+        """evicts least recently used responses until the cache fits its cap"""
+        self.flush()
+        if self.connection is None or not self.max_size:
+            return
+        with self.lock:
+            self.shrink()
+
+    def shrink(self):
+        try:
+            size = self.size()
+            if size <= self.max_size:
+                return
+            rows = self.connection.execute(
+                "SELECT r.key, LENGTH(r.value) FROM {} r "
+                "LEFT JOIN radioactive_access a ON a.key = r.key "
+                "ORDER BY COALESCE(a.last_used, 0)".format(self.table_name)
+            ).fetchall()
+        except sqlite3.Error as e:
+            log.debug("Could not check cache size: {}".format(e))
+            return
+
+        evict = []
+        for key, length in rows:
+            if size <= self.max_size:
+                break
+            evict.append(key)
+            size -= length or 0
+
+        log.debug("Cache: evicting {} responses".format(len(evict)))
+        self.cache.delete(*evict)
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM radioactive_access WHERE key = ?",
+                [(key,) for key in evict],
+            )
+
+    def stats(self):
+        self.flush()
+        with self.lock:
+            counters = dict(
+                self.connection.execute("SELECT name, value FROM radioactive_stats")
+            )
+            size = self.size()
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        total = hits + misses
+        disk = 0
+        for suffix in ["", "-wal", "-shm"]:
+            path = self.db_path + suffix
+            if os.path.exists(path):
+                disk += os.path.getsize(path)
+        return {
+            "path": self.db_path,
+            "entries": len(self.cache.responses),
+            "size": size,
+            "disk": disk,
+            "max_size": self.max_size,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": (hits / total * 100) if total else 0.0,
+        }
+
+    def clear(self):
+        self.cache.clear()
+        with self.lock:
+            self.counts, self.accessed = {}, {}
+            with self.connection:
+                self.connection.execute("DELETE FROM radioactive_access")
+                self.connection.execute("DELETE FROM radioactive_stats")
@@ -0,0 +1,178 @@
+""" Background click counter reporting.
+
+Playing a station registers a click on radio-browser to increase its popularity.
+The clicks are queued here and sent from a daemon thread so they never delay
+the playback. Clicks that could not be sent yet are saved to a hidden file and
+flushed in batches on a later run. The file is shared by every radioactive
+process: it is rewritten under a lock and replaced in one step, from the
+sender thread only.
+"""
+
+import atexit
+import json
+import os.path
+import queue
+import threading
+
+from zenlog import log
+
+from radioactive.registry import file_lock
+
+
+class ClickReporter:
+    def __init__(self, API, batch_size=20):
+        self.API = API
+        self.batch_size = batch_size
+        self.pending = []  # ordered and without duplicates
+        self.reported = set()  # clicks sent during this run
+        self.queued = set()  # clicks this process queued or claimed
+        self.flush_requested = False
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.worker = None
+
+        self.clicks_path = os.path.join(
+            os.path.expanduser("~"), ".radio-active-clicks"
+        )
+        self.lock_path = self.clicks_path + ".lock"
+        self.load()
+        atexit.register(self.save)
+
+    def load(self):
+        """loads the clicks left over from a previous run"""
+        with file_lock(self.lock_path):
+            pending = self.read()
+        for uuid in pending:
+            if uuid not in self.pending:
+                self.pending.append(uuid)
+
+    def read(self):
+        """the clicks in the file, callers hold the file lock"""
+        try:
+            with open(self.clicks_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except Exception as e:
+            log.debug("Could not read pending clicks: {}".format(e))
+            return []
+
+    def save(self):
+        """persists the clicks which are not confirmed by the server yet.
+        the file is merged with what other processes saved meanwhile: their
+        clicks are kept, the ones they sent are dropped"""
+        try:
+            with file_lock(self.lock_path):
+                on_disk = self.read()
+                with self.lock:
+                    pending = [u for u in on_disk if u not in self.reported]
+                    # loaded at start but gone from the file: sent by another run
+                    self.pending = [
+                        u for u in self.pending if u in on_disk or u in self.queued
+                    ]
+                    pending += [u for u in self.pending if u not in pending]
+                self.write(pending)
+        except Exception as e:
+            log.debug("Could not save pending clicks: {}".format(e))
+
+    def write(self, pending):
+        """replaces the file, callers hold the file lock"""
+        if pending:
+            tmp_path = self.clicks_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(pending, f)
+            os.replace(tmp_path, self.clicks_path)
+        elif os.path.exists(self.clicks_path):
+            os.remove(self.clicks_path)
+
+    def claim(self):
+        """takes the clicks left in the file by earlier runs. they are removed
+        from it before they are sent, so two processes never send the same
+        click. save() writes back the ones that could not be sent"""
+        try:
+            with file_lock(self.lock_path):
+                on_disk = self.read()
+                with self.lock:
+                    claimed = [u for u in on_disk if u not in self.reported]
+                    self.pending = [u for u in self.pending if u in self.queued]
+                    self.pending += [u for u in claimed if u not in self.pending]
+                    self.queued.update(claimed)
+                self.write([])
+        except Exception as e:
+            log.debug("Could not claim pending clicks: {}".format(e))
+            return []
+        return claimed
+
+    def report(self, uuid):
+        """queues a click for the station, duplicates are dropped"""
+        if not uuid:
+            return
+        with self.lock:
+            if uuid in self.reported or uuid in self.pending:
+                log.debug("Click already queued for: {}".format(uuid))
+                return
+            self.pending.append(uuid)
+            self.queued.add(uuid)
+        # saved by the sender thread, the file lock must not delay the playback
+        self.queue.put(uuid)
+        self.start()
+
+    def flush_pending(self):
+        """sends the clicks left over from previous runs in the background"""
+        with self.lock:
+            if not self.pending:
+                return
+            self.flush_requested = True
+        self.start()
+
+    def start(self):
+        if self.worker is not None and self.worker.is_alive():
+            return
+        self.worker = threading.Thread(target=self.run, name="click-reporter")
+        self.worker.daemon = True
+        self.worker.start()
+
+    def next_batch(self):
+        batch = [self.queue.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def send(self, uuid):
+        session = self.API.client._session
+        if hasattr(session, "background"):
+            # nobody waits for the clicks, keep them out of the latency budget
+            with session.background():
+                return self.API.click_counter(uuid)
+        return self.API.click_counter(uuid)
+
+    def run(self):
+        if self.flush_requested:
+            self.flush_requested = False
+            claimed = self.claim()
+            log.debug("Flushing {} pending clicks".format(len(claimed)))
+            for uuid in claimed:
+                self.queue.put(uuid)
+        while True:
+            batch = self.next_batch()
+            # the new clicks are on disk before they are sent
+            self.save()
+            for uuid in batch:
+                if uuid in self.reported:
+                    continue
+                try:
+                    self.send(uuid)
+                except Exception as e:
+                    # network is down, keep the rest for a later run
+                    log.debug("Could not send click count: {}".format(e))
+                    self.save()
+                    return
+                with self.lock:
+                    self.reported.add(uuid)
+                    if uuid in self.pending:
+                        self.pending.remove(uuid)
+                log.debug("Click registered for: {}".format(uuid))
+            self.save()
@@ -0,0 +1,290 @@
+""" Async library API of radioactive.
+
+    >>> import asyncio
+    >>> from radioactive.client import RadioClient
+    >>> async def main():
+    ...     async with RadioClient() as client:
+    ...         stations = await client.search("BBC Radio 1", limit=5)
+    ...         playback = await client.play(stations[0])
+    ...         await asyncio.sleep(10)
+    ...         await playback.stop()
+    >>> asyncio.run(main())
+
+Nothing here calls sys.exit, prints or reads from the terminal. Failures are
+raised as radioactive.errors exceptions. The API calls and the writes to the
+registry, library and queue files (which take file locks) run on a thread
+pool sharing one pooled session, and ffplay/ffmpeg are asyncio subprocesses,
+so many calls can run concurrently from one event loop.
+"""
+
+import asyncio
+import os.path
+from concurrent.futures import ThreadPoolExecutor
+from shutil import which
+
+from radioactive.errors import PlayerError, RecordError, StationNotFound
+from radioactive.handler import Handler
+from radioactive.library import Library, RecordingMonitor
+from radioactive.metrics import FIRST_AUDIO, RECORDED_BYTES, STREAM_CONNECTS
+from radioactive.player import DEFAULT_BACKEND, PCMBackend, get_backend
+from radioactive.progress import Progress, follow_async
+from radioactive.recorder import record_command
+from radioactive.registry import Registry
+from radioactive.session import DEFAULT_POOL_SIZE, build_session
+from radioactive.station import Station
+from radioactive.transcoder import TARGET_FORMATS, TranscodeQueue
+
+
+class Playback:
+    """A running ffplay/ffmpeg child started by the client"""
+
+    def __init__(self, process, station, progress=None):
+        self.process = process
+        self.station = station
+        # transport statistics read from the stderr of the child
+        self.progress = progress or Progress()
+        self.reader = None
+        if process.stderr is not None:
+            self.reader = asyncio.ensure_future(
+                follow_async(process.stderr, self.progress, process.pid)
+            )
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    @property
+    def running(self):
+        return self.process.returncode is None
+
+    async def wait(self):
+        """waits for the child to exit and returns its exit code"""
+        returncode = await self.process.wait()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, Registry().unregister, self.pid)
+        return returncode
+
+    async def stop(self, timeout=5):
+        if not self.running:
+            return await self.wait()
+        self.process.terminate()
+        try:
+            return await asyncio.wait_for(self.wait(), timeout)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            return await self.wait()
+
+
+class Recording(Playback):
+    def __init__(
+        self, process, station, path, convert_to=None, progress=None, monitor=None
+    ):
+        super().__init__(process, station, progress)
+        self.path = path
+        self.convert_to = convert_to
+        self.queued = False
+        # keeps the library index up to date, see radioactive.library
+        self.monitor = monitor
+
+    @property
+    def target(self):
+        """the final file, after the conversion when one was asked for"""
+        if self.convert_to is None:
+            return self.path
+        return "{}.{}".format(os.path.splitext(self.path)[0], self.convert_to)
+
+    async def wait(self):
+        """waits for the capture to end, a conversion is then queued for the
+        transcoder pool (see radioactive.transcoder)"""
+        returncode = await super().wait()
+        # ffmpeg ends the file properly on 'q' and on SIGTERM alike
+        captured = os.path.exists(self.path) and os.path.getsize(self.path) > 0
+        loop = asyncio.get_running_loop()
+        if self.monitor is not None:
+            monitor, self.monitor = self.monitor, None
+            await loop.run_in_executor(None, monitor.stop, captured)
+        if captured and self.convert_to and not self.queued:
+            self.queued = True
+            await loop.run_in_executor(
+                None, TranscodeQueue().add, self.path, self.target, self.convert_to
+            )
+        return returncode
+
+    async def stop(self, timeout=5):
+        # 'q' lets ffmpeg finalize the file, terminate is the fallback
+        if self.running and self.process.stdin is not None:
+            try:
+                self.process.stdin.write(b"q")
+                await self.process.stdin.drain()
+                return await asyncio.wait_for(self.wait(), timeout)
+            except (asyncio.TimeoutError, ConnectionError):
+                pass
+        return await super().stop(timeout)
+
+
+class RadioClient:
+    def __init__(self, session=None, max_workers=DEFAULT_POOL_SIZE):
+        self.session = session
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.handler = None
+        self.handler_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, lambda: func(*args, **kwargs)
+        )
+
+    async def get_handler(self):
+        if self.handler is not None:
+            return self.handler
+        if self.handler_lock is None:
+            self.handler_lock = asyncio.Lock()
+        async with self.handler_lock:
+            if self.handler is None:
+                # a long running service has no use for a per run budget
+                session = self.session or build_session(
+                    budget=0, pool_size=self.max_workers
+                )
+                self.handler = await self.run(Handler, session)
+        return self.handler
+
+    # ------------------------------ lookups ------------------------------ #
+    async def find(self, limit=100, **params):
+        """searches with any pyradios search parameter, returns [Station]"""
+        handler = await self.get_handler()
+        records = await self.run(handler.find_stations, limit=limit, **params)
+        return [Station.from_api(record) for record in records]
+
+    async def search(self, name, limit=100):
+        return await self.find(name=name, name_exact=False, limit=limit)
+
+    async def discover(
+        self, country=None, state=None, language=None, tag=None, limit=100
+    ):
+        params = {}
+        if country:
+            if len(country.strip()) == 2:
+                params["countrycode"] = country.strip()
+            else:
+                handler = await self.get_handler()
+                params["countrycode"] = await self.run(
+                    handler.find_country_code, country
+                )
+                params["country_exact"] = True
+        if state:
+            params["state"] = state
+        if language:
+            params["language"] = language
+        if tag:
+            params["tag"] = tag
+        if not params:
+            raise ValueError("discover needs a country, state, language or tag")
+        return await self.find(limit=limit, **params)
+
+    async def station(self, uuid):
+        handler = await self.get_handler()
+        return Station.from_api(await self.run(handler.find_station, uuid))
+
+    async def resolve(self, target):
+        """turns a Station, a stream url or a station uuid into a Station"""
+        if isinstance(target, Station):
+            return target
+        if "://" in target:
+            return Station.from_url(target)
+        return await self.station(target)
+
+    async def vote(self, station):
+        handler = await self.get_handler()
+        await self.run(handler.vote_for_uuid, station.uuid)
+
+    # ------------------------- playback / record ------------------------- #
+    async def play(self, target, volume=80, backend=DEFAULT_BACKEND):
+        """plays with a player backend name or PlayerBackend (ffplay, null
+        or pcm), the stdout of a pcm child is the Playback's process.stdout
+        when it has no output file"""
+        station = await self.resolve(target)
+        if isinstance(backend, str):
+            backend = get_backend(backend)
+        exe_path = which(backend.program)
+        if exe_path is None:
+            raise PlayerError(
+                "{} not found, install it first please".format(backend.program)
+            )
+        if not station.stream_url:
+            raise StationNotFound("station has no stream url")
+
+        command = backend.command(exe_path, station.stream_url, volume, "error")
+        to_pipe = isinstance(backend, PCMBackend) and backend.output == "-"
+        progress = Progress(first_audio=FIRST_AUDIO.labels(backend.name))
+        STREAM_CONNECTS.labels("player").inc()
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE if to_pipe else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        await self.run(
+            Registry().register,
+            process.pid,
+            backend.name,
+            station=station.name,
+            url=station.stream_url,
+        )
+        if station.uuid:
+            await self.vote(station)
+        return Playback(process, station, progress)
+
+    async def record(self, target, output_file, convert_to=None, track_titles=False):
+        """captures a stream as it is into output_file, whose extension must
+        suit the stream codec. with convert_to (mp3/opus) a conversion is
+        queued when the capture ends. track_titles indexes the titles of the
+        tracks over a second connection to the stream"""
+        station = await self.resolve(target)
+        if which("ffmpeg") is None:
+            raise RecordError("FFmpeg not found, install it first please")
+        if convert_to is not None and convert_to not in TARGET_FORMATS:
+            raise RecordError("can not convert to {}".format(convert_to))
+
+        command = record_command(station.stream_url, output_file, "error")
+        command.insert(1, "-y")  # nobody can answer the overwrite prompt
+        progress = Progress(written=RECORDED_BYTES.labels())
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        await self.run(
+            Registry().register,
+            process.pid,
+            "ffmpeg",
+            station=station.name,
+            url=station.stream_url,
+            path=output_file,
+        )
+        monitor = await self.run(
+            self.monitor_recording, station, output_file, progress, track_titles
+        )
+        return Recording(process, station, output_file, convert_to, progress, monitor)
+
+    def monitor_recording(self, station, output_file, progress, track_titles=False):
+        """adds the recording to the library index, which then follows it"""
+        library = Library()
+        recording = library.start(
+            output_file, station.name, station.uuid, station.stream_url, station.codec
+        )
+        title_url = station.stream_url if track_titles else None
+        return RecordingMonitor(
+            library, recording, output_file, title_url, progress
+        ).start()
+
+    async def close(self):
+        self.executor.shutdown(wait=False)
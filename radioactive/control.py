@@ -0,0 +1,131 @@
+""" Thin client for the radioactive daemon (radio --daemon).
+
+It only imports the standard library, so a command costs a few milliseconds:
+
+    radioctl play <uuid or url>     radioctl record [uuid or url]
+    radioctl stop                   radioctl search <name>
+    radioctl status                 radioctl shutdown
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+CHILD_FORMAT = "{:>7}  {:<6}  {:<8}  cpu {:>5.1f}%  rss {:>6.1f} MB  in {:>6.1f} KB/s"
+
+
+def socket_path():
+    """where the daemon listens, private to the user"""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, "radioactive.sock")
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "radioactive", "daemon.sock")
+
+
+def send_command(command, timeout=30, **args):
+    """sends one command to the daemon and returns its decoded reply"""
+    request = json.dumps({"command": command, "args": args}) + "\n"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path())
+        sock.sendall(request.encode("utf-8"))
+        reply = b""
+        while not reply.endswith(b"\n"):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            reply += chunk
+    return json.loads(reply.decode("utf-8"))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="radioctl", description="Control a running radioactive daemon"
+    )
+    commands = parser.add_subparsers(dest="command")
+
+    play = commands.add_parser("play", help="play a station uuid or stream url")
+    play.add_argument("target")
+    play.add_argument("--volume", "-V", type=int, default=80)
+    play.add_argument("--player", choices=["ffplay", "null"], default="ffplay")
+
+    commands.add_parser("stop", help="stop playback and recordings")
+
+    record = commands.add_parser("record", help="record a station")
+    record.add_argument("target", nargs="?", help="default: the playing station")
+    record.add_argument("--filepath", dest="path", default="")
+    record.add_argument(
+        "--convert",
+        dest="convert_to",
+        choices=["mp3", "opus"],
+        help="convert the recording after the capture",
+    )
+
+    search = commands.add_parser("search", help="search stations by name")
+    search.add_argument("name")
+    search.add_argument("--limit", "-L", type=int, default=20)
+
+    commands.add_parser("status", help="show what the daemon is doing")
+    commands.add_parser("shutdown", help="stop the daemon")
+    return parser, parser.parse_args(argv)
+
+
+def print_reply(command, result):
+    if command == "search":
+        for index, station in enumerate(result, start=1):
+            print("{:>3}  {}  {}".format(index, station["stationuuid"], station["name"]))
+    elif command == "status":
+        playing = result.get("playing")
+        if playing:
+            print("playing: {} ({})".format(playing["name"], playing["url"]))
+        else:
+            print("playing: nothing")
+        for recording in result.get("recordings", []):
+            print("recording: {} -> {}".format(recording["name"], recording["path"]))
+        for child in result.get("children", []):
+            print(
+                CHILD_FORMAT.format(
+                    child["pid"],
+                    child["kind"],
+                    child["status"],
+                    child["cpu_percent"],
+                    child["rss"] / 1048576,
+                    child["read_rate"] / 1024,
+                )
+            )
+    elif result:
+        print(json.dumps(result, indent=2))
+
+
+def main(argv=None):
+    parser, args = parse_args(sys.argv[1:] if argv is None else argv)
+    if not args.command:
+        parser.print_help()
+        return 1
+
+    command_args = {
+        key: value for key, value in vars(args).items() if key != "command"
+    }
+    try:
+        reply = send_command(args.command, **command_args)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print("radioactive daemon is not running, start it with: radio --daemon")
+        return 1
+    except (OSError, ValueError) as e:
+        print("Could not talk to the daemon: {}".format(e))
+        return 1
+
+    if not reply.get("ok"):
+        print("Error: {}".format(reply.get("error")))
+        return 1
+    print_reply(args.command, reply.get("result"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
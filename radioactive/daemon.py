@@ -0,0 +1,221 @@
+""" Long running radioactive daemon.
+
+It keeps the API session, the caches and the player state warm and takes
+commands (play, stop, record, search, status, shutdown) as JSON lines over
+a Unix domain socket. radioctl (radioactive.control) is its thin client.
+"""
+
+import asyncio
+import json
+import os
+import signal
+import socket
+import time
+
+from zenlog import log
+
+from radioactive.client import RadioClient
+from radioactive.control import socket_path
+from radioactive.errors import RadioactiveError
+from radioactive.recorder import recording_name
+from radioactive.telemetry import DEFAULT_SAMPLE_INTERVAL, Sampler
+from radioactive.transcoder import Transcoder, capture_extension
+
+
+def recording_path(station, path, convert_to):
+    """picks the capture file like handle_record does, returns it and the
+    format to convert it to afterwards (None when the codec already fits)"""
+    if not path:
+        path = os.path.join(os.path.expanduser("~"), "Music/radioactive")
+    os.makedirs(path, exist_ok=True)
+
+    extension = capture_extension(station.codec)
+    if convert_to == extension:
+        convert_to = None
+    file_name = "{}.{}".format(recording_name(station.name), extension)
+    return os.path.join(path, file_name), convert_to
+
+
+def station_info(station):
+    return {
+        "name": station.name,
+        "stationuuid": station.uuid,
+        "url": station.stream_url,
+        "codec": station.codec,
+        "bitrate": station.bitrate,
+    }
+
+
+class Daemon:
+    def __init__(self, path=None, sample_interval=DEFAULT_SAMPLE_INTERVAL):
+        self.path = path or socket_path()
+        self.client = RadioClient()
+        self.sampler = Sampler(sample_interval)
+        self.transcoder = Transcoder()
+        self.playback = None
+        self.recordings = []
+        self.started = time.time()
+        self.server = None
+        self.stopped = None
+
+    # ------------------------------ commands ------------------------------ #
+    async def do_play(self, target, volume=80, player="ffplay"):
+        if player == "pcm":
+            # nobody reads the stdout of the daemon
+            raise RadioactiveError("the daemon can not use the pcm player")
+        station = await self.client.resolve(target)
+        await self.stop_playback()
+        self.playback = await self.client.play(station, volume=volume, backend=player)
+        log.info("Playing: {}".format(station.name))
+        return station_info(station)
+
+    async def do_stop(self):
+        await self.stop_playback()
+        for recording in self.recordings:
+            await recording.stop()
+        self.recordings = []
+        self.transcoder.wakeup.set()
+        return None
+
+    async def do_record(self, target=None, path="", convert_to=None):
+        if target:
+            station = await self.client.resolve(target)
+        elif self.playback is not None and self.playback.running:
+            station = self.playback.station
+        else:
+            raise RadioactiveError("nothing is playing, give a station to record")
+
+        output_file, convert_to = recording_path(station, path, convert_to)
+        recording = await self.client.record(station, output_file, convert_to)
+        self.recordings.append(recording)
+        log.info("Recording: {} -> {}".format(station.name, recording.target))
+        return dict(station_info(station), path=recording.target)
+
+    async def do_search(self, name, limit=20):
+        stations = await self.client.search(name, limit=limit)
+        return [station.to_dict() for station in stations]
+
+    async def do_status(self):
+        for recording in self.recordings:
+            if not recording.running:
+                await recording.wait()  # queues its conversion
+        self.recordings = [r for r in self.recordings if r.running]
+        playing = None
+        if self.playback is not None and self.playback.running:
+            playing = dict(
+                station_info(self.playback.station),
+                pid=self.playback.pid,
+                progress=self.playback.progress.to_dict(),
+            )
+        return {
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started, 1),
+            "playing": playing,
+            "recordings": [
+                dict(
+                    station_info(r.station),
+                    path=r.target,
+                    pid=r.pid,
+                    progress=r.progress.to_dict(),
+                )
+                for r in self.recordings
+            ],
+            "children": self.sampler.snapshot(),
+        }
+
+    async def do_shutdown(self):
+        self.stopped.set()
+        return None
+
+    async def stop_playback(self):
+        if self.playback is not None:
+            await self.playback.stop()
+            self.playback = None
+
+    # ------------------------------ transport ----------------------------- #
+    async def handle_connection(self, reader, writer):
+        try:
+            line = await reader.readline()
+            reply = await self.dispatch(line)
+            writer.write((json.dumps(reply) + "\n").encode("utf-8"))
+            await writer.drain()
+        except Exception as e:
+            log.debug("Daemon connection error: {}".format(e))
+        finally:
+            writer.close()
+
+    async def dispatch(self, line):
+        try:
+            request = json.loads(line.decode("utf-8"))
+            command = request["command"]
+            handler = getattr(self, "do_" + command, None)
+            if handler is None:
+                return {"ok": False, "error": "unknown command: {}".format(command)}
+            result = await handler(**request.get("args", {}))
+            return {"ok": True, "result": result}
+        except (RadioactiveError, ValueError, KeyError, TypeError) as e:
+            return {"ok": False, "error": str(e)}
+        except Exception as e:
+            # a failed spawn, registry or library, the client still gets a reply
+            log.error("Daemon command failed: {}".format(e))
+            return {"ok": False, "error": "{}: {}".format(type(e).__name__, e)}
+
+    def remove_stale_socket(self):
+        """removes the socket of a daemon that died, refuses to start twice"""
+        if not os.path.exists(self.path):
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(self.path)
+            except OSError:
+                os.remove(self.path)
+                return
+        raise RadioactiveError("a daemon is already listening on " + self.path)
+
+    async def serve(self):
+        self.stopped = asyncio.Event()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.remove_stale_socket()
+
+        old_umask = os.umask(0o077)  # the socket is private to the user
+        try:
+            self.server = await asyncio.start_unix_server(
+                self.handle_connection, path=self.path
+            )
+        finally:
+            os.umask(old_umask)
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stopped.set)
+
+        log.info("radioactive daemon listening on {}".format(self.path))
+        self.sampler.start()
+        self.transcoder.start()
+        # warm the API session up before the first command arrives
+        await self.client.get_handler()
+        try:
+            await self.stopped.wait()
+        finally:
+            self.server.close()
+            await self.server.wait_closed()
+            await self.do_stop()
+            self.sampler.stop()
+            self.transcoder.stop()
+            await self.client.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            log.info("radioactive daemon stopped")
+
+
+def run_daemon(sample_interval=DEFAULT_SAMPLE_INTERVAL):
+    """runs the daemon in the foreground, returns the exit code"""
+    if not hasattr(socket, "AF_UNIX"):
+        log.error("The daemon needs Unix domain sockets")
+        return 1
+    try:
+        asyncio.run(Daemon(sample_interval=sample_interval).serve())
+    except RadioactiveError as e:
+        log.error(str(e))
+        return 1
+    return 0
@@ -0,0 +1,30 @@
+""" Exceptions raised by radioactive's library API.
+The CLI catches them, logs a message and exits """
+
+
+class RadioactiveError(Exception):
+    """Base class for all the errors raised by radioactive"""
+
+
+class APIError(RadioactiveError):
+    """radio-browser could not be reached or returned an error"""
+
+
+class StationNotFound(RadioactiveError):
+    """no station matched the uuid, name or filter"""
+
+
+class PlayerError(RadioactiveError):
+    """the player (ffplay) is missing or could not be started"""
+
+
+class RecordError(RadioactiveError):
+    """the recorder (ffmpeg) is missing or could not be started"""
+
+
+class PlaylistError(RadioactiveError):
+    """a playlist file could not be read, parsed or written"""
+
+
+class QueryError(RadioactiveError):
+    """a tag query could not be parsed"""
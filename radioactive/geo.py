@@ -0,0 +1,280 @@
+""" Nearby station discovery.
+
+radio-browser stores a position (geo_lat, geo_long) for many stations but can
+only filter by country, state, language or tag. To find the stations around a
+point, the positions of the whole catalog are downloaded once and kept in a
+k-d tree in the cache directory. The tree is rebuilt in the background when it
+gets older than a week, so a query never waits for the network.
+
+The points are placed on a unit sphere (x, y, z) before they go into the tree:
+the straight distance between two of them grows with the distance along the
+surface, and the date line or the poles need no special handling.
+"""
+
+import heapq
+import json
+import math
+import os
+import os.path
+import time
+from array import array
+
+from zenlog import log
+
+from radioactive.cache import cache_dir
+
+EARTH_RADIUS_KM = 6371.0
+INDEX_MAX_AGE = 7 * 24 * 60 * 60
+INDEX_VERSION = 1
+# radio-browser lists ~50k stations, those without a position are skipped
+CATALOG_LIMIT = 100000
+
+
+def index_path():
+    return os.path.join(cache_dir(), "geo_index.json")
+
+
+def to_xyz(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    return (
+        math.cos(lat) * math.cos(lon),
+        math.cos(lat) * math.sin(lon),
+        math.sin(lat),
+    )
+
+
+def to_lat_lon(x, y, z):
+    return (
+        math.degrees(math.atan2(z, math.hypot(x, y))),
+        math.degrees(math.atan2(y, x)),
+    )
+
+
+def chord_to_km(chord):
+    """the distance along the surface for a straight distance on the sphere"""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def km_to_chord(km):
+    if km >= math.pi * EARTH_RADIUS_KM:
+        return 2.0
+    return 2 * math.sin(km / (2 * EARTH_RADIUS_KM))
+
+
+def parse_point(text):
+    """(lat, lon) of a "52.52,13.40" string, None when it is not one"""
+    parts = text.replace(";", ",").split(",")
+    if len(parts) != 2:
+        return None
+    try:
+        lat, lon = float(parts[0]), float(parts[1])
+    except ValueError:
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def position(station):
+    """(lat, lon) of a station record, None when it has no usable one"""
+    try:
+        lat, lon = float(station["geo_lat"]), float(station["geo_long"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    # 0,0 is what a missing position often turns into
+    if (lat == 0 and lon == 0) or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+class GeoIndex:
+    """A k-d tree over the station positions.
+
+    The tree has no nodes: the points are stored in an order where the middle
+    point of every range splits the rest of that range on the axis of its
+    depth (x, y, z, x ...), the left half below it and the right half above.
+    """
+
+    def __init__(self, uuids=(), lats=(), lons=(), states=(), countrycodes=()):
+        self.uuids = list(uuids)
+        self.lats = array("d", lats)
+        self.lons = array("d", lons)
+        self.states = list(states)
+        self.countrycodes = list(countrycodes)
+        self.built = time.time()
+        self.xyz = (array("d"), array("d"), array("d"))
+        for lat, lon in zip(self.lats, self.lons):
+            for axis, value in zip(self.xyz, to_xyz(lat, lon)):
+                axis.append(value)
+
+    def __len__(self):
+        return len(self.uuids)
+
+    @classmethod
+    def from_stations(cls, stations):
+        """builds the tree from station records, those without a position are
+        left out"""
+        points = []
+        for station in stations:
+            point = position(station)
+            if point is None:
+                continue
+            points.append(
+                (
+                    station["stationuuid"],
+                    point,
+                    station.get("state") or "",
+                    (station.get("countrycode") or "").upper(),
+                )
+            )
+        xyz = [to_xyz(*point[1]) for point in points]
+
+        order = list(range(len(points)))
+        ranges = [(0, len(order), 0)]
+        while ranges:
+            lo, hi, depth = ranges.pop()
+            if hi - lo < 2:
+                continue
+            axis = depth % 3
+            order[lo:hi] = sorted(order[lo:hi], key=lambda i: xyz[i][axis])
+            mid = (lo + hi) // 2
+            ranges.append((lo, mid, depth + 1))
+            ranges.append((mid + 1, hi, depth + 1))
+
+        points = [points[i] for i in order]
+        return cls(
+            [point[0] for point in points],
+            [point[1][0] for point in points],
+            [point[1][1] for point in points],
+            [point[2] for point in points],
+            [point[3] for point in points],
+        )
+
+    # --------------------------------- files -------------------------------- #
+    @classmethod
+    def load(cls, path=None):
+        """the saved index, None when there is none (or it can not be read)"""
+        try:
+            with open(path or index_path(), "r") as f:
+                data = json.load(f)
+            if data.get("version") != INDEX_VERSION:
+                return None
+            index = cls(
+                data["uuids"],
+                data["lats"],
+                data["lons"],
+                data["states"],
+                data["countrycodes"],
+            )
+            index.built = data["built"]
+            return index
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.debug("Could not read the geo index: {}".format(e))
+            return None
+
+    def save(self, path=None):
+        path = path or index_path()
+        data = {
+            "version": INDEX_VERSION,
+            "built": self.built,
+            "uuids": self.uuids,
+            "lats": list(self.lats),
+            "lons": list(self.lons),
+            "states": self.states,
+            "countrycodes": self.countrycodes,
+        }
+        try:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            log.debug("Could not save the geo index: {}".format(e))
+
+    def is_stale(self, max_age=INDEX_MAX_AGE):
+        return time.time() - self.built > max_age
+
+    # -------------------------------- queries ------------------------------- #
+    def nearest(self, lat, lon, limit=100, radius=None):
+        """the stations closest to a point, nearest first, as a list of
+        (uuid, distance in km). radius (km) drops the ones farther away"""
+        if limit <= 0 or not self.uuids:
+            return []
+        target = to_xyz(lat, lon)
+        xs, ys, zs = self.xyz
+        axes = self.xyz
+        # squared straight distance, nothing farther is wanted
+        max_d2 = km_to_chord(radius) ** 2 if radius is not None else 4.0
+        # max-heap of the best points found so far, as (-d2, index)
+        best = []
+
+        def bound():
+            if len(best) < limit:
+                return max_d2
+            return -best[0][0]
+
+        def search(lo, hi, depth):
+            if lo >= hi:
+                return
+            mid = (lo + hi) // 2
+            d2 = (
+                (xs[mid] - target[0]) ** 2
+                + (ys[mid] - target[1]) ** 2
+                + (zs[mid] - target[2]) ** 2
+            )
+            if d2 <= bound():
+                if len(best) < limit:
+                    heapq.heappush(best, (-d2, mid))
+                else:
+                    heapq.heapreplace(best, (-d2, mid))
+            axis = depth % 3
+            diff = target[axis] - axes[axis][mid]
+            if diff < 0:
+                near, far = (lo, mid), (mid + 1, hi)
+            else:
+                near, far = (mid + 1, hi), (lo, mid)
+            search(near[0], near[1], depth + 1)
+            # the other side can only hold closer points when the splitting
+            # plane is closer than the worst point kept
+            if diff * diff <= bound():
+                search(far[0], far[1], depth + 1)
+
+        search(0, len(self.uuids), 0)
+        return [
+            (self.uuids[index], chord_to_km(math.sqrt(-neg_d2)))
+            for neg_d2, index in sorted(best, reverse=True)
+        ]
+
+    def locate(self, place):
+        """(lat, lon) of a "lat,lon" point or of a place the stations are in:
+        a state (or city) name or a country code. None when it is unknown.
+        a place is put at the middle of its stations"""
+        point = parse_point(place)
+        if point is not None:
+            return point
+        place = place.strip().casefold()
+        matches = [
+            i for i, state in enumerate(self.states) if state.casefold() == place
+        ]
+        if not matches and len(place) == 2:
+            code = place.upper()
+            matches = [i for i, cc in enumerate(self.countrycodes) if cc == code]
+        if not matches:
+            return None
+        # the median keeps a few misplaced stations from moving the center
+        xs, ys, zs = self.xyz
+        return to_lat_lon(
+            median(xs[i] for i in matches),
+            median(ys[i] for i in matches),
+            median(zs[i] for i in matches),
+        )
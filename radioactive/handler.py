@@ -2,18 +2,46 @@
     This handler solely depends on pyradios module to communicate with our remote API
 """
 
-import datetime
 import json
+import logging
+import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-import requests_cache
 from pyradios import RadioBrowser
+from pyradios.base_url import pick_base_url
+from pyradios.radios import Request
+from pyradios.utils import radio_browser_adapter
 from rich.console import Console
 from rich.table import Table
 from zenlog import log
 
+from radioactive.cache import cache_dir
+from radioactive.clicks import ClickReporter
+from radioactive.errors import (APIError, QueryError, RadioactiveError,
+                                StationNotFound)
+from radioactive.geo import CATALOG_LIMIT, GeoIndex
+from radioactive.jsonstream import iter_array
+from radioactive.ranking import StationColumns
+from radioactive.station import Station
+from radioactive.session import build_session
+from radioactive.station_store import SNAPSHOT_MAX_AGE, StationStore
+from radioactive.tags import TagIndex, journal
+
 console = Console()
 
+# pyradios logs a traceback when the servers can not be looked up (offline)
+logging.getLogger("pyradios").setLevel(logging.CRITICAL)
+
+# how long to stick to the same API server, cached responses are keyed by it
+SERVER_PIN_SECONDS = 7 * 24 * 60 * 60
+
+# uuids looked up per byuuid request, keeps the URL well under server limits
+UUID_BATCH_SIZE = 100
+UUID_BATCH_WORKERS = 4
+
 
 def trim_string(text, max_length=40):
     if len(text) > max_length:
@@ -22,35 +50,412 @@ def trim_string(text, max_length=40):
         return text
 
 
+def get_base_url():
+    """returns the pinned API server, picks a new one when the pin is old.
+    an old pin is still used when no server can be looked up (offline)
+    RADIOACTIVE_API_URL overrides it, e.g. for a local mock server
+    """
+    base_url = os.environ.get("RADIOACTIVE_API_URL")
+    if base_url:
+        log.debug("API server: {} (from RADIOACTIVE_API_URL)".format(base_url))
+        return base_url.rstrip("/") + "/"
+
+    server_path = os.path.join(cache_dir(), "server")
+    try:
+        if time.time() - os.path.getmtime(server_path) < SERVER_PIN_SECONDS:
+            with open(server_path, "r") as f:
+                base_url = f.read().strip()
+            if base_url:
+                log.debug("API server: {} (pinned)".format(base_url))
+                return base_url
+    except OSError:
+        pass
+
+    try:
+        base_url = pick_base_url()
+    except Exception:
+        if not os.path.exists(server_path):
+            raise
+        with open(server_path, "r") as f:
+            base_url = f.read().strip()
+        log.debug("API server: {} (offline, old pin)".format(base_url))
+        return base_url
+
+    try:
+        with open(server_path, "w") as f:
+            f.write(base_url)
+    except OSError as e:
+        log.debug("Could not pin the API server: {}".format(e))
+    log.debug("API server: {}".format(base_url))
+    return base_url
+
+
+class API(RadioBrowser):
+    """RadioBrowser bound to a fixed server instead of a random one per run"""
+
+    def __init__(self, session, base_url):
+        self.base_url = base_url
+        self._fmt = "json"
+        self.client = Request(headers=self.headers, session=session)
+
+
 class Handler:
     """
     radio-browser API handler. This module communicates with the underlying API via PyRadios
     """
 
-    def __init__(self):
+    def __init__(self, session=None):
         self.API = None
         self.response = None
         self.target_station = None
+        # the result list the station was picked from, for next/previous
+        self.results = []
+        self.result_index = 0
+        self.offline = False
+        # stations seen in API results during this run, by uuid
+        self.seen_stations = {}
+        self.stations = StationStore()
+        self.snapshots_refreshed = False
+        # indexes of the whole station list for --near and --tags,
+        # loaded on first use
+        self.geo = None
+        self.tags = None
+        self.catalog_refreshing = False
+        # dedupe and rank the result tables
+        self.rank_results = True
+        # one pooled session is shared by every API call in this run
+        self.session = session
+        if self.session is None:
+            self.session = build_session()
 
         # When RadioBrowser can not be initiated properly due to no internet (probably)
+        # keep going, cached results and known stream URLs can still be played
         try:
-            expire_after = datetime.timedelta(days=3)
-            session = requests_cache.CachedSession(
-                cache_name="cache", backend="sqlite", expire_after=expire_after
-            )
-            self.API = RadioBrowser(session=session)
+            self.API = API(self.session, get_base_url())
         except Exception as e:
             log.debug("Error: {}".format(e))
-            log.critical("Something is wrong with your internet connection")
-            sys.exit(1)
+            log.warning("Could not reach radio-browser, working offline")
+            self.offline = True
+
+        self.clicks = ClickReporter(self.API)
+        if not self.offline:
+            self.clicks.flush_pending()
+
+    def call_api(self, method, *args, **kwargs):
+        """calls a pyradios method, warns when the answer is a stale cached one"""
+        if self.API is None:
+            raise ConnectionError("radio-browser is unreachable")
+
+        stale_count = getattr(self.session, "stale_count", 0)
+        result = getattr(self.API, method)(*args, **kwargs)
+        if getattr(self.session, "stale_count", 0) > stale_count:
+            log.warning("radio-browser is unreachable, showing cached (stale) results")
+
+        if isinstance(result, list):
+            # compact records, a large result list is several times smaller
+            result = [
+                Station.from_api(station)
+                if isinstance(station, dict) and "stationuuid" in station
+                else station
+                for station in result
+            ]
+            for station in result:
+                if isinstance(station, Station):
+                    self.seen_stations[station.uuid] = station
+        return result
+
+    def stream_search(self, cache=True, **kwargs):
+        """same as API.search, but yields the station records while the
+        response is still downloading. cache=False for the big downloads"""
+        if self.API is None:
+            raise ConnectionError("radio-browser is unreachable")
+        if "tag" in kwargs:
+            kwargs["tag"] = kwargs["tag"].lower()
+        params = radio_browser_adapter(**kwargs)
+        url = self.API.build_url("json/stations/search")
+
+        if hasattr(self.session, "iter_body"):
+            stale_count = self.session.stale_count
+            chunks = self.session.iter_body(
+                url, params=params, headers=self.API.headers, cache=cache
+            )
+            yield from iter_array(chunks)
+            for _ in chunks:
+                pass  # the body is cached once it has been read to the end
+            if self.session.stale_count > stale_count:
+                log.warning(
+                    "radio-browser is unreachable, showing cached (stale) results"
+                )
+            return
+
+        response = self.session.get(
+            url, headers=self.API.headers, params=params, stream=True
+        )
+        with response:
+            response.raise_for_status()
+            yield from iter_array(response.iter_content(chunk_size=16384))
+
+    def iter_stations(self, **params):
+        """yields the stations of a search as Station records, parsed one by
+        one while the response downloads"""
+        found = []
+        for record in self.stream_search(**params):
+            station = Station.from_api(record)
+            self.seen_stations[station.uuid] = station
+            found.append(station)
+            yield station
+        self.index_tags(found)
 
     def get_country_code(self, name):
-        self.countries = self.API.countries()
+        self.countries = self.call_api("countries")
         for country in self.countries:
             if country["name"].lower() == name.lower():
                 return country["iso_3166_1"]
         return None
 
+    # ------------- core lookups, these raise instead of exiting ------------- #
+    def find_stations(self, **params):
+        """searches the API with pyradios search parameters"""
+        try:
+            return list(self.iter_stations(**params))
+        except Exception as e:
+            raise APIError("station search failed: {}".format(e)) from e
+
+    def find_results(self, **params):
+        """find_stations for the result tables, deduplicated and ranked
+        unless ranking is turned off (--no-rank). the ranking columns are
+        filled while the response downloads"""
+        if not self.rank_results:
+            return self.find_stations(**params)
+        columns = StationColumns()
+        started = time.perf_counter()
+        try:
+            for station in self.iter_stations(**params):
+                columns.add(station)
+        except Exception as e:
+            raise APIError("station search failed: {}".format(e)) from e
+        ranked = columns.ranked()
+        log.debug(
+            "Ranked {} stations, {} duplicates dropped, {:.1f}ms".format(
+                len(columns),
+                len(columns) - len(ranked),
+                (time.perf_counter() - started) * 1000,
+            )
+        )
+        return ranked
+
+    def find_country_code(self, name):
+        try:
+            code = self.get_country_code(name)
+        except Exception as e:
+            raise APIError("country lookup failed: {}".format(e)) from e
+        if code is None:
+            raise StationNotFound("not a valid country name: {}".format(name))
+        return code
+
+    def find_station(self, uuid):
+        """returns the station record of a uuid, or its last known record
+        when the API can not be reached"""
+        try:
+            result = self.call_api("station_by_uuid", uuid)
+        except Exception as e:
+            station = self.seen_stations.get(uuid) or self.stations.get(uuid)
+            if station is None:
+                raise APIError("station lookup failed: {}".format(e)) from e
+            log.warning(
+                "radio-browser is unreachable, playing the last known stream URL"
+            )
+            return station
+
+        if not result:
+            raise StationNotFound("no station with the uuid: {}".format(uuid))
+        self.stations.remember(result[0])
+        return result[0]
+
+    def find_stations_by_uuids(self, uuids):
+        """looks many stations up with a few multi-uuid requests, returns a
+        dict of uuid -> station record. unknown uuids are left out"""
+        if self.API is None:
+            raise APIError("radio-browser is unreachable")
+        uuids = list(dict.fromkeys(u.strip() for u in uuids if u.strip()))
+        batches = [
+            uuids[i : i + UUID_BATCH_SIZE]
+            for i in range(0, len(uuids), UUID_BATCH_SIZE)
+        ]
+        url = self.API.build_url("json/stations/byuuid")
+
+        def lookup(batch):
+            params = {"uuids": ",".join(batch)}
+            if hasattr(self.session, "background"):
+                with self.session.background():
+                    response = self.session.get(
+                        url, headers=self.API.headers, params=params
+                    )
+            else:
+                response = self.session.get(
+                    url, headers=self.API.headers, params=params
+                )
+            response.raise_for_status()
+            return response.json()
+
+        found = {}
+        workers = max(1, min(UUID_BATCH_WORKERS, len(batches)))
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for result in executor.map(lookup, batches):
+                    for station in result:
+                        found[station["stationuuid"]] = Station.from_api(station)
+        except Exception as e:
+            raise APIError("station lookup failed: {}".format(e)) from e
+
+        log.debug(
+            "Resolved {} of {} uuids in {} requests".format(
+                len(found), len(uuids), len(batches)
+            )
+        )
+        self.seen_stations.update(found)
+        self.index_tags(found.values())
+        for uuid in self.stations.remember_many(found.values()):
+            log.debug("Station {} has a new stream URL".format(uuid))
+        return found
+
+    def find_favorite(self, uuid):
+        """a favorite plays from its last snapshot without asking the API,
+        refresh_snapshots() keeps the snapshots up to date"""
+        snapshot = self.stations.get(uuid)
+        if snapshot and snapshot.get("url"):
+            log.debug("Favorite {} from its snapshot".format(uuid))
+            return snapshot
+        return self.find_station(uuid)
+
+    def refresh_snapshots(self, uuids, max_age=SNAPSHOT_MAX_AGE):
+        """looks the stale snapshots up again from a background thread,
+        at most once per run"""
+        if self.offline or self.snapshots_refreshed:
+            return None
+        self.snapshots_refreshed = True
+        uuids = self.stations.stale(uuids, max_age)
+        if not uuids:
+            return None
+
+        def refresh():
+            try:
+                self.find_stations_by_uuids(uuids)
+            except RadioactiveError as e:
+                log.debug("Could not refresh favorites: {}".format(e))
+
+        thread = threading.Thread(target=refresh)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def build_catalog_indexes(self):
+        """downloads the whole station list once, builds the k-d tree of the
+        station positions and the tag index from it and saves both"""
+        started = time.perf_counter()
+        tags = TagIndex()
+
+        def index_tags(stations):
+            for station in stations:
+                tags.update([station])
+                yield station
+
+        try:
+            # tens of MB, read once a week, not worth a place in the cache
+            stations = self.stream_search(
+                cache=False, hidebroken=True, limit=CATALOG_LIMIT
+            )
+            geo = GeoIndex.from_stations(index_tags(stations))
+        except Exception as e:
+            raise APIError("could not download the station list: {}".format(e)) from e
+        geo.save()
+        tags.save()
+        log.debug(
+            "Indexed {} stations ({} with a position, {} tags) in {:.0f}ms".format(
+                len(tags),
+                len(geo),
+                len(tags.postings),
+                (time.perf_counter() - started) * 1000,
+            )
+        )
+        return geo, tags
+
+    def catalog_indexes(self):
+        """the geo and tag indexes of the whole station list. they are built
+        on first use, ones older than a week are still used while new ones
+        are built in the background"""
+        if self.geo is None or self.tags is None:
+            self.geo, self.tags = GeoIndex.load(), TagIndex.load()
+        if self.geo is None or self.tags is None:
+            if self.API is None:
+                raise APIError("radio-browser is unreachable")
+            log.info("Downloading the station list, this is done once a week")
+            self.geo, self.tags = self.build_catalog_indexes()
+        elif (
+            (self.geo.is_stale() or self.tags.is_stale())
+            and self.API is not None
+            and not self.catalog_refreshing
+        ):
+            self.catalog_refreshing = True
+
+            def rebuild():
+                try:
+                    self.geo, self.tags = self.build_catalog_indexes()
+                except RadioactiveError as e:
+                    log.debug("Could not rebuild the station indexes: {}".format(e))
+
+            thread = threading.Thread(target=rebuild)
+            thread.daemon = True
+            thread.start()
+        return self.geo, self.tags
+
+    def index_tags(self, stations):
+        """keeps the tag index up to date with the stations seen in a search,
+        only the ones whose tags or votes changed go to the journal"""
+        if self.tags is None:
+            # nothing to compare with (and to journal) before a first build
+            self.tags = TagIndex.load()
+        if self.tags is not None:
+            journal(self.tags.update(stations))
+
+    def find_nearby(self, place, radius=None, limit=100):
+        """the stations closest to a place, nearest first, as a list of
+        (station, distance in km). place is "lat,lon", a state or city,
+        a country code or a country name. radius (km) is optional"""
+        index = self.catalog_indexes()[0]
+        point = index.locate(place)
+        if point is None and len(place.strip()) > 2:
+            try:
+                point = index.locate(self.find_country_code(place.strip()))
+            except RadioactiveError as e:
+                log.debug("Error: {}".format(e))
+        if point is None:
+            raise StationNotFound("unknown place: {}".format(place))
+
+        started = time.perf_counter()
+        nearest = index.nearest(point[0], point[1], limit, radius)
+        log.debug(
+            "{} stations near {:.3f},{:.3f} found in {:.2f}ms".format(
+                len(nearest), point[0], point[1], (time.perf_counter() - started) * 1000
+            )
+        )
+        stations = self.find_stations_by_uuids([uuid for uuid, _ in nearest])
+        # stations deleted since the index was built are left out
+        return [(stations[uuid], km) for uuid, km in nearest if uuid in stations]
+
+    def find_stream(self, uuid):
+        """name and stream url of a station, for stations played from a list"""
+        if hasattr(self.session, "background"):
+            with self.session.background():
+                station = self.find_station(uuid)
+        else:
+            station = self.find_station(uuid)
+        return {
+            "name": station["name"],
+            "url": station.get("url_resolved") or station["url"],
+            "stationuuid": uuid,
+        }
+
     def station_validator(self):
         """Validates a response from the API and takes appropriate decision"""
 
@@ -92,10 +497,10 @@ class Handler:
         # when exactly one response found
         if len(self.response) == 1:
             log.info("Station found: {}".format(self.response[0]["name"].strip()))
-            log.debug(json.dumps(self.response[0], indent=3))
+            log.debug(json.dumps(dict(self.response[0]), indent=3))
             self.target_station = self.response[0]
             # register a valid click to increase its popularity
-            self.API.click_counter(self.target_station["stationuuid"])
+            self.vote_for_uuid(self.target_station["stationuuid"])
 
             return self.response
             # return self.response[0]["name"].strip()
@@ -104,23 +509,25 @@ class Handler:
     def search_by_station_name(self, _name=None, limit=100):
         """search and play a station by its name"""
         try:
-            self.response = self.API.search(name=_name, name_exact=False, limit=limit)
-            return self.station_validator()
-        except Exception as e:
+            self.response = self.find_results(name=_name, name_exact=False, limit=limit)
+        except RadioactiveError as e:
             log.debug("Error: {}".format(e))
             log.error("Something went wrong. please try again.")
             sys.exit(1)
+        return self.station_validator()
 
     # ------------------------- UUID ------------------------ #
     def play_by_station_uuid(self, _uuid):
         """search and play station by its stationuuid"""
         try:
-            self.response = self.API.station_by_uuid(_uuid)
-            return self.station_validator()  # should return a station name also
-        except Exception as e:
+            self.response = [self.find_station(_uuid)]
+        except StationNotFound:
+            self.response = []
+        except RadioactiveError as e:
             log.debug("Error: {}".format(e))
             log.error("Something went wrong. please try again.")
             sys.exit(1)
+        return self.station_validator()  # should return a station name also
 
     # -------------------------- COUNTRY ----------------------#
     def discover_by_country(self, country_code_or_name, limit):
@@ -129,29 +536,28 @@ class Handler:
             # it's a code
             log.debug("Country code {} provided".format(country_code_or_name))
             try:
-                response = self.API.search(
+                response = self.find_results(
                     countrycode=country_code_or_name, limit=limit
                 )
-            except Exception as e:
+            except RadioactiveError as e:
                 log.debug("Error: {}".format(e))
                 log.error("Something went wrong. please try again.")
                 sys.exit(1)
         else:
             # it's name
             log.debug("Country name {} provided".format(country_code_or_name))
-            code = self.get_country_code(country_code_or_name)
-            if code:
-                try:
-                    response = self.API.search(
-                        countrycode=code, limit=limit, country_exact=True
-                    )
-                except Exception as e:
-                    log.debug("Error: {}".format(e))
-                    log.error("Something went wrong. please try again.")
-                    sys.exit(1)
-            else:
+            try:
+                code = self.find_country_code(country_code_or_name)
+                response = self.find_results(
+                    countrycode=code, limit=limit, country_exact=True
+                )
+            except StationNotFound:
                 log.error("Not a valid country name")
                 sys.exit(1)
+            except RadioactiveError as e:
+                log.debug("Error: {}".format(e))
+                log.error("Something went wrong. please try again.")
+                sys.exit(1)
 
         if len(response) > 1:
             log.info("Result for country: {}".format(response[0]["country"]))
@@ -188,8 +594,8 @@ class Handler:
 
     def discover_by_state(self, state, limit):
         try:
-            discover_result = self.API.search(state=state, limit=limit)
-        except Exception:
+            discover_result = self.find_results(state=state, limit=limit)
+        except RadioactiveError:
             log.error("Something went wrong. please try again.")
             sys.exit(1)
 
@@ -226,8 +632,8 @@ class Handler:
 
     def discover_by_language(self, language, limit):
         try:
-            discover_result = self.API.search(language=language, limit=limit)
-        except Exception as e:
+            discover_result = self.find_results(language=language, limit=limit)
+        except RadioactiveError as e:
             log.debug("Error: {}".format(e))
             log.error("Something went wrong. please try again.")
             sys.exit(1)
@@ -263,8 +669,8 @@ class Handler:
 
     def discover_by_tag(self, tag, limit):
         try:
-            discover_result = self.API.search(tag=tag, limit=limit)
-        except Exception as e:
+            discover_result = self.find_results(tag=tag, limit=limit)
+        except RadioactiveError as e:
             log.debug("Error: {}".format(e))
             log.error("Something went wrong. please try again.")
             sys.exit(1)
@@ -296,10 +702,103 @@ class Handler:
             log.error("No stations found for the tag, recheck it")
             sys.exit(1)
 
+    # ------------------ tag query -------------------- #
+
+    def find_by_tags(self, query, limit=100):
+        """the stations matching a boolean tag query such as
+        "jazz AND NOT smooth jazz", answered from the local tag index, most
+        voted first"""
+        index = self.catalog_indexes()[1]
+        started = time.perf_counter()
+        uuids = index.query(query, limit)
+        log.debug(
+            "Tag query {!r}: {} stations in {:.2f}ms".format(
+                query, len(uuids), (time.perf_counter() - started) * 1000
+            )
+        )
+        stations = self.find_stations_by_uuids(uuids)
+        return [stations[uuid] for uuid in uuids if uuid in stations]
+
+    def discover_by_tags(self, query, limit):
+        try:
+            discover_result = self.find_by_tags(query, limit)
+        except QueryError as e:
+            log.error("Invalid tag query: {}".format(e))
+            sys.exit(1)
+        except RadioactiveError as e:
+            log.debug("Error: {}".format(e))
+            log.error("Something went wrong. please try again.")
+            sys.exit(1)
+
+        if len(discover_result) > 0:
+            table = Table(show_header=True, header_style="bold magenta")
+            table.add_column("ID", justify="center")
+            table.add_column("Station", justify="left")
+            table.add_column("Tags", justify="center")
+            table.add_column("Country", justify="center")
+
+            for i in range(0, len(discover_result)):
+                res = discover_result[i]
+                table.add_row(
+                    str(i + 1),
+                    trim_string(res["name"], max_length=30),
+                    trim_string(res["tags"], max_length=30),
+                    trim_string(res["country"], max_length=20),
+                )
+            console.print(table)
+            log.info(
+                "If the table does not fit into your screen, \
+                \ntry to maximize the window , decrease the font by a bit and retry"
+            )
+            return discover_result
+        else:
+            log.error("No stations found for the tag query, recheck it")
+            sys.exit(1)
+
+    # -------------------- near ---------------------- #
+
+    def discover_near(self, place, radius, limit):
+        try:
+            nearby = self.find_nearby(place, radius, limit)
+        except StationNotFound:
+            log.error("Unknown place, use a city, state, country or lat,lon")
+            sys.exit(1)
+        except RadioactiveError as e:
+            log.debug("Error: {}".format(e))
+            log.error("Something went wrong. please try again.")
+            sys.exit(1)
+
+        if len(nearby) > 0:
+            table = Table(show_header=True, header_style="bold magenta")
+            table.add_column("ID", justify="center")
+            table.add_column("Station", justify="left")
+            table.add_column("Distance", justify="right")
+            table.add_column("Country", justify="center")
+            table.add_column("Tags", justify="center")
+
+            for i in range(0, len(nearby)):
+                res, km = nearby[i]
+                table.add_row(
+                    str(i + 1),
+                    trim_string(res["name"], max_length=30),
+                    "{:.0f} km".format(km),
+                    trim_string(res["country"], max_length=20),
+                    trim_string(res["tags"], max_length=20),
+                )
+            console.print(table)
+            log.info(
+                "If the table does not fit into your screen, \
+                \ntry to maximize the window , decrease the font by a bit and retry"
+            )
+            return [station for station, _ in nearby]
+        else:
+            log.error("No stations found near the place, try a bigger radius")
+            sys.exit(1)
+
     # ---- increase click count ------------- #
     def vote_for_uuid(self, UUID):
+        """queues a click for the station, it is sent in the background"""
         try:
-            result = self.API.click_counter(UUID)
-            return result
+            self.clicks.report(UUID)
         except Exception as e:
             log.debug("Something went wrong during increasing click count:{}".format(e))
@@ -75,18 +75,42 @@ def show_help():
         "",
     )
 
+    table.add_row(
+        "--tags",
+        'Discover stations by a tag query: "rock AND NOT metal"',
+        "",
+    )
+
     table.add_row(
         "--language",
         "Discover stations by language",
         "",
     )
 
+    table.add_row(
+        "--near",
+        "Discover stations close to a place or lat,lon",
+        "",
+    )
+
+    table.add_row(
+        "--radius",
+        "With --near, only stations within this many km",
+        "",
+    )
+
     table.add_row(
         "--limit, -L",
         "Limit the number of station results",
         "100",
     )
 
+    table.add_row(
+        "--no-rank",
+        "Show results in API order, duplicates included",
+        "False",
+    )
+
     table.add_row(
         "--volume, -V",
         "Volume of the radio between 0 and 100",
@@ -98,6 +122,16 @@ def show_help():
         "Clear your favorite list",
         "False",
     )
+    table.add_row(
+        "--import",
+        "Add the stations of an M3U/PLS/OPML file to your favorite list",
+        "",
+    )
+    table.add_row(
+        "--export",
+        "Save your favorite list as an M3U/PLS/OPML file",
+        "",
+    )
     table.add_row(
         "--record, -R",
         "Record current stations audio",
@@ -117,16 +151,149 @@ def show_help():
     )
     table.add_row(
         "--filetype, -T",
-        "Type/codec of target recording. (mp3/auto)",
+        "Type/codec of target recording. (mp3/opus/auto)",
         "mp3",
     )
 
+    table.add_row(
+        "--transcode",
+        "Convert the recordings waiting in the queue and exit",
+        "False",
+    )
+
+    table.add_row(
+        "--transcode-workers",
+        "Recordings converted at the same time",
+        "2",
+    )
+
+    table.add_row(
+        "--library",
+        "List recordings, optionally of a station or track title",
+        "",
+    )
+
+    table.add_row(
+        "--library-usage",
+        "Disk space taken by the recordings per station",
+        "False",
+    )
+
+    table.add_row(
+        "--library-scan",
+        "Index the recordings of a directory (default ~/Music/radioactive)",
+        "",
+    )
+
     table.add_row(
         "--kill, -K",
         "Stop background radios",
         "False",
     )
 
+    table.add_row(
+        "--status",
+        "Show radios and recordings started by radioactive",
+        "False",
+    )
+
+    table.add_row(
+        "--player",
+        "Player backend: ffplay, null (decode only) or pcm (raw audio)",
+        "ffplay",
+    )
+
+    table.add_row(
+        "--pcm-output",
+        "File or FIFO for the pcm player, required with --player pcm",
+        "None",
+    )
+
+    table.add_row(
+        "--warm",
+        "Neighbor stations kept buffered for n/p (next/previous)",
+        "2",
+    )
+
+    table.add_row(
+        "--no-tui",
+        "Line by line commands, no live status line",
+        "False",
+    )
+
+    table.add_row(
+        "--track-titles",
+        "Show and index track titles. Opens a 2nd stream connection: twice "
+        "the bandwidth, one more listener for the station",
+        "False",
+    )
+
+    table.add_row(
+        "--sample-interval",
+        "Seconds between CPU/memory/IO samples of the children",
+        "1",
+    )
+
+    table.add_row(
+        "--timeout",
+        "API timeouts in seconds, 'read' or 'connect,read'",
+        "5,10",
+    )
+
+    table.add_row(
+        "--retries",
+        "Retry failed API calls with backoff",
+        "3",
+    )
+
+    table.add_row(
+        "--pool-size",
+        "Keep-alive connections kept for the API",
+        "10",
+    )
+
+    table.add_row(
+        "--budget",
+        "Total seconds API calls may take in a run (0 = no limit)",
+        "30",
+    )
+
+    table.add_row(
+        "--cache",
+        "Show API cache statistics or clear it (stats/clear)",
+        "",
+    )
+
+    table.add_row(
+        "--cache-size",
+        "Maximum size of the API cache in MB",
+        "50",
+    )
+
+    table.add_row(
+        "--prefetch",
+        "Probe the streams of the top N results while you pick one (0 = off)",
+        "5",
+    )
+
+    table.add_row(
+        "--json",
+        "Print search/discover results as NDJSON (one station per line)",
+        "False",
+    )
+
+    table.add_row(
+        "--daemon",
+        "Run in the background, control it with 'radioctl'",
+        "False",
+    )
+
+    table.add_row(
+        "--metrics-port",
+        "Serve OpenMetrics on http://127.0.0.1:PORT/metrics",
+        "",
+    )
+
     console.print(table)
     print(
         "For more details : https://github.com/deep5050/radio-active/blob/main/README.md"
@@ -0,0 +1,48 @@
+""" Incremental parser for the JSON arrays returned by the radio-browser API.
+
+The items of the top level array are yielded as soon as they are complete,
+so the whole body never has to be held in memory at once.
+"""
+
+import codecs
+import json
+
+WHITESPACE = " \t\r\n"
+
+
+def iter_array(chunks):
+    """yields the items of a JSON array read from an iterable of byte chunks"""
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buffer = ""
+    started = False
+
+    for chunk in chunks:
+        buffer += text_decoder.decode(chunk)
+        pos = 0
+        length = len(buffer)
+        while True:
+            while pos < length and buffer[pos] in WHITESPACE:
+                pos += 1
+            if pos >= length:
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("response is not a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ",":
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                item, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break  # item is incomplete, wait for more data
+            yield item
+        buffer = buffer[pos:]
+
+    if buffer.strip():
+        raise ValueError("truncated JSON array")
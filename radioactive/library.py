@@ -0,0 +1,414 @@
+""" Index of the recordings.
+
+Every recording gets a row in a small SQLite database (a hidden file under the
+user's home directory) when it starts: station, uuid, stream URL, start time,
+codec and file. While ffmpeg writes, a monitor thread keeps its size and
+duration up to date. With --track-titles a second connection to the stream
+collects the track titles (ICY StreamTitle) with their offset into the
+recording; it downloads the audio again and counts as one more listener. Listing, searching and the disk usage report read the database,
+no recording file is opened or probed for them.
+
+Files recorded before the index existed, or moved and deleted by hand, are
+picked up by `radio --library-scan`, which stats every file once.
+"""
+
+import datetime
+import os
+import os.path
+import re
+import sqlite3
+import threading
+import time
+
+import requests
+from zenlog import log
+
+from radioactive.metrics import STREAM_CONNECTS, STREAM_FAILURES
+
+PROGRESS_INTERVAL = 5
+ICY_TIMEOUT = (5, 30)
+
+# <station>-<day>-<MON>-<year>@<hour>-<minute>-<second>-<AM/PM>.<ext>
+RECORDING_NAME = re.compile(
+    r"^(?P<station>.+)-(?P<started>\d{2}-[A-Za-z]{3}-\d{4}@\d{2}-\d{2}-\d{2}-[AP]M)$"
+)
+STARTED_FORMAT = "%d-%b-%Y@%I-%M-%S-%p"
+AUDIO_EXTENSIONS = (".mp3", ".aac", ".opus", ".ogg", ".flac", ".mka", ".m4a")
+STREAM_TITLE = re.compile(rb"StreamTitle='(.*?)';", re.S)
+
+
+def default_library_path():
+    return os.path.join(os.path.expanduser("~"), ".radio-active-library.db")
+
+
+def default_recordings_dir():
+    return os.path.join(os.path.expanduser("~"), "Music/radioactive")
+
+
+def parse_recording_name(path):
+    """(station, start time) from the file name handle_record gives to a
+    recording, None for other names"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    match = RECORDING_NAME.match(stem)
+    if match is None:
+        return None
+    try:
+        started = datetime.datetime.strptime(match.group("started"), STARTED_FORMAT)
+    except ValueError:
+        return None
+    return match.group("station").replace("-", " "), started.timestamp()
+
+
+class Library:
+
+    """The recordings and their track titles. One connection is shared by the
+    threads of a run, the database runs in WAL mode so several radioactive
+    processes can record at the same time
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_library_path()
+        self.lock = threading.Lock()
+        self.connection = None
+        try:
+            self.connect()
+        except sqlite3.Error as e:
+            log.debug("Recording library disabled: {}".format(e))
+            self.connection = None
+
+    def connect(self):
+        self.connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS recordings ("
+            "id INTEGER PRIMARY KEY, path TEXT UNIQUE, station TEXT, uuid TEXT, "
+            "url TEXT, started REAL, duration REAL, codec TEXT, format TEXT, "
+            "size INTEGER, status TEXT)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            "recording INTEGER REFERENCES recordings(id) ON DELETE CASCADE, "
+            "offset REAL, title TEXT)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS recordings_started ON recordings(started)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS recordings_station ON recordings(station)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS tracks_recording ON tracks(recording)"
+        )
+        self.connection.commit()
+
+    def execute(self, sql, params=()):
+        """runs a statement in its own transaction. the library must never
+        break a recording, errors are only logged"""
+        if self.connection is None:
+            return None
+        try:
+            with self.lock, self.connection:
+                return self.connection.execute(sql, params)
+        except sqlite3.Error as e:
+            log.debug("Recording library: {}".format(e))
+            return None
+
+    def select(self, sql, params=()):
+        if self.connection is None:
+            return []
+        try:
+            with self.lock:
+                return [dict(row) for row in self.connection.execute(sql, params)]
+        except sqlite3.Error as e:
+            log.debug("Recording library: {}".format(e))
+            return []
+
+    # ------------------------------- recorder ------------------------------- #
+    def start(self, path, station, uuid="", url="", codec="", started=None):
+        """adds a recording that is being written, returns its id"""
+        path = os.path.abspath(path)
+        cursor = self.execute(
+            "INSERT OR REPLACE INTO recordings "
+            "(path, station, uuid, url, started, duration, codec, format, size, "
+            "status) VALUES (?, ?, ?, ?, ?, 0, ?, ?, 0, 'recording')",
+            (
+                path,
+                station,
+                uuid or "",
+                url,
+                started or time.time(),
+                codec or "",
+                os.path.splitext(path)[1].lstrip(".").lower(),
+            ),
+        )
+        return cursor.lastrowid if cursor is not None else None
+
+    def progress(self, recording, size, duration, status=None):
+        if status is None:
+            self.execute(
+                "UPDATE recordings SET size = ?, duration = ? WHERE id = ?",
+                (size, duration, recording),
+            )
+        else:
+            self.execute(
+                "UPDATE recordings SET size = ?, duration = ?, status = ? "
+                "WHERE id = ?",
+                (size, duration, status, recording),
+            )
+
+    def add_track(self, recording, offset, title):
+        self.execute(
+            "INSERT INTO tracks (recording, offset, title) VALUES (?, ?, ?)",
+            (recording, offset, title),
+        )
+
+    def forget(self, recording):
+        self.execute("DELETE FROM recordings WHERE id = ?", (recording,))
+
+    def converted(self, source, target, size):
+        """the recording was converted (see radioactive.transcoder)"""
+        target = os.path.abspath(target)
+        self.execute(
+            "UPDATE recordings SET path = ?, format = ?, size = ? WHERE path = ?",
+            (
+                target,
+                os.path.splitext(target)[1].lstrip(".").lower(),
+                size,
+                os.path.abspath(source),
+            ),
+        )
+
+    # -------------------------------- queries ------------------------------- #
+    def recordings(self, text="", limit=None):
+        """the recordings, newest first. text matches the station name or
+        one of the track titles"""
+        sql = (
+            "SELECT r.*, (SELECT COUNT(*) FROM tracks t WHERE t.recording = r.id) "
+            "AS tracks FROM recordings r"
+        )
+        params = []
+        if text:
+            pattern = "%{}%".format(text)
+            sql += (
+                " WHERE r.station LIKE ? OR r.uuid = ? OR EXISTS (SELECT 1 FROM "
+                "tracks t WHERE t.recording = r.id AND t.title LIKE ?)"
+            )
+            params += [pattern, text, pattern]
+        sql += " ORDER BY r.started DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self.select(sql, params)
+
+    def tracks(self, recording, text=""):
+        sql = "SELECT offset, title FROM tracks WHERE recording = ?"
+        params = [recording]
+        if text:
+            sql += " AND title LIKE ?"
+            params.append("%{}%".format(text))
+        return self.select(sql + " ORDER BY offset", params)
+
+    def usage(self):
+        """recordings, total duration and size per station, largest first"""
+        return self.select(
+            "SELECT station, COUNT(*) AS recordings, "
+            "COALESCE(SUM(duration), 0) AS duration, "
+            "COALESCE(SUM(size), 0) AS size, MAX(started) AS latest "
+            "FROM recordings GROUP BY station ORDER BY size DESC"
+        )
+
+    # --------------------------------- scan --------------------------------- #
+    def scan(self, directory=None):
+        """brings the index in line with the files of a directory: new files
+        are added (station and start time from their name), sizes are
+        updated and the rows of deleted files are dropped.
+        returns (added, updated, removed)"""
+        directory = os.path.abspath(directory or default_recordings_dir())
+        known = {
+            row["path"]: row
+            for row in self.select("SELECT id, path, size, status FROM recordings")
+        }
+        added = updated = removed = 0
+        found = set()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError as e:
+            log.debug("Could not scan {}: {}".format(directory, e))
+            entries = []
+        for entry in entries:
+            if not entry.is_file() or not entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                continue
+            path = os.path.abspath(entry.path)
+            found.add(path)
+            size = entry.stat().st_size
+            row = known.get(path)
+            if row is None:
+                station, started = parse_recording_name(path) or (
+                    os.path.splitext(entry.name)[0],
+                    entry.stat().st_mtime,
+                )
+                self.execute(
+                    "INSERT INTO recordings (path, station, uuid, url, started, "
+                    "codec, format, size, status) "
+                    "VALUES (?, ?, '', '', ?, '', ?, ?, 'done')",
+                    (
+                        path,
+                        station,
+                        started,
+                        os.path.splitext(path)[1].lstrip(".").lower(),
+                        size,
+                    ),
+                )
+                added += 1
+            elif row["size"] != size and row["status"] != "recording":
+                self.execute(
+                    "UPDATE recordings SET size = ? WHERE id = ?", (size, row["id"])
+                )
+                updated += 1
+        for path, row in known.items():
+            if os.path.dirname(path) == directory and path not in found:
+                self.execute("DELETE FROM recordings WHERE id = ?", (row["id"],))
+                removed += 1
+        return added, updated, removed
+
+
+class IcyReader:
+    """Reads only the ICY metadata of a stream and reports every new
+    StreamTitle. The audio between the metadata blocks is dropped"""
+
+    def __init__(self, url, on_title, session=None):
+        self.url = url
+        self.on_title = on_title
+        self.session = session or requests.Session()
+        self.stopped = threading.Event()
+        self.thread = None
+        # the response headers (icy-br, icy-name ...) once connected
+        self.headers = {}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        try:
+            response = self.session.get(
+                self.url,
+                headers={"Icy-MetaData": "1"},
+                stream=True,
+                timeout=ICY_TIMEOUT,
+            )
+        except requests.exceptions.RequestException as e:
+            STREAM_FAILURES.labels("icy").inc()
+            log.debug("ICY: {}".format(e))
+            return
+        STREAM_CONNECTS.labels("icy").inc()
+        with response:
+            self.headers = response.headers
+            try:
+                metaint = int(response.headers.get("icy-metaint", 0))
+            except ValueError:
+                metaint = 0
+            if not metaint:
+                log.debug("ICY: the stream sends no titles")
+                return
+            try:
+                self.read_titles(response.raw, metaint)
+            except Exception as e:
+                STREAM_FAILURES.labels("icy").inc()
+                log.debug("ICY: {}".format(e))
+
+    def read_titles(self, raw, metaint):
+        last = None
+        while not self.stopped.is_set():
+            skipped = 0
+            while skipped < metaint:
+                chunk = raw.read(min(16384, metaint - skipped))
+                if not chunk:
+                    return
+                skipped += len(chunk)
+            length = raw.read(1)
+            if not length:
+                return
+            block = raw.read(length[0] * 16) if length[0] else b""
+            match = STREAM_TITLE.search(block)
+            if match is None:
+                continue
+            title = match.group(1).decode("utf-8", "replace").strip()
+            if title and title != last:
+                last = title
+                self.on_title(title)
+
+
+class RecordingMonitor:
+    """Keeps the row of a recording up to date while ffmpeg writes it. With
+    the Progress of the ffmpeg child (see radioactive.progress) the size and
+    duration are its statistics, else the file is stat'ed. With a url the
+    track titles are read from a second connection to the stream
+    """
+
+    def __init__(self, library, recording, path, url=None, progress=None):
+        self.library = library
+        self.recording = recording
+        self.path = path
+        self.progress = progress
+        self.started = time.time()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.icy = IcyReader(url, self.on_title) if url else None
+
+    def start(self):
+        if self.recording is None:
+            return self
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        if self.icy is not None:
+            self.icy.start()
+        return self
+
+    def on_title(self, title):
+        offset = time.time() - self.started
+        log.debug("Recording: {} at {:.0f}s".format(title, offset))
+        self.library.add_track(self.recording, offset, title)
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def measure(self):
+        """(size, duration) of the recording so far"""
+        stats = self.progress.to_dict() if self.progress is not None else {}
+        size, duration = stats.get("bytes"), stats.get("time")
+        if size is None:
+            size = self.size()
+        if duration is None:
+            duration = time.time() - self.started
+        return size, duration
+
+    def run(self):
+        while not self.stopped.wait(PROGRESS_INTERVAL):
+            self.library.progress(self.recording, *self.measure())
+
+    def stop(self, ok=True):
+        """the recording is over, ok=False marks it as failed"""
+        self.stopped.set()
+        if self.icy is not None:
+            self.icy.stop()
+        if self.recording is None:
+            return
+        if not os.path.exists(self.path):
+            # nothing was written, nothing to list
+            self.library.forget(self.recording)
+            return
+        status = "done" if ok else "failed"
+        _, duration = self.measure()
+        self.library.progress(self.recording, self.size(), duration, status)
@@ -0,0 +1,278 @@
+""" OpenMetrics exporter.
+
+radioactive keeps a few counters and histograms about itself: the API calls
+and their latency, the time until a player plays, the connections made to
+the streams, the bytes recorded and the children started. With
+`--metrics-port PORT` they are served on http://127.0.0.1:PORT/metrics in
+the OpenMetrics text format, with the CPU, memory and I/O of every
+player/recorder child (see radioactive.telemetry) read at scrape time.
+
+Updating a metric costs a dict lookup, an uncontended lock and an addition,
+the text is only built when the endpoint is scraped. The metrics are always
+updated, nothing is served without --metrics-port.
+"""
+
+import http.server
+import math
+import socketserver
+import threading
+from bisect import bisect_left
+
+from zenlog import log
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+# every metric of the process, in the order they are rendered
+METRICS = []
+# functions returning extra sample lines at scrape time
+COLLECTORS = []
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STARTUP_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(pairs):
+    """{name="value",...} of (name, value) pairs"""
+    if not pairs:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, escape(v)) for k, v in pairs) + "}"
+
+
+def format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if value.is_integer():
+            return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class CounterValue:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        labels = format_labels(labels)
+        return ["{}_total{} {}".format(name, labels, format_value(self.value))]
+
+
+class HistogramValue:
+    def __init__(self, buckets):
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        # one count per bucket and one for +Inf, cumulated when rendered
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self, name, labels):
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, bucket in zip(self.buckets + (math.inf,), counts):
+            cumulative += bucket
+            le = format_labels(labels + [("le", format_value(bound))])
+            lines.append("{}_bucket{} {}".format(name, le, cumulative))
+        plain = format_labels(labels)
+        lines.append("{}_sum{} {}".format(name, plain, format_value(total)))
+        lines.append("{}_count{} {}".format(name, plain, count))
+        return lines
+
+
+class Metric:
+
+    """A metric family. labels() returns the value of one set of label
+    values, resolve it once outside of a loop
+    """
+
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        if not self.labelnames:
+            # shown as 0 before the first update
+            self.labels()
+        METRICS.append(self)
+
+    def new_value(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        value = self.values.get(values)
+        if value is None:
+            with self.lock:
+                value = self.values.setdefault(values, self.new_value())
+        return value
+
+    def render(self):
+        lines = [
+            "# TYPE {} {}".format(self.name, self.type),
+            "# HELP {} {}".format(self.name, escape(self.help)),
+        ]
+        for values, value in list(self.values.items()):
+            lines += value.samples(self.name, list(zip(self.labelnames, values)))
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def new_value(self):
+        return CounterValue()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help, labels)
+
+    def new_value(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+API_REQUESTS = Counter(
+    "radioactive_api_requests",
+    "radio-browser API requests by result (ok, cached, stale, error, failed)",
+    ["result"],
+)
+API_RETRIES = Counter(
+    "radioactive_api_retries", "API requests sent again after a failure"
+)
+API_LATENCY = Histogram(
+    "radioactive_api_request_seconds",
+    "Time waited on API requests that were not answered from the cache",
+)
+FIRST_AUDIO = Histogram(
+    "radioactive_first_audio_seconds",
+    "Time from starting a player until it reports playing",
+    ["player"],
+    buckets=STARTUP_BUCKETS,
+)
+STREAM_CONNECTS = Counter(
+    "radioactive_stream_connects",
+    "Connections opened to station streams (player, warm, icy)",
+    ["source"],
+)
+STREAM_FAILURES = Counter(
+    "radioactive_stream_failures",
+    "Stream connections that failed or broke off (player, warm, icy)",
+    ["source"],
+)
+RECORDED_BYTES = Counter("radioactive_recorded_bytes", "Bytes written by the recorders")
+CHILDREN_STARTED = Counter(
+    "radioactive_children_started",
+    "ffplay/ffmpeg children started, by kind",
+    ["kind"],
+)
+
+
+def render():
+    """the text served on /metrics"""
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    for collect in COLLECTORS:
+        try:
+            lines += collect()
+        except Exception as e:
+            log.debug("Error: {}".format(e))
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def child_collector(sampler):
+    """the resource use of the children, from the latest sample"""
+    fields = [
+        ("radioactive_child_cpu_percent", "gauge", "cpu_percent", ""),
+        ("radioactive_child_rss_bytes", "gauge", "rss", ""),
+        ("radioactive_child_read_bytes", "counter", "read_bytes", "_total"),
+        ("radioactive_child_write_bytes", "counter", "write_bytes", "_total"),
+    ]
+
+    def collect():
+        children = sampler.snapshot()
+        lines = []
+        for name, kind, field, suffix in fields:
+            lines.append("# TYPE {} {}".format(name, kind))
+            for child in children:
+                labels = format_labels(
+                    [
+                        ("pid", child["pid"]),
+                        ("kind", child["kind"]),
+                        ("station", child["station"]),
+                    ]
+                )
+                lines.append(
+                    "{}{}{} {}".format(
+                        name, suffix, labels, format_value(child[field] or 0)
+                    )
+                )
+        return lines
+
+    return collect
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug("Metrics: " + format % args)
+
+
+class MetricsServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    # python 3.6 has no http.server.ThreadingHTTPServer
+    daemon_threads = True
+
+
+def serve_metrics(port, sampler, host="127.0.0.1"):
+    """serves the metrics from a background thread, with the resource use of
+    the children sampled by a telemetry Sampler. returns the server or None
+    when the port can not be used"""
+    try:
+        server = MetricsServer((host, port), MetricsHandler)
+    except OSError as e:
+        log.error("Could not serve the metrics on port {}: {}".format(port, e))
+        return None
+    COLLECTORS.append(child_collector(sampler.start()))
+    thread = threading.Thread(target=server.serve_forever, name="metrics")
+    thread.daemon = True
+    thread.start()
+    log.debug("Metrics: http://{}:{}/metrics".format(host, port))
+    return server
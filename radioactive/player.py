@@ -3,118 +3,288 @@
 import os
 import signal
 import subprocess
-import sys
 import threading
+import time
 from shutil import which
-from time import sleep
 
 import psutil
 from zenlog import log
 
+from radioactive.errors import PlayerError
+from radioactive.metrics import FIRST_AUDIO, STREAM_CONNECTS, STREAM_FAILURES
+from radioactive.progress import FFMPEG_PROGRESS, FFPLAY_PROGRESS, Progress, follow
+from radioactive.registry import Registry
+
+
+def ffplay_command(exe_path, url, volume, loglevel):
+    """builds the ffplay command line for a stream"""
+    ffplay_commands = [
+        exe_path,
+        "-volume",
+        f"{volume}",
+        "-vn",  # no video playback
+        # a status line with the clock and the buffer, see radioactive.progress
+        *FFPLAY_PROGRESS,
+        url,
+    ]
+
+    if loglevel == "debug":
+        # don't add no disp and
+        ffplay_commands.append("-loglevel")
+        ffplay_commands.append("error")
+
+    else:
+        ffplay_commands.append("-loglevel")
+        ffplay_commands.append("error")
+        ffplay_commands.append("-nodisp")
+    return ffplay_commands
+
+
+class PlayerBackend:
+    """how a station is played, a backend builds the command of the child"""
+
+    name = None
+    program = None
+
+    def __init__(self, output="-"):
+        self.output = output
+
+    def command(self, exe_path, url, volume, loglevel):
+        raise NotImplementedError
+
+    def stdout(self):
+        """where the stdout of the child goes"""
+        return subprocess.PIPE
+
+
+class FFplayBackend(PlayerBackend):
+    """plays on the sound card with ffplay"""
+
+    name = "ffplay"
+    program = "ffplay"
+
+    def command(self, exe_path, url, volume, loglevel):
+        return ffplay_command(exe_path, url, volume, loglevel)
+
+
+class NullBackend(PlayerBackend):
+    """decodes the stream and throws the audio away, for headless monitoring
+    and CI"""
+
+    name = "null"
+    program = "ffmpeg"
+
+    def command(self, exe_path, url, volume, loglevel):
+        return [
+            exe_path,
+            "-nostdin",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-vn",
+            "-i",
+            url,
+            *FFMPEG_PROGRESS,
+            "-f",
+            "null",
+            "-",
+        ]
+
+
+class PCMBackend(PlayerBackend):
+    """decodes the stream to raw 16 bit stereo PCM at 44.1kHz, written to a
+    file or FIFO or to stdout when the output is '-'"""
+
+    name = "pcm"
+    program = "ffmpeg"
+
+    def command(self, exe_path, url, volume, loglevel):
+        return [
+            exe_path,
+            "-nostdin",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-y",
+            "-vn",
+            "-i",
+            url,
+            "-af",
+            "volume={}".format(volume / 100),
+            "-f",
+            "s16le",
+            "-ac",
+            "2",
+            "-ar",
+            "44100",
+            *FFMPEG_PROGRESS,
+            "pipe:1" if self.output == "-" else self.output,
+        ]
+
+    def stdout(self):
+        # let the audio through to our stdout, so it can be piped
+        return None if self.output == "-" else subprocess.PIPE
+
+
+BACKENDS = {
+    backend.name: backend for backend in (FFplayBackend, NullBackend, PCMBackend)
+}
+DEFAULT_BACKEND = "ffplay"
+# the registry kinds of the players, the recorders are "ffmpeg"
+PLAYER_KINDS = sorted(BACKENDS)
+
+
+def get_backend(name=DEFAULT_BACKEND, output="-"):
+    try:
+        return BACKENDS[name](output)
+    except KeyError:
+        raise PlayerError("Unknown player backend: {}".format(name))
+
 
 def kill_background_ffplays():
-    all_processes = psutil.process_iter(attrs=["pid", "name"])
-    count = 0
-    # Iterate through the processes and terminate those named "ffplay"
-    for process in all_processes:
-        try:
-            if process.info["name"] == "ffplay":
-                pid = process.info["pid"]
-                p = psutil.Process(pid)
-                p.terminate()
-                count += 1
-                log.info(f"Terminated ffplay process with PID {pid}")
-                if p.is_running():
-                    p.kill()
-                    log.debug(f"Forcefully killing ffplay process with PID {pid}")
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-            # Handle exceptions, such as processes that no longer exist or access denied
-            log.debug("Could not terminate a ffplay processes!")
+    """stops the players (ffplay, null, pcm) started by radioactive. the
+    recorders and conversions, and ffplay processes radioactive did not
+    start, are left alone"""
+    count = Registry().terminate(PLAYER_KINDS)
     if count == 0:
         log.info("No background radios are running!")
 
 
 class Player:
 
-    """FFPlayer handler, it holds all the attributes to properly execute ffplay
-    FFmepg required to be installed separately
+    """Player handler, it holds all the attributes to properly execute the
+    child of the chosen backend (ffplay by default)
+    FFplay/FFmpeg required to be installed separately
     """
 
-    def __init__(self, URL, volume, loglevel):
+    def __init__(
+        self,
+        URL,
+        volume,
+        loglevel,
+        station_name="N/A",
+        backend=DEFAULT_BACKEND,
+        source=None,
+    ):
         self.url = URL
+        # a warm stream feeding the child through its stdin
+        self.source = source
+        self.station_name = station_name
+        self.registry = Registry()
         self.volume = volume
         self.is_playing = False
         self.process = None
         self.exe_path = None
-        self.program_name = "ffplay"  # constant value
+        if isinstance(backend, str):
+            backend = get_backend(backend)
+        self.backend = backend
+        self.program_name = backend.program
         self.loglevel = loglevel
+        self.startup_time = None
+        # transport statistics of the child, see radioactive.progress
+        self.progress = None
 
         log.debug("player: url => {}".format(self.url))
-        # check if FFplay is installed
+        # check if the program of the backend is installed
         self.exe_path = which(self.program_name)
-        log.debug("FFplay: {}".format(self.exe_path))
+        log.debug("{}: {}".format(self.program_name, self.exe_path))
 
         if self.exe_path is None:
-            log.critical("FFplay not found, install it first please")
-            sys.exit(1)
+            raise PlayerError(
+                "{} not found, install it first please".format(self.program_name)
+            )
 
         self.start_process()
 
     def start_process(self):
-        ffplay_commands = [
-            self.exe_path,
-            "-volume",
-            f"{self.volume}",
-            "-vn",  # no video playback
-            self.url,
-        ]
-
-        if self.loglevel == "debug":
-            # don't add no disp and
-            ffplay_commands.append("-loglevel")
-            ffplay_commands.append("error")
-
-        else:
-            ffplay_commands.append("-loglevel")
-            ffplay_commands.append("error")
-            ffplay_commands.append("-nodisp")
+        input_url = "pipe:0" if self.source is not None else self.url
+        commands = self.backend.command(
+            self.exe_path, input_url, self.volume, self.loglevel
+        )
+        self.progress = Progress(first_audio=FIRST_AUDIO.labels(self.backend.name))
+        STREAM_CONNECTS.labels("player").inc()
         try:
+            started = time.perf_counter()
             self.process = subprocess.Popen(
-                ffplay_commands,
+                commands,
                 shell=False,
-                stdout=subprocess.PIPE,  # Capture standard output
+                stdin=subprocess.PIPE if self.source is not None else None,
+                stdout=self.backend.stdout(),  # Capture standard output
                 stderr=subprocess.PIPE,  # Capture standard error
                 text=True,  # Use text mode to capture strings
             )
+            self.startup_time = time.perf_counter() - started
             self.is_running = True
-            log.debug("player: ffplay => PID {} initiated".format(self.process.pid))
+            log.debug(
+                "player: {} => PID {} initiated in {:.1f} ms".format(
+                    self.backend.name, self.process.pid, self.startup_time * 1000
+                )
+            )
+            self.registry.register(
+                self.process.pid,
+                self.backend.name,
+                station=self.station_name,
+                url=self.url,
+                startup_time=self.startup_time,
+            )
             # Create a thread to continuously capture and check error output
             error_thread = threading.Thread(target=self.check_error_output)
             error_thread.daemon = True
             error_thread.start()
 
+            if self.source is not None:
+                feed_thread = threading.Thread(
+                    target=self.feed, args=(self.process, self.source.take())
+                )
+                feed_thread.daemon = True
+                feed_thread.start()
+
         except Exception as e:
             # Handle exceptions that might occur during process setup
             log.error("Error while starting radio: {}".format(e))
 
+    def feed(self, process, chunks):
+        """copies the warm stream into the stdin of the child"""
+        try:
+            for chunk in chunks:
+                process.stdin.buffer.write(chunk)
+                process.stdin.buffer.flush()
+        except (BrokenPipeError, OSError, ValueError) as e:
+            log.debug("Error: {}".format(e))
+        finally:
+            try:
+                process.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+
     def check_error_output(self):
-        while self.is_running:
-            stderr_result = self.process.stderr.readline()
-            if stderr_result:
-                print()  # pass a blank line to command for better log messages
-                log.error("Could not connect to the station")
-                try:
-                    # try to show the debug info
-                    log.debug(stderr_result)
-                    # only showing the server response
-                    log.error(stderr_result.split(": ")[1])
-                except Exception as e:
-                    log.debug("Error: {}".format(e))
-                    pass
-
-                self.is_running = False
-                self.stop()
-            sleep(2)
+        """follows the stderr of the child, the statistics go to
+        self.progress and the error messages to on_error"""
+        process = self.process
+        follow(process.stderr, self.progress, pid=process.pid, on_error=self.on_error)
+
+    def on_error(self, line):
+        if not self.is_running:
+            return False  # closed for a station switch
+        if self.progress.updates:
+            # the station plays, a decoding error is only counted
+            log.debug("{}: {}".format(self.program_name, line))
+            return True
+        STREAM_FAILURES.labels("player").inc()
+        print()  # pass a blank line to command for better log messages
+        log.error("Could not connect to the station")
+        try:
+            # try to show the debug info
+            log.debug(line)
+            # only showing the server response
+            log.error(line.split(": ")[1])
+        except Exception as e:
+            log.debug("Error: {}".format(e))
+            pass
+
+        self.is_running = False
+        self.stop()
+        return False
 
     def terminate_parent_process(self):
         parent_pid = os.getppid()
@@ -127,15 +297,16 @@ class Player:
             log.warning("Process is not initialized")
             return False
         try:
-            proc = psutil.Process(self.process.pid)
-            if proc.status() == psutil.STATUS_ZOMBIE:
+            # a single /proc read, the status can change between reads
+            status = psutil.Process(self.process.pid).status()
+            if status == psutil.STATUS_ZOMBIE:
                 log.debug("Process is a zombie")
                 return False
 
-            if proc.status() == psutil.STATUS_RUNNING:
+            if status == psutil.STATUS_RUNNING:
                 return True
 
-            if proc.status() == psutil.STATUS_SLEEPING:
+            if status == psutil.STATUS_SLEEPING:
                 log.debug("Process is sleeping")
                 return True  # Sleeping is considered active for our purpose
 
@@ -150,6 +321,23 @@ class Player:
             log.error("Error while checking process status: {}".format(e))
             return False
 
+    def close(self):
+        """stops the child without ending radioactive, used to switch
+        stations"""
+        self.is_running = False
+        if self.source is not None:
+            self.source.close()
+        if self.process is None:
+            return
+        try:
+            self.process.terminate()
+            self.process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        finally:
+            self.registry.unregister(self.process.pid)
+            self.process = None
+
     def play(self):
         """Play a station"""
         if not self.is_playing:
@@ -170,6 +358,7 @@ class Player:
                 log.error("Error while stopping radio: {}".format(e))
                 raise
             finally:
+                self.registry.unregister(self.process.pid)
                 self.is_playing = False
                 self.process = None
         else:
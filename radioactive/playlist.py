@@ -0,0 +1,169 @@
+""" Reads and writes station lists as M3U, PLS and OPML files, to move the
+favorite list between machines or to other players.
+
+Entries are dicts with a "name", a stream "url" and/or a radio-browser
+"stationuuid". The uuid survives a round trip: M3U keeps it in a
+#RADIOBROWSERUUID line (as the radio-browser M3U export does) and OPML in a
+stationuuid attribute. PLS has no place for it, so only the URL is kept.
+"""
+
+import os.path
+import re
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr
+
+from radioactive.errors import PlaylistError
+
+FORMATS = {
+    ".m3u": "m3u",
+    ".m3u8": "m3u",
+    ".pls": "pls",
+    ".opml": "opml",
+    ".xml": "opml",
+}
+
+UUID_PATTERN = re.compile(
+    r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$", re.I
+)
+
+
+def is_uuid(text):
+    return bool(UUID_PATTERN.match(text.strip()))
+
+
+def format_of(path):
+    fmt = FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise PlaylistError(
+            "unknown playlist type: {} (use .m3u, .pls or .opml)".format(path)
+        )
+    return fmt
+
+
+def entry(name="", url="", stationuuid=""):
+    return {"name": name.strip(), "url": url.strip(), "stationuuid": stationuuid}
+
+
+# ---------------------------------- reading --------------------------------- #
+def parse_m3u(text):
+    entries = []
+    name, uuid = "", ""
+    for line in text.splitlines():
+        line = line.strip()
+        if line == "":
+            continue
+        if line.upper().startswith("#EXTINF:"):
+            # #EXTINF:-1 tvg-logo="...",Station name
+            name = line.split(",", 1)[1] if "," in line else ""
+        elif line.upper().startswith("#RADIOBROWSERUUID:"):
+            uuid = line.split(":", 1)[1].strip()
+        elif line.startswith("#"):
+            continue
+        elif is_uuid(line):
+            # a plain list of uuids is accepted too
+            entries.append(entry(name, "", line))
+            name, uuid = "", ""
+        else:
+            entries.append(entry(name or line, line, uuid))
+            name, uuid = "", ""
+    return entries
+
+
+def parse_pls(text):
+    files, titles = {}, {}
+    for line in text.splitlines():
+        key, _, value = line.strip().partition("=")
+        match = re.match(r"^(file|title)(\d+)$", key.strip(), re.I)
+        if not match:
+            continue
+        target = files if match.group(1).lower() == "file" else titles
+        target[int(match.group(2))] = value.strip()
+    return [
+        entry(titles.get(number) or files[number], files[number])
+        for number in sorted(files)
+    ]
+
+
+def parse_opml(text):
+    try:
+        root = ET.fromstring(text)
+    except ET.ParseError as e:
+        raise PlaylistError("not a valid OPML file: {}".format(e)) from e
+    entries = []
+    for outline in root.iter("outline"):
+        attributes = {key.lower(): value for key, value in outline.attrib.items()}
+        url = attributes.get("url", "")
+        uuid = attributes.get("stationuuid", "")
+        if not url and not uuid:
+            # a folder of outlines
+            continue
+        name = attributes.get("text") or attributes.get("title") or url
+        entries.append(entry(name, url, uuid))
+    return entries
+
+
+PARSERS = {"m3u": parse_m3u, "pls": parse_pls, "opml": parse_opml}
+
+
+def read_playlist(path):
+    """returns the entries of an M3U, PLS or OPML file"""
+    fmt = format_of(path)
+    try:
+        with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+            text = f.read()
+    except OSError as e:
+        raise PlaylistError("could not read {}: {}".format(path, e)) from e
+    return PARSERS[fmt](text)
+
+
+# ---------------------------------- writing --------------------------------- #
+def format_m3u(entries):
+    lines = ["#EXTM3U"]
+    for item in entries:
+        lines.append("#EXTINF:-1,{}".format(item["name"]))
+        if item.get("stationuuid"):
+            lines.append("#RADIOBROWSERUUID:{}".format(item["stationuuid"]))
+        lines.append(item["url"])
+    return "\n".join(lines) + "\n"
+
+
+def format_pls(entries):
+    lines = ["[playlist]"]
+    for number, item in enumerate(entries, start=1):
+        lines.append("File{}={}".format(number, item["url"]))
+        lines.append("Title{}={}".format(number, item["name"]))
+        lines.append("Length{}=-1".format(number))
+    lines.append("NumberOfEntries={}".format(len(entries)))
+    lines.append("Version=2")
+    return "\n".join(lines) + "\n"
+
+
+def format_opml(entries):
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<opml version="2.0">',
+        "  <head><title>radio-active favorites</title></head>",
+        "  <body>",
+    ]
+    for item in entries:
+        attributes = 'type="audio" text={} URL={}'.format(
+            quoteattr(item["name"]), quoteattr(item["url"])
+        )
+        if item.get("stationuuid"):
+            attributes += " stationuuid={}".format(quoteattr(item["stationuuid"]))
+        lines.append("    <outline {} />".format(attributes))
+    lines += ["  </body>", "</opml>"]
+    return "\n".join(lines) + "\n"
+
+
+FORMATTERS = {"m3u": format_m3u, "pls": format_pls, "opml": format_opml}
+
+
+def write_playlist(path, entries):
+    """writes the entries (they must have a url) as M3U, PLS or OPML"""
+    fmt = format_of(path)
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(FORMATTERS[fmt](entries))
+    except OSError as e:
+        raise PlaylistError("could not write {}: {}".format(path, e)) from e
@@ -0,0 +1,126 @@
+""" Speculative prefetch of the stations listed in a result table.
+
+While the user reads the table, the streams of the first few stations are
+probed in the background, with the records the search already returned. When
+one of them is picked it starts right away instead of being looked up again.
+The probe only checks that the stream answers (following its redirects and
+m3u/pls playlists), the player opens the stream itself.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import requests
+from zenlog import log
+
+DEFAULT_PREFETCH = 5
+PREFETCH_WORKERS = 3
+PROBE_TIMEOUT = (3, 3)
+PROBE_BYTES = 8192
+PLAYLIST_TYPES = ["mpegurl", "scpls", "x-pls"]
+
+
+def first_playlist_url(text):
+    """returns the first stream url listed in a m3u/pls playlist"""
+    for line in text.splitlines():
+        line = line.strip()
+        if line.lower().startswith("file") and "=" in line:
+            line = line.split("=", 1)[1].strip()
+        if line.startswith("http://") or line.startswith("https://"):
+            return line
+    return None
+
+
+def is_playlist(response, url):
+    content_type = response.headers.get("Content-Type", "").lower()
+    return any(t in content_type for t in PLAYLIST_TYPES) or (
+        url.lower().split("?")[0].endswith((".m3u", ".pls"))
+    )
+
+
+def open_stream(session, url, timeout=PROBE_TIMEOUT, depth=3):
+    """returns the streaming response of the audio behind a url, m3u/pls
+    playlists are followed to their first entry"""
+    response = session.get(url, stream=True, timeout=timeout)
+    if response.ok and not is_playlist(response, url):
+        return response
+    try:
+        response.raise_for_status()
+        head = next(response.iter_content(chunk_size=PROBE_BYTES), b"")
+    finally:
+        response.close()
+    stream_url = first_playlist_url(head.decode("utf-8", "replace"))
+    if stream_url is None or depth == 0:
+        raise ValueError("no stream in the playlist at {}".format(url))
+    return open_stream(session, stream_url, timeout, depth - 1)
+
+
+class Prefetcher:
+    def __init__(
+        self, handler, stations, top=DEFAULT_PREFETCH, workers=PREFETCH_WORKERS
+    ):
+        self.handler = handler
+        self.stations = stations[:top] if top else []
+        self.cancelled = threading.Event()
+        self.futures = {}
+        self.executor = None
+        # stream probes don't go through the cached API session
+        self.probe_session = requests.Session()
+        self.workers = max(1, min(workers, len(self.stations) or 1))
+
+    def start(self):
+        if not self.stations:
+            return self
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        for station in self.stations:
+            uuid = station.get("stationuuid")
+            if uuid and uuid not in self.futures:
+                self.futures[uuid] = self.executor.submit(self.resolve, station)
+        log.debug("Prefetching {} stations".format(len(self.futures)))
+        return self
+
+    def resolve(self, station):
+        """returns the search record when its stream answers, else None"""
+        if self.cancelled.is_set():
+            return None
+        if not self.probe(station.get("url_resolved") or station["url"]):
+            return None
+        return station
+
+    def probe(self, url):
+        """opens the stream and reads its first bytes"""
+        try:
+            with open_stream(self.probe_session, url) as response:
+                for chunk in response.iter_content(chunk_size=1024):
+                    if chunk or self.cancelled.is_set():
+                        break
+                return True
+        except Exception as e:
+            log.debug("Prefetch: probe failed for {}: {}".format(url, e))
+            return False
+
+    def get(self, uuid, timeout=2):
+        """returns the prefetched station or None when it is not (yet) ready"""
+        future = self.futures.get(uuid)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            log.debug("Prefetch: {} not ready in time".format(uuid))
+        except Exception as e:
+            log.debug("Prefetch: {}".format(e))
+        return None
+
+    def cancel(self):
+        """drops the pending work, running probes stop at their next read"""
+        self.cancelled.set()
+        for future in self.futures.values():
+            future.cancel()
+        if self.executor is not None:
+            try:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+            except TypeError:  # python < 3.9
+                self.executor.shutdown(wait=False)
+        self.probe_session.close()
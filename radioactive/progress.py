@@ -0,0 +1,271 @@
+""" Transport statistics of the player/recorder children.
+
+The ffmpeg children (the recorder, the null and pcm players) are started with
+`-nostats -progress pipe:2`: every half second they write a block of
+key=value lines (total_size, out_time_us, bitrate, speed, drop_frames ...)
+closed by a progress=continue line to their stderr, between the error
+messages. ffplay has no -progress, with -stats it rewrites a status line
+("  12.34 M-A:  0.000 fd=   0 aq=   24KB vq=    0KB sq=    0B") instead.
+
+A reader thread (or task) hands whatever the child wrote to a Progress. The
+lines are only split at the "=" while reading, the numbers are converted when
+someone asks for them: ffplay writes ~30 status lines a second and almost all
+of them are replaced before anyone looks.
+
+The owner copies the latest values into the process registry every few
+seconds, so `radio --status` and the daemon status of other processes show
+them too.
+"""
+
+import asyncio
+import datetime
+import math
+import re
+import time
+
+from radioactive.cache import human_size
+from radioactive.registry import Registry
+
+READ_SIZE = 4096
+# seconds between two copies to the process registry
+PUBLISH_INTERVAL = 5.0
+# the command line options that turn the statistics on
+FFMPEG_PROGRESS = ["-nostats", "-progress", "pipe:2"]
+FFPLAY_PROGRESS = ["-stats"]
+
+LINE_END = re.compile(rb"[\r\n]")
+STATUS_LINE = re.compile(
+    r"^\s*(?P<clock>\S+)\s+\S*:\s*\S+\s+fd=\s*(?P<dropped>-?\d+)"
+    r"\s+aq=\s*(?P<buffer>\d+)KB"
+)
+NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+# a line of a -progress block. anything else, like an error about a url with
+# a query string ("https://host/live?type=.mp3: ... 403 Forbidden"), is not.
+# ffmpeg pads some values: "bitrate= 128.0kbits/s", "speed=   1x"
+PROGRESS_LINE = re.compile(
+    r"^(?P<key>frame|fps|bitrate|total_size|out_time(?:_us|_ms)?|dup_frames"
+    r"|drop_frames|speed|progress|stream_\d+_\d+_[a-z]+)=\s*(?P<value>\S*)\s*$"
+)
+
+
+def to_number(value, kind=float):
+    """the number at the start of "128.0kbits/s", "1.01x" or "1234", None
+    for "N/A" and missing values"""
+    match = NUMBER.match(value or "")
+    if match is None:
+        return None
+    number = kind(float(match.group()))
+    if isinstance(number, float) and not math.isfinite(number):
+        return None
+    return number
+
+
+def to_float(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+class Progress:
+
+    """The latest statistics of one child and its error counter. feed_data()
+    takes the raw stderr bytes, in chunks of any size.
+
+    first_audio (a histogram of radioactive.metrics) gets the time until the
+    first statistics, written (a counter) the bytes the child wrote
+    """
+
+    def __init__(self, first_audio=None, written=None):
+        self.first_audio = first_audio
+        self.written = written
+        self.created = time.time()
+        self.partial = b""
+        # the last complete ffmpeg block and the one being read
+        self.values = {}
+        self.pending = {}
+        # the last ffplay status line
+        self.status_line = ""
+        # (time, total_size) of the last two ffmpeg blocks, for the rate
+        self.previous = None
+        self.current = None
+        self.updates = 0
+        self.updated = None
+        self.ended = False
+        self.errors = 0
+        self.last_error = ""
+        self.published = 0.0
+
+    def feed_data(self, data):
+        """reads a chunk of stderr, returns the lines that are not
+        statistics (error messages)"""
+        lines = LINE_END.split(self.partial + data)
+        self.partial = lines.pop()
+        errors = []
+        for line in lines:
+            line = line.decode("utf-8", "replace")
+            if line and not self.feed_line(line):
+                errors.append(line.strip())
+        return errors
+
+    def feed_line(self, line):
+        """returns False for a line that is not statistics
+
+        >>> progress = Progress()
+        >>> progress.feed_line("total_size=4096")
+        True
+        >>> progress.feed_line("https://host/live?type=.mp3: Server returned 403")
+        False
+        >>> progress.last_error
+        'https://host/live?type=.mp3: Server returned 403'
+        """
+        if "aq=" in line:
+            self.status_line = line
+            self.touch(time.time())
+            return True
+        match = PROGRESS_LINE.match(line)
+        if match is not None:
+            key, value = match.group("key", "value")
+            if key == "progress":
+                self.commit(value)
+            else:
+                self.pending[key] = value
+            return True
+        if not line.strip():
+            return True
+        self.errors += 1
+        self.last_error = line.strip()
+        return False
+
+    def commit(self, state):
+        """an ffmpeg block is complete"""
+        now = time.time()
+        self.values, self.pending = self.pending, {}
+        self.previous = self.current
+        self.current = (now, to_number(self.values.get("total_size"), int))
+        if self.written is not None and self.current[1] is not None:
+            before = (self.previous[1] if self.previous else None) or 0
+            if self.current[1] > before:
+                self.written.inc(self.current[1] - before)
+        self.touch(now)
+        self.ended = state == "end"
+
+    def touch(self, now):
+        if not self.updates and self.first_audio is not None:
+            self.first_audio.observe(now - self.created)
+        self.updates += 1
+        self.updated = now
+
+    def throughput(self):
+        """bytes per second written between the last two ffmpeg blocks"""
+        if self.previous is None or self.current is None:
+            return None
+        (then, before), (now, after) = self.previous, self.current
+        if before is None or after is None or now <= then:
+            return None
+        return (after - before) / (now - then)
+
+    def to_dict(self):
+        stats = {
+            "updates": self.updates,
+            "updated": self.updated,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "bytes": None,
+            "time": None,
+            "bitrate": None,
+            "speed": None,
+            "throughput": None,
+            "dropped": None,
+            "buffer": None,
+        }
+        if self.values:
+            values = self.values
+            out_time = to_number(values.get("out_time_us"), int)
+            stats["bytes"] = self.current[1]
+            stats["time"] = out_time / 1e6 if out_time is not None else None
+            stats["bitrate"] = to_number(values.get("bitrate"))
+            stats["speed"] = to_number(values.get("speed"))
+            stats["throughput"] = self.throughput()
+            stats["dropped"] = to_number(values.get("drop_frames"), int)
+        match = STATUS_LINE.match(self.status_line)
+        if match is not None:
+            stats["time"] = to_float(match.group("clock"))
+            stats["dropped"] = int(match.group("dropped"))
+            stats["buffer"] = int(match.group("buffer")) * 1024
+        return stats
+
+    def publish(self, pid, force=False):
+        """copies the statistics to the registry entry of the child, at most
+        every PUBLISH_INTERVAL seconds"""
+        now = time.time()
+        if not force and now - self.published < PUBLISH_INTERVAL:
+            return
+        self.published = now
+        Registry().update(pid, progress=self.to_dict())
+
+
+def follow(stream, progress, pid=None, on_error=None, on_update=None):
+    """reads the stderr of a child until it is closed, meant for a thread.
+    on_error gets every error line, following stops when it returns False.
+    on_update is called after each new set of statistics"""
+    # a text stream is read as bytes, its lines also end with \r
+    stream = getattr(stream, "buffer", stream)
+    read = getattr(stream, "read1", stream.read)
+    while True:
+        try:
+            data = read(READ_SIZE)
+        except (OSError, ValueError):
+            return
+        if not data:
+            return
+        updates = progress.updates
+        for line in progress.feed_data(data):
+            if on_error is not None and on_error(line) is False:
+                return
+        if progress.updates != updates:
+            if on_update is not None:
+                on_update(progress)
+            if pid is not None:
+                progress.publish(pid)
+
+
+async def follow_async(stream, progress, pid=None):
+    """follow() for the stderr of an asyncio subprocess. the registry is
+    written on the default executor, its file lock would block the loop"""
+    loop = asyncio.get_running_loop()
+    publishing = None
+    while True:
+        data = await stream.read(READ_SIZE)
+        if not data:
+            break
+        updates = progress.updates
+        progress.feed_data(data)
+        due = time.time() - progress.published >= PUBLISH_INTERVAL
+        if pid is not None and progress.updates != updates and due:
+            if publishing is None or publishing.done():
+                publishing = loop.run_in_executor(None, progress.publish, pid)
+    if publishing is not None:
+        await publishing
+
+
+def describe(stats):
+    """a short text of the statistics for tables and status lines"""
+    if not stats or not stats.get("updates"):
+        return ""
+    parts = []
+    if stats.get("time") is not None:
+        parts.append(str(datetime.timedelta(seconds=int(stats["time"]))))
+    if stats.get("bytes") is not None:
+        parts.append(human_size(stats["bytes"]))
+    if stats.get("bitrate"):
+        parts.append("{:.0f} kbps".format(stats["bitrate"]))
+    if stats.get("speed") is not None:
+        parts.append("{:.2f}x".format(stats["speed"]))
+    if stats.get("buffer") is not None:
+        parts.append("buffer {}".format(human_size(stats["buffer"])))
+    if stats.get("dropped"):
+        parts.append("{} dropped".format(stats["dropped"]))
+    return ", ".join(parts)
+
@@ -0,0 +1,168 @@
+""" Deduplication and ranking of search results.
+
+radio-browser lists the same stream under several names, and the same station
+once per bitrate. Before a result table is shown the stations are copied into
+columns (one array per field) and ranked on a single packed integer score:
+working streams first, then votes, clicks and bitrate. Walking the stations
+best first, a station whose stream URL (or normalized name in the same
+country) was already seen is dropped, so the best copy of each one stays.
+"""
+
+import re
+from array import array
+
+# bits of the packed score given to each field, most significant first
+VOTES_BITS = 24
+CLICKS_BITS = 24
+BITRATE_BITS = 12
+
+# "Radio X (128 kbps)", "Radio X - HQ", "Radio X 320k", "Radio X [AAC+]"
+QUALITY_WORDS = frozenset(
+    ["hq", "lq", "hd", "low", "high", "mp3", "aac", "ogg", "opus"]
+)
+BITRATE_UNITS = ("k", "kb", "kbps", "kbit", "kbits")
+SPACED_UNIT = re.compile(r"(\d) +(?=kb?(?:ps|its?)?\b)")
+WORD = re.compile(r"[^\W_]+")
+
+
+def normalize_url(url):
+    """the stream URL without the scheme, the default port and the shoutcast
+    "/;" suffix, in lower case"""
+    url = (url or "").strip().lower()
+    scheme, sep, rest = url.partition("://")
+    if sep:
+        url = rest
+    host, sep, path = url.partition("/")
+    if host.endswith((":80", ":443")):
+        host = host.rpartition(":")[0]
+    return (host + sep + path).rstrip("/;")
+
+
+def normalize_name(name):
+    """the station name without case, punctuation and quality markers"""
+    name = (name or "").casefold()
+    if " k" in name:
+        # "128 kbps" is one word
+        name = SPACED_UNIT.sub(r"\1", name)
+    words = WORD.findall(name)
+    if "k" in name or not QUALITY_WORDS.isdisjoint(words):
+        words = [
+            word
+            for word in words
+            if word not in QUALITY_WORDS
+            and not (word[0].isdigit() and word.endswith(BITRATE_UNITS))
+        ]
+    return " ".join(words)
+
+
+def clamp(value, bits):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return 0
+    return max(0, min(value, (1 << bits) - 1))
+
+
+def column(stations, field, bits):
+    """an array of one integer field, clamped to the bits of the score"""
+    limit = (1 << bits) - 1
+    values = [station.get(field) for station in stations]
+    return array(
+        "l",
+        [
+            # the API sends ints, only odd values take the slow path
+            value if type(value) is int and 0 <= value <= limit else clamp(value, bits)
+            for value in values
+        ],
+    )
+
+
+class StationColumns:
+    """The fields used for ranking, one column per field"""
+
+    def __init__(self, stations=()):
+        self.stations = list(stations)
+        stations = self.stations
+        self.votes = column(stations, "votes", VOTES_BITS)
+        self.clicks = column(stations, "clickcount", CLICKS_BITS)
+        self.bitrate = column(stations, "bitrate", BITRATE_BITS)
+        self.ok = array("b", [1 if s.get("lastcheckok", 1) else 0 for s in stations])
+        self.url_keys = [
+            normalize_url(s.get("url_resolved") or s.get("url")) for s in stations
+        ]
+        # "Radio 1" of two countries are two stations
+        self.name_keys = [
+            (normalize_name(s.get("name")), (s.get("countrycode") or "").upper())
+            for s in stations
+        ]
+
+    def __len__(self):
+        return len(self.stations)
+
+    def add(self, station):
+        """appends one station, the columns can be filled while a response is
+        still downloading"""
+        self.stations.append(station)
+        self.votes.append(clamp(station.get("votes"), VOTES_BITS))
+        self.clicks.append(clamp(station.get("clickcount"), CLICKS_BITS))
+        self.bitrate.append(clamp(station.get("bitrate"), BITRATE_BITS))
+        self.ok.append(1 if station.get("lastcheckok", 1) else 0)
+        self.url_keys.append(
+            normalize_url(station.get("url_resolved") or station.get("url"))
+        )
+        self.name_keys.append(
+            (
+                normalize_name(station.get("name")),
+                (station.get("countrycode") or "").upper(),
+            )
+        )
+
+    def scores(self):
+        """one integer per station, comparing two of them compares
+        (lastcheckok, votes, clickcount, bitrate) in that order"""
+        shift_clicks = BITRATE_BITS
+        shift_votes = shift_clicks + CLICKS_BITS
+        shift_ok = shift_votes + VOTES_BITS
+        return array(
+            "q",
+            [
+                (ok << shift_ok)
+                | (votes << shift_votes)
+                | (clicks << shift_clicks)
+                | bitrate
+                for ok, votes, clicks, bitrate in zip(
+                    self.ok, self.votes, self.clicks, self.bitrate
+                )
+            ],
+        )
+
+    def order(self):
+        """indexes of the stations, best first. ties keep the API order"""
+        scores = self.scores()
+        return sorted(range(len(scores)), key=scores.__getitem__, reverse=True)
+
+    def unique(self, order):
+        """drops the indexes whose URL or name (in the same country) was seen
+        earlier in order"""
+        seen_urls, seen_names = set(), set()
+        kept = []
+        for index in order:
+            url, name = self.url_keys[index], self.name_keys[index]
+            if (url and url in seen_urls) or (name[0] and name in seen_names):
+                continue
+            seen_urls.add(url)
+            seen_names.add(name)
+            kept.append(index)
+        return kept
+
+    def ranked(self, dedupe=True):
+        """the stations best first, without duplicates"""
+        order = self.order()
+        if dedupe:
+            order = self.unique(order)
+        return [self.stations[index] for index in order]
+
+
+def rank_stations(stations, dedupe=True):
+    """returns the stations best first, without duplicates"""
+    return StationColumns(stations).ranked(dedupe)
@@ -1,7 +1,27 @@
+import datetime
 import subprocess
+import sys
+import threading
 
 from zenlog import log
 
+from radioactive.metrics import RECORDED_BYTES
+from radioactive.progress import FFMPEG_PROGRESS, Progress, describe, follow
+from radioactive.registry import Registry
+
+
+def recording_name(station_name, now=None):
+    """the file name of a recording without its extension, the format is
+    <station>-<day>-<MON>-<year>@<hour>-<minute>-<second>-<AM/PM>"""
+    now = now or datetime.datetime.now()
+    month_name = now.strftime("%b").upper()
+    # Format AM/PM as 'AM' or 'PM'
+    am_pm = now.strftime("%p")
+    formatted_date_time = now.strftime(f"%d-{month_name}-%Y@%I-%M-%S-{am_pm}")
+    # a slash in the name (N/A) would be a directory
+    name = "{}-{}".format(station_name.strip(), formatted_date_time)
+    return name.replace(" ", "-").replace("/", "-")
+
 
 def record_audio_auto_codec(input_stream_url):
     try:
@@ -29,45 +49,88 @@ def record_audio_auto_codec(input_stream_url):
     except subprocess.CalledProcessError as e:
         log.error(f"Error: could not fetch codec {e}")
         return None
+    except OSError as e:
+        # ffprobe is missing, the caller falls back to the station codec
+        log.debug(f"Error: could not run ffprobe {e}")
+        return None
+
+
+def record_command(input_url, output_file, loglevel):
+    """builds the ffmpeg command line to record a stream. the stream is
+    always copied as it is, conversions run after the capture
+    (see radioactive.transcoder)"""
+    ffmpeg_command = [
+        "ffmpeg",
+        "-i",
+        input_url,  # input URL
+        "-vn",  # disable video recording
+        # machine readable stats on stderr, see radioactive.progress
+        *FFMPEG_PROGRESS,
+    ]
+
+    # codec for audio stream
+    # the file extension must match the stream codec (or be a container
+    # like mka that takes any codec)
+    ffmpeg_command.append("-c:a")
+    ffmpeg_command.append("copy")
 
+    ffmpeg_command.append("-loglevel")
+    if loglevel == "debug":
+        ffmpeg_command.append("info")
+    else:
+        ffmpeg_command.append("error"),
+        ffmpeg_command.append("-hide_banner")
 
-def record_audio_from_url(input_url, output_file, force_mp3, loglevel):
+    # output file
+    ffmpeg_command.append(output_file)
+    return ffmpeg_command
+
+
+def show_progress(progress):
+    sys.stdout.write("\rRecorded {}  ".format(describe(progress.to_dict())))
+    sys.stdout.flush()
+
+
+def show_message(line):
+    """what ffmpeg would have printed itself, below the progress line"""
+    sys.stdout.write("\n")
+    sys.stdout.flush()
+    sys.stderr.write(line + "\n")
+
+
+def record_audio_from_url(input_url, output_file, loglevel):
+    """captures a stream until 'q' is pressed, returns True on success"""
     try:
-        # Construct the FFmpeg command
-        ffmpeg_command = [
-            "ffmpeg",
-            "-i",
-            input_url,  # input URL
-            "-vn",  # disable video recording
-            "-stats",  # show stats
-        ]
+        ffmpeg_command = record_command(input_url, output_file, loglevel)
 
-        # codec for audio stream
-        ffmpeg_command.append("-c:a")
-        if force_mp3:
-            ffmpeg_command.append("libmp3lame")
-            log.debug("Record: force libmp3lame")
-        else:
-            # file will be saved as as provided. this is more error prone
-            # file extension must match the actual stream codec
-            ffmpeg_command.append("copy")
-
-        ffmpeg_command.append("-loglevel")
-        if loglevel == "debug":
-            ffmpeg_command.append("info")
-        else:
-            ffmpeg_command.append("error"),
-            ffmpeg_command.append("-hide_banner")
-
-        # output file
-        ffmpeg_command.append(output_file)
-
-        # Run FFmpeg command on foreground to catch 'q' without
-        # any complex thread for now
-        subprocess.run(ffmpeg_command, check=True)
+        # Run FFmpeg command on foreground to catch 'q', its stderr is
+        # read by a thread that shows the progress
+        process = subprocess.Popen(ffmpeg_command, stderr=subprocess.PIPE)
+        registry = Registry()
+        registry.register(process.pid, "ffmpeg", url=input_url, path=output_file)
+        progress = Progress(written=RECORDED_BYTES.labels())
+        reader = threading.Thread(
+            target=follow,
+            args=(process.stderr, progress),
+            kwargs=dict(
+                pid=process.pid, on_error=show_message, on_update=show_progress
+            ),
+        )
+        reader.daemon = True
+        reader.start()
+        try:
+            returncode = process.wait()
+            reader.join(timeout=2)
+        finally:
+            registry.unregister(process.pid)
+        if progress.updates:
+            print()  # end the progress line
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, ffmpeg_command)
 
         log.debug("Record: {}".format(str(ffmpeg_command)))
         log.info(f"Audio recorded successfully.")
+        return True
 
     except subprocess.CalledProcessError as e:
         log.debug("Error: {}".format(e))
@@ -75,3 +138,4 @@ def record_audio_from_url(input_url, output_file, force_mp3, loglevel):
     except Exception as ex:
         log.debug("Error: {}".format(ex))
         log.error(f"An error occurred: {ex}")
+    return False
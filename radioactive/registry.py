@@ -0,0 +1,173 @@
+""" Registry of the player/recorder processes started by radioactive.
+
+Every ffplay/ffmpeg child is written to a hidden file with its start time, so
+--kill and --status only look at processes radioactive owns, instead of
+scanning every process on the host. The start time guards against a pid that
+was reused by an unrelated process.
+"""
+
+import json
+import os.path
+import time
+from contextlib import contextmanager
+
+import psutil
+from zenlog import log
+
+from radioactive.metrics import CHILDREN_STARTED
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# create times are floats, allow for rounding
+CREATE_TIME_TOLERANCE = 0.05
+
+
+@contextmanager
+def file_lock(lock_path):
+    """serializes the read-modify-write of a file between processes"""
+    if fcntl is None:
+        yield
+        return
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class Registry:
+    def __init__(self):
+        self.registry_path = os.path.join(
+            os.path.expanduser("~"), ".radio-active-pids"
+        )
+        self.lock_path = self.registry_path + ".lock"
+
+    def locked(self):
+        return file_lock(self.lock_path)
+
+    def load(self):
+        try:
+            with open(self.registry_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            log.debug("Could not read the process registry: {}".format(e))
+            return {}
+
+    def save(self, entries):
+        try:
+            tmp_path = self.registry_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.registry_path)
+        except Exception as e:
+            log.debug("Could not save the process registry: {}".format(e))
+
+    def register(self, pid, kind, **info):
+        """records a child started by radioactive. kind is ffplay/ffmpeg"""
+        try:
+            create_time = psutil.Process(pid).create_time()
+        except psutil.Error:
+            # died already
+            return
+        CHILDREN_STARTED.labels(kind).inc()
+        entry = dict(info, kind=kind, create_time=create_time, owner=os.getpid())
+        with self.locked():
+            entries = self.load()
+            entries[str(pid)] = entry
+            self.save(entries)
+        log.debug("Registry: {} => PID {}".format(kind, pid))
+
+    def update(self, pid, **info):
+        """adds details to the entry of a registered child"""
+        with self.locked():
+            entries = self.load()
+            entry = entries.get(str(pid))
+            if entry is None:
+                return
+            entry.update(info)
+            self.save(entries)
+
+    def unregister(self, pid):
+        with self.locked():
+            entries = self.load()
+            if entries.pop(str(pid), None) is not None:
+                self.save(entries)
+
+    def children(self, kind=None):
+        """returns [(psutil.Process, entry)] of the live registered children
+        of a kind or a list of kinds, dead or reused pids are dropped from
+        the registry"""
+        kinds = [kind] if isinstance(kind, str) else kind
+        alive = []
+        with self.locked():
+            entries = self.load()
+            valid = {}
+            for pid, entry in entries.items():
+                try:
+                    process = psutil.Process(int(pid))
+                    same = (
+                        abs(process.create_time() - entry["create_time"])
+                        < CREATE_TIME_TOLERANCE
+                    )
+                except (psutil.Error, KeyError, ValueError):
+                    same = False
+                if not same:
+                    continue
+                valid[pid] = entry
+                if kind is None or entry.get("kind") in kinds:
+                    alive.append((process, entry))
+            if valid != entries:
+                self.save(valid)
+        return alive
+
+    def terminate(self, kind, timeout=3):
+        """stops the registered children of a kind or a list of kinds,
+        returns how many were stopped. there is no default: the recorders
+        and conversions of other processes must never be hit by accident"""
+        if not kind:
+            raise ValueError("terminate needs the kinds of children to stop")
+        children = self.children(kind)
+        for process, entry in children:
+            try:
+                process.terminate()
+                log.info(
+                    "Terminated {} process with PID {}".format(
+                        entry["kind"], process.pid
+                    )
+                )
+            except psutil.Error:
+                log.debug("Could not terminate PID {}".format(process.pid))
+
+        processes = [process for process, _ in children]
+        _, still_alive = psutil.wait_procs(processes, timeout=timeout)
+        for process in still_alive:
+            try:
+                process.kill()
+                log.debug("Forcefully killing PID {}".format(process.pid))
+            except psutil.Error:
+                pass
+
+        for process in processes:
+            self.unregister(process.pid)
+        return len(children)
+
+    def status(self):
+        """summary of the live children for --status"""
+        now = time.time()
+        return [
+            {
+                "pid": process.pid,
+                "kind": entry.get("kind"),
+                "station": entry.get("station", "N/A"),
+                "url": entry.get("url", ""),
+                "owner": entry.get("owner"),
+                "uptime": now - entry["create_time"],
+            }
+            for process, entry in self.children()
+        ]
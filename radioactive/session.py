@@ -0,0 +1,332 @@
+"""
+    HTTP session used for every radio-browser API call made during a run.
+    It keeps one pooled (keep-alive) adapter, applies connect/read timeouts,
+    retries idempotent requests with backoff and enforces a total latency budget
+"""
+
+import io
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+import requests_cache
+from requests.adapters import HTTPAdapter
+from requests_cache.policy import CacheActions
+from urllib3.util.retry import Retry
+from zenlog import log
+
+from radioactive.cache import (DEFAULT_CACHE_SIZE, DEFAULT_EXPIRY,
+                               ENDPOINT_EXPIRY, CachePolicy, cache_path)
+from radioactive.metrics import API_LATENCY, API_REQUESTS, API_RETRIES
+
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 10
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_POOL_SIZE = 10
+DEFAULT_BUDGET = 30  # seconds, 0 disables the budget
+
+# requests_cache logs a traceback every time it falls back to a stale response
+logging.getLogger("requests_cache").setLevel(logging.ERROR)
+
+# retry delays of the background refresh of stale responses
+REVALIDATE_DELAY = 5
+REVALIDATE_MAX_DELAY = 60
+
+# only these are safe to send again after a failure
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS"])
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# bodies read by iter_body() up to this size are stored in the cache, bigger
+# ones are not buffered
+STORE_LIMIT = 2 * 1024 * 1024
+
+
+def parse_timeout(value):
+    """parses '5' or '3,10' (connect,read) into a (connect, read) tuple"""
+    if value is None or str(value).strip() == "":
+        return DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+    parts = str(value).split(",")
+    try:
+        if len(parts) == 1:
+            timeout = float(parts[0])
+            return timeout, timeout
+        return float(parts[0]), float(parts[1])
+    except ValueError:
+        log.warning(
+            "Invalid timeout '{}', falling back to defaults".format(value)
+        )
+        return DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+
+
+def build_retry(retries, backoff):
+    kwargs = dict(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUS_CODES,
+        raise_on_status=False,
+    )
+    try:
+        return Retry(allowed_methods=IDEMPOTENT_METHODS, **kwargs)
+    except TypeError:
+        # urllib3 < 1.26 still calls it a whitelist
+        return Retry(method_whitelist=IDEMPOTENT_METHODS, **kwargs)
+
+
+class BudgetExceeded(requests.exceptions.Timeout):
+    """raised when a run has spent its total latency budget on the API"""
+
+
+class RadioSession(requests_cache.CachedSession):
+    """CachedSession that applies default timeouts and a total latency budget
+    to every request sent through it. The budget is the time spent waiting on
+    the API in the foreground, requests sent from background() are not counted.
+
+    When the API can not be reached an expired cached response is served
+    instead (stale-while-revalidate), and it is refreshed in the background
+    as soon as the API is reachable again
+    """
+
+    def __init__(self, *args, timeout=None, budget=DEFAULT_BUDGET, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timeout = timeout or (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+        self.budget = budget
+        self.spent = 0.0  # seconds spent on foreground requests
+        self.local = threading.local()
+        self.policy = None
+        self.stale_count = 0  # stale responses served so far
+        self.revalidate_lock = threading.Lock()
+        self.revalidate_pending = {}
+        self.revalidate_thread = None
+        self.plain = None
+
+    @contextmanager
+    def background(self):
+        """requests sent inside this block (in this thread) skip the budget"""
+        self.local.background = True
+        try:
+            yield self
+        finally:
+            self.local.background = False
+
+    def remaining_budget(self):
+        if not self.budget or getattr(self.local, "background", False):
+            return None
+        return self.budget - self.spent
+
+    def request(self, method, url, *args, **kwargs):
+        return self.send_timed(super().request, method, url, *args, **kwargs)
+
+    def send_timed(self, send, method, url, *args, **kwargs):
+        """sends with the timeouts and the budget, and counts the response"""
+        connect, read = kwargs.get("timeout") or self.timeout
+        remaining = self.remaining_budget()
+        if remaining is not None:
+            if remaining <= 0:
+                raise BudgetExceeded(
+                    "latency budget of {}s exhausted".format(self.budget)
+                )
+            connect, read = min(connect, remaining), min(read, remaining)
+        kwargs["timeout"] = (connect, read)
+
+        started = time.monotonic()
+        try:
+            response = send(method, url, *args, **kwargs)
+        except requests.exceptions.RequestException:
+            API_REQUESTS.labels("failed").inc()
+            API_LATENCY.observe(time.monotonic() - started)
+            raise
+        finally:
+            if remaining is not None:
+                self.spent += time.monotonic() - started
+        if self.policy is not None:
+            self.policy.record(response)
+        from_cache = getattr(response, "from_cache", False)
+        if from_cache and getattr(response, "is_expired", False):
+            API_REQUESTS.labels("stale").inc()
+            self.stale_count += 1
+            self.revalidate(method, url, kwargs)
+        elif from_cache:
+            API_REQUESTS.labels("cached").inc()
+        else:
+            API_REQUESTS.labels("ok" if response.ok else "error").inc()
+            API_LATENCY.observe(time.monotonic() - started)
+            retries = getattr(getattr(response, "raw", None), "retries", None)
+            if retries is not None and retries.history:
+                API_RETRIES.inc(len(retries.history))
+        return response
+
+    def plain_session(self):
+        """a session without the cache on the same connection pool. the cache
+        can not be turned off for one request, only for the whole session"""
+        if self.plain is None:
+            plain = requests.Session()
+            plain.adapters = self.adapters
+            plain.headers = self.headers
+            self.plain = plain
+        return self.plain
+
+    def lookup(self, url, params=None, headers=None):
+        """the cached response of a GET or None, not counted as a hit"""
+        request = self.prepare_request(
+            requests.Request("GET", url, params=params, headers=headers)
+        )
+        try:
+            return self.cache.get_response(self.cache.create_key(request))
+        except Exception as e:
+            log.debug("Error: {}".format(e))
+            return None
+
+    def replay(self, cached, chunk_size, stale=False):
+        if self.policy is not None:
+            self.policy.record(cached)
+        API_REQUESTS.labels("stale" if stale else "cached").inc()
+        return cached.iter_content(chunk_size=chunk_size)
+
+    def iter_body(self, url, params=None, headers=None, chunk_size=16384, cache=True):
+        """yields the body of a GET in chunks while it is still downloading.
+        a fresh cached response is replayed, a downloaded one up to
+        STORE_LIMIT is stored in the cache once it is complete. when the API
+        can not be reached an expired cached response is served, like
+        request() does. cache=False skips the cache, for bodies too big to
+        keep in it"""
+        cached = None
+        if cache:
+            cached = self.lookup(url, params=params, headers=headers)
+            if cached is not None and not cached.is_expired:
+                yield from self.replay(cached, chunk_size)
+                return
+
+        try:
+            # the body is read chunk by chunk, requests_cache would read it all
+            response = self.send_timed(
+                self.plain_session().request,
+                "GET",
+                url,
+                params=params,
+                headers=headers,
+                stream=True,
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            if cached is None:
+                raise
+            self.stale_count += 1
+            self.revalidate("GET", url, {"params": params, "headers": headers})
+            yield from self.replay(cached, chunk_size, stale=True)
+            return
+
+        limit = STORE_LIMIT
+        if self.policy is not None and self.policy.max_size:
+            limit = min(limit, self.policy.max_size)
+        body = io.BytesIO() if cache else None
+        with response:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if body is not None:
+                    body.write(chunk)
+                    if body.tell() > limit:
+                        body = None  # too big for the cache, stop buffering
+                yield chunk
+        if body is None:
+            return
+        # getvalue() hands over the buffer without copying it
+        response._content = body.getvalue()
+        del body
+        self.store(response)
+
+    def store(self, response):
+        """saves a response read by iter_body() in the cache"""
+        try:
+            key = self.cache.create_key(response.request)
+            actions = CacheActions.from_request(key, response.request, self.settings)
+            actions.update_from_response(response)
+            if not actions.skip_write:
+                self.cache.save_response(response, key, actions.expires)
+                if self.policy is not None:
+                    self.policy.touch(key)
+        except Exception as e:
+            log.debug("Could not cache {}: {}".format(response.url, e))
+
+    def revalidate(self, method, url, kwargs):
+        """queues a stale response to be refreshed in the background"""
+        params = kwargs.get("params")
+        key = self.cache.create_key(
+            requests.Request(method, url, params=params).prepare()
+        )
+        with self.revalidate_lock:
+            self.revalidate_pending[key] = (method, url, kwargs)
+            if self.revalidate_thread is None or not self.revalidate_thread.is_alive():
+                self.revalidate_thread = threading.Thread(
+                    target=self.revalidate_loop, name="revalidate"
+                )
+                self.revalidate_thread.daemon = True
+                self.revalidate_thread.start()
+
+    def revalidate_loop(self):
+        delay = REVALIDATE_DELAY
+        while True:
+            time.sleep(delay)
+            with self.revalidate_lock:
+                pending = list(self.revalidate_pending.items())
+            if not pending:
+                return
+            for key, (method, url, kwargs) in pending:
+                kwargs = dict(kwargs, timeout=self.timeout)
+                try:
+                    # bypasses the budget, nobody is waiting for this one
+                    response = super().request(
+                        method, url, force_refresh=True, **kwargs
+                    )
+                    response.raise_for_status()
+                except Exception as e:
+                    log.debug("API still unreachable: {}".format(e))
+                    break
+                log.debug("Refreshed stale response: {}".format(url))
+                with self.revalidate_lock:
+                    self.revalidate_pending.pop(key, None)
+            else:
+                delay = REVALIDATE_DELAY
+                continue
+            delay = min(delay * 2, REVALIDATE_MAX_DELAY)
+
+
+def build_session(
+    timeout=None,
+    retries=DEFAULT_RETRIES,
+    backoff=DEFAULT_BACKOFF,
+    pool_size=DEFAULT_POOL_SIZE,
+    budget=DEFAULT_BUDGET,
+    cache_size=DEFAULT_CACHE_SIZE,
+):
+    """creates the single session shared by all the API calls of a run,
+    timeout is a (connect, read) tuple as returned by parse_timeout"""
+    session = RadioSession(
+        cache_name=cache_path(),
+        backend="sqlite",
+        wal=True,  # several processes may share the cache
+        expire_after=DEFAULT_EXPIRY,
+        urls_expire_after=ENDPOINT_EXPIRY,
+        stale_if_error=True,  # serve the cache while the API is down
+        timeout=timeout,
+        budget=budget,
+    )
+    session.policy = CachePolicy(session.cache, max_size=cache_size)
+
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=build_retry(retries, backoff),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    log.debug(
+        "session: timeout={} retries={} pool={} budget={}".format(
+            session.timeout, retries, pool_size, budget
+        )
+    )
+    return session
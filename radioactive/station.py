@@ -0,0 +1,177 @@
+""" Typed station record returned by radioactive's library API """
+
+import json
+import sys
+from collections.abc import Mapping
+
+# the other fields of a radio-browser station record, in the order their
+# values are packed. fields the API adds later are packed with their name
+EXTRA_FIELDS = (
+    "changeuuid",
+    "serveruuid",
+    "homepage",
+    "favicon",
+    "iso_3166_2",
+    "languagecodes",
+    "lastchangetime",
+    "lastchangetime_iso8601",
+    "hls",
+    "lastchecktime",
+    "lastchecktime_iso8601",
+    "lastcheckoktime",
+    "lastcheckoktime_iso8601",
+    "lastlocalchecktime",
+    "lastlocalchecktime_iso8601",
+    "clicktimestamp",
+    "clicktimestamp_iso8601",
+    "clicktrend",
+    "ssl_error",
+    "geo_lat",
+    "geo_long",
+    "has_extended_info",
+)
+MISSING = object()
+
+
+def pack(rest):
+    """a bit mask of the EXTRA_FIELDS present, their values as a JSON array
+    and then a dict of the unknown fields"""
+    values = [rest.pop(key, MISSING) for key in EXTRA_FIELDS]
+    present = [value is not MISSING for value in values]
+    values = [value for value in values if value is not MISSING]
+    mask = sum(1 << bit for bit, flag in enumerate(present) if flag)
+    return json.dumps(
+        [mask, values, rest] if rest else [mask, values],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def unpack(extra):
+    if not extra:
+        return {}
+    packed = json.loads(extra.decode("utf-8"))
+    mask, values = packed[0], iter(packed[1])
+    fields = {
+        key: next(values) for bit, key in enumerate(EXTRA_FIELDS) if mask >> bit & 1
+    }
+    if len(packed) > 2:
+        fields.update(packed[2])
+    return fields
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def intern(value):
+    """the same country, codec or tag list is kept once for all stations"""
+    return sys.intern(value) if isinstance(value, str) else ""
+
+
+class Station(Mapping):
+
+    """A radio station. It is built from a radio-browser API record (or just a
+    stream URL) and can still be read like the API dict: station["name"]
+
+    Only the fields radioactive uses are attributes, the values shared by many
+    stations are interned. The other ~20 API fields (homepage, favicon, geo
+    position, check times ...) are packed into JSON bytes without their names
+    and decoded only when one of them is read.
+    """
+
+    __slots__ = (
+        "uuid",
+        "name",
+        "url",
+        "url_resolved",
+        "codec",
+        "bitrate",
+        "country",
+        "countrycode",
+        "state",
+        "language",
+        "tags",
+        "votes",
+        "clickcount",
+        "lastcheckok",
+        "extra",
+    )
+
+    # API field name -> attribute name, when they differ
+    ALIASES = {"stationuuid": "uuid"}
+    # the attributes that are API fields, by their API name
+    FIELDS = ("stationuuid",) + __slots__[1:-1]
+
+    def __init__(self, uuid="", name="", url="", url_resolved="", **fields):
+        self.uuid = uuid
+        self.name = name
+        self.url = url
+        # mostly the same URL, keep it once
+        self.url_resolved = url if url_resolved == url else url_resolved
+        self.codec = intern(fields.get("codec", ""))
+        self.bitrate = to_int(fields.get("bitrate"))
+        self.country = intern(fields.get("country", ""))
+        self.countrycode = intern(fields.get("countrycode", ""))
+        self.state = intern(fields.get("state", ""))
+        self.language = intern(fields.get("language", ""))
+        self.tags = intern(fields.get("tags", ""))
+        self.votes = to_int(fields.get("votes"))
+        self.clickcount = to_int(fields.get("clickcount"))
+        self.lastcheckok = bool(to_int(fields.get("lastcheckok", 1)))
+        self.extra = fields.get("extra") or b""
+
+    @classmethod
+    def from_api(cls, record):
+        """builds a station from a radio-browser API record"""
+        if isinstance(record, Station):
+            return record
+        fields = dict(record)
+        fields["uuid"] = fields.pop("stationuuid", "")
+        rest = {key: fields.pop(key) for key in record if key not in cls.FIELDS}
+        if rest:
+            fields["extra"] = pack(rest)
+        return cls(**fields)
+
+    @classmethod
+    def from_url(cls, url, name="N/A"):
+        return cls(name=name, url=url, url_resolved=url)
+
+    @property
+    def stream_url(self):
+        """the url to hand to the player"""
+        return self.url_resolved or self.url
+
+    @property
+    def raw(self):
+        """the full API record"""
+        return self.to_dict()
+
+    def extra_fields(self):
+        return unpack(self.extra)
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            value = getattr(self, self.ALIASES.get(key, key))
+            return int(value) if key == "lastcheckok" else value
+        return self.extra_fields()[key]
+
+    def __iter__(self):
+        yield from self.FIELDS
+        yield from self.extra_fields()
+
+    def __len__(self):
+        return len(self.FIELDS) + len(self.extra_fields())
+
+    def to_dict(self):
+        data = self.extra_fields()
+        data.update((key, self[key]) for key in self.FIELDS)
+        return data
+
+    def __repr__(self):
+        return "Station(name={!r}, uuid={!r}, url={!r})".format(
+            self.name, self.uuid, self.stream_url
+        )
@@ -0,0 +1,117 @@
+""" Remembers the stations resolved through the API, so a station that has been
+played before can still be started when radio-browser is unreachable """
+
+import json
+import os.path
+import threading
+import time
+
+from zenlog import log
+
+from radioactive.registry import file_lock
+
+# fields worth keeping from an API station record
+SNAPSHOT_FIELDS = [
+    "stationuuid",
+    "name",
+    "url",
+    "url_resolved",
+    "codec",
+    "bitrate",
+    "countrycode",
+    "tags",
+]
+
+# favorites play from their snapshot, snapshots older than this are refreshed
+SNAPSHOT_MAX_AGE = 24 * 60 * 60
+
+
+class StationStore:
+
+    """Keeps a small snapshot of every resolved station, keyed by its uuid.
+    The file it uses is a hidden file under users' home directory
+    """
+
+    def __init__(self):
+        self.stations = {}
+        self.lock = threading.Lock()
+        self.store_path = os.path.join(
+            os.path.expanduser("~"), ".radio-active-stations"
+        )
+        self.lock_path = self.store_path + ".lock"
+        self.load()
+
+    def load(self):
+        with file_lock(self.lock_path):
+            self.stations = self.read()
+
+    def read(self):
+        """the snapshots in the file, callers hold the file lock"""
+        try:
+            with open(self.store_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            log.debug("Could not read known stations: {}".format(e))
+            return {}
+
+    def save(self):
+        """the file is merged with what other processes saved meanwhile, the
+        most recently verified snapshot of a station wins"""
+        try:
+            with file_lock(self.lock_path):
+                on_disk = self.read()
+                with self.lock:
+                    for uuid, snapshot in on_disk.items():
+                        ours = self.stations.get(uuid, {})
+                        verified = snapshot.get("last_verified", 0)
+                        if verified > ours.get("last_verified", -1):
+                            self.stations[uuid] = snapshot
+                    data = json.dumps(self.stations)
+                tmp_path = self.store_path + ".tmp"
+                with open(tmp_path, "w") as f:
+                    f.write(data)
+                os.replace(tmp_path, self.store_path)
+        except Exception as e:
+            log.debug("Could not save known stations: {}".format(e))
+
+    def get(self, uuid):
+        return self.stations.get(uuid)
+
+    def stale(self, uuids, max_age=SNAPSHOT_MAX_AGE):
+        """the uuids without a snapshot or with one older than max_age"""
+        now = time.time()
+        with self.lock:
+            return [
+                uuid
+                for uuid in uuids
+                if now - self.stations.get(uuid, {}).get("last_verified", 0)
+                > max_age
+            ]
+
+    def remember(self, station):
+        """stores a snapshot of a station record returned by the API"""
+        self.remember_many([station])
+
+    def remember_many(self, stations):
+        """same as remember, the file is written once for all of them.
+        returns the uuids whose stream URL changed"""
+        now = time.time()
+        stored = False
+        changed = []
+        with self.lock:
+            for station in stations:
+                uuid = station.get("stationuuid")
+                if not uuid:
+                    continue
+                snapshot = {key: station.get(key) for key in SNAPSHOT_FIELDS}
+                snapshot["last_verified"] = now
+                old = self.stations.get(uuid)
+                if old is not None and old.get("url") != snapshot["url"]:
+                    changed.append(uuid)
+                self.stations[uuid] = snapshot
+                stored = True
+        if stored:
+            self.save()
+        return changed
@@ -0,0 +1,373 @@
+""" Boolean tag queries over a local inverted index.
+
+radio-browser keeps the tags of a station as one free-form, comma separated
+string ("Jazz,smooth-jazz, Smooth Jazz") and its tag filter is a substring
+match of a single tag. Here every tag is normalized and the index maps it to
+the sorted list of stations that have it (a posting list, an array of small
+integer station ids). A query like `jazz AND NOT smooth jazz` or
+`(rock OR metal) AND 80s` becomes set operations over those lists.
+
+The index is built from the whole station list (downloaded with the geo index)
+and kept up to date by every search: the stations whose tags changed are
+appended to a journal file, which is replayed on load and folded into the
+index once it grows.
+"""
+
+import heapq
+import json
+import os
+import os.path
+import re
+import time
+from array import array
+from bisect import bisect_left
+
+from zenlog import log
+
+from radioactive.cache import cache_dir
+from radioactive.errors import QueryError
+from radioactive.geo import INDEX_MAX_AGE
+
+INDEX_VERSION = 1
+# the journal is folded into the index file once it has this many entries
+JOURNAL_MAX_ENTRIES = 5000
+
+SEPARATORS = re.compile(r"[\s_\-]+")
+# words, quoted phrases, parentheses and the operators
+TOKEN = re.compile(r'"([^"]*)"|(\()|(\))|([&|!])|([^\s()&|!"]+)')
+OPERATORS = {"AND": "&", "OR": "|", "NOT": "!"}
+
+
+def index_path():
+    return os.path.join(cache_dir(), "tag_index.json")
+
+
+def journal_path():
+    return os.path.join(cache_dir(), "tag_index.journal")
+
+
+def normalize_tag(tag):
+    """Smooth-Jazz, smooth_jazz and "smooth  jazz " are one tag"""
+    return SEPARATORS.sub(" ", (tag or "").casefold()).strip(" #'")
+
+
+def to_votes(value):
+    return value if isinstance(value, int) else 0
+
+
+def split_tags(tags):
+    """the normalized tags of a radio-browser tags string, once each"""
+    found = []
+    for tag in (tags or "").split(","):
+        tag = normalize_tag(tag)
+        if tag and tag not in found:
+            found.append(tag)
+    return tuple(found)
+
+
+# --------------------------------- queries ---------------------------------- #
+def tokenize(query):
+    """the operators (AND OR NOT & | ! and parentheses) and the tags between
+    them. the words of a tag with spaces stay together: `smooth jazz AND 80s`
+    """
+    tokens = []
+    words = []
+
+    def end_tag():
+        if words:
+            tokens.append(("tag", normalize_tag(" ".join(words))))
+            del words[:]
+
+    for phrase, opening, closing, symbol, word in TOKEN.findall(query):
+        if opening or closing:
+            end_tag()
+            tokens.append((opening or closing, None))
+        elif symbol or word in OPERATORS:
+            end_tag()
+            tokens.append((symbol or OPERATORS[word], None))
+        elif phrase:
+            end_tag()
+            tokens.append(("tag", normalize_tag(phrase)))
+        else:
+            words.append(word)
+    end_tag()
+    return tokens
+
+
+class QueryParser:
+    """Turns the tokens into a tree of tuples:
+    ("tag", name), ("not", node), ("and", left, right), ("or", left, right).
+    NOT binds tighter than AND, AND tighter than OR. two tags in a row
+    without an operator are ANDed
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position][0]
+        return None
+
+    def take(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise QueryError("the tag query is empty")
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise QueryError("unexpected {!r} in the tag query".format(self.peek()))
+        return node
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.peek() == "|":
+            self.take()
+            node = ("or", node, self.parse_and())
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while self.peek() in ("&", "!", "(", "tag"):
+            if self.peek() == "&":
+                self.take()
+            node = ("and", node, self.parse_not())
+        return node
+
+    def parse_not(self):
+        if self.peek() == "!":
+            self.take()
+            return ("not", self.parse_not())
+        return self.parse_atom()
+
+    def parse_atom(self):
+        kind = self.peek()
+        if kind == "tag":
+            return self.take()
+        if kind == "(":
+            self.take()
+            node = self.parse_or()
+            if self.peek() != ")":
+                raise QueryError("a parenthesis is not closed in the tag query")
+            self.take()
+            return node
+        if kind is None:
+            raise QueryError("the tag query ends with an operator")
+        raise QueryError("unexpected {!r} in the tag query".format(kind))
+
+
+def parse_query(query):
+    return QueryParser(tokenize(query)).parse()
+
+
+# ---------------------------------- index ----------------------------------- #
+class TagIndex:
+    """Normalized tag -> posting list of station ids.
+
+    A station id is its position in `uuids`. A station that changes its tags
+    keeps its id and new stations get the next one, so new ids are appended
+    at the end of the posting lists and the lists stay sorted.
+
+    The posting lists are what is saved. The tags of each station (to undo
+    them when they change) are only worked out from them the first time a
+    station really changes, a search that sees the same tags again only
+    checks the posting lists.
+    """
+
+    def __init__(self):
+        self.uuids = []
+        self.ids = {}
+        self.votes = array("l")
+        self.tag_counts = array("H")
+        self.postings = {}
+        # tags of every station, None until needed (see tags_of)
+        self.doc_tags = []
+        self.built = time.time()
+        self.journal_entries = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def is_stale(self, max_age=INDEX_MAX_AGE):
+        return time.time() - self.built > max_age
+
+    def add_posting(self, tag, doc):
+        posting = self.postings.get(tag)
+        if posting is None:
+            self.postings[tag] = array("I", [doc])
+        elif posting[-1] < doc:
+            posting.append(doc)
+        else:
+            position = bisect_left(posting, doc)
+            if position == len(posting) or posting[position] != doc:
+                posting.insert(position, doc)
+
+    def has(self, tag, doc):
+        posting = self.postings.get(tag)
+        if posting is None:
+            return False
+        position = bisect_left(posting, doc)
+        return position < len(posting) and posting[position] == doc
+
+    def tags_of(self, doc):
+        if self.doc_tags is None:
+            doc_tags = [[] for _ in self.uuids]
+            for tag, posting in self.postings.items():
+                for index in posting:
+                    doc_tags[index].append(tag)
+            self.doc_tags = [tuple(tags) for tags in doc_tags]
+        return self.doc_tags[doc]
+
+    def remove_posting(self, tag, doc):
+        posting = self.postings.get(tag)
+        if posting is None:
+            return
+        position = bisect_left(posting, doc)
+        if position < len(posting) and posting[position] == doc:
+            del posting[position]
+        if not posting:
+            del self.postings[tag]
+
+    def set(self, uuid, tags, votes=0):
+        """adds a station or changes its tags, returns True when the index
+        changed"""
+        doc = self.ids.get(uuid)
+        if doc is None:
+            doc = len(self.uuids)
+            self.ids[uuid] = doc
+            self.uuids.append(uuid)
+            self.votes.append(0)
+            self.tag_counts.append(0)
+            if self.doc_tags is not None:
+                self.doc_tags.append(())
+        self.votes[doc] = votes
+        if len(tags) == self.tag_counts[doc] and all(
+            self.has(tag, doc) for tag in tags
+        ):
+            return False
+        for tag in set(self.tags_of(doc)) - set(tags):
+            self.remove_posting(tag, doc)
+        for tag in tags:
+            self.add_posting(tag, doc)
+        self.doc_tags[doc] = tags
+        self.tag_counts[doc] = len(tags)
+        return True
+
+    def update(self, stations):
+        """indexes station records, returns the ones that changed it"""
+        changed = []
+        for station in stations:
+            uuid = station.get("stationuuid")
+            if not uuid:
+                continue
+            tags = split_tags(station.get("tags"))
+            votes = to_votes(station.get("votes"))
+            if self.set(uuid, tags, votes):
+                changed.append((uuid, tags, votes))
+        return changed
+
+    # -------------------------------- queries ------------------------------- #
+    def evaluate(self, node):
+        """the set of station ids matching a parsed query"""
+        kind = node[0]
+        if kind == "tag":
+            return set(self.postings.get(node[1], ()))
+        if kind == "not":
+            return set(self.ids.values()) - self.evaluate(node[1])
+        left, right = node[1], node[2]
+        if kind == "and":
+            # x AND NOT y is a difference, no need to build NOT y
+            if right[0] == "not":
+                return self.evaluate(left) - self.evaluate(right[1])
+            if left[0] == "not":
+                return self.evaluate(right) - self.evaluate(left[1])
+            return self.evaluate(left) & self.evaluate(right)
+        return self.evaluate(left) | self.evaluate(right)
+
+    def query(self, query, limit=100):
+        """the uuids of the stations matching a tag query, most voted first"""
+        docs = self.evaluate(parse_query(query))
+        docs = heapq.nsmallest(limit, docs, key=lambda doc: (-self.votes[doc], doc))
+        return [self.uuids[doc] for doc in docs]
+
+    # --------------------------------- files -------------------------------- #
+    @classmethod
+    def load(cls):
+        """the saved index with its journal replayed, None when there is none"""
+        index = cls()
+        try:
+            with open(index_path(), "r") as f:
+                data = json.load(f)
+            if data.get("version") != INDEX_VERSION:
+                return None
+            index.uuids = data["uuids"]
+            index.ids = {uuid: doc for doc, uuid in enumerate(index.uuids)}
+            index.votes = array("l", data["votes"])
+            index.tag_counts = array("H", data["tag_counts"])
+            index.postings = {
+                tag: array("I", posting) for tag, posting in data["postings"].items()
+            }
+            index.doc_tags = None
+            index.built = data["built"]
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.debug("Could not read the tag index: {}".format(e))
+            return None
+        index.replay()
+        return index
+
+    def replay(self):
+        try:
+            with open(journal_path(), "r") as f:
+                for line in f:
+                    try:
+                        uuid, tags, votes = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by a crash
+                    self.set(uuid, tuple(tags), votes)
+                    self.journal_entries += 1
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log.debug("Could not read the tag journal: {}".format(e))
+        if self.journal_entries > JOURNAL_MAX_ENTRIES:
+            self.save()
+
+    def save(self):
+        """writes the whole index and empties the journal"""
+        data = {
+            "version": INDEX_VERSION,
+            "built": self.built,
+            "uuids": self.uuids,
+            "votes": list(self.votes),
+            "tag_counts": list(self.tag_counts),
+            "postings": {tag: list(posting) for tag, posting in self.postings.items()},
+        }
+        try:
+            tmp_path = index_path() + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, index_path())
+            if os.path.exists(journal_path()):
+                os.remove(journal_path())
+            self.journal_entries = 0
+        except Exception as e:
+            log.debug("Could not save the tag index: {}".format(e))
+
+
+def journal(changes):
+    """appends changed stations, as returned by TagIndex.update(), to the
+    journal. nothing is written before an index has been built"""
+    if not changes or not os.path.exists(index_path()):
+        return
+    try:
+        with open(journal_path(), "a") as f:
+            for change in changes:
+                f.write(json.dumps(change, separators=(",", ":")) + "\n")
+    except Exception as e:
+        log.debug("Could not write the tag journal: {}".format(e))
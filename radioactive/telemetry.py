@@ -0,0 +1,164 @@
+""" Resource telemetry of the player/recorder children.
+
+One Sampler polls every child in the process registry at a fixed interval.
+Each child is read inside psutil's oneshot(), so a sample costs one batched
+/proc read per child. The snapshot has the CPU%, RSS, I/O bytes and rates and
+the state transitions of each child, to size hosts running many streams.
+"""
+
+import threading
+import time
+
+import psutil
+from zenlog import log
+
+from radioactive.registry import Registry
+
+DEFAULT_SAMPLE_INTERVAL = 1.0
+# state transitions kept per child
+MAX_TRANSITIONS = 20
+
+
+def read_process(process):
+    """one batched read of the counters of a child"""
+    with process.oneshot():
+        cpu = process.cpu_times()
+        sample = {
+            "status": process.status(),
+            "cpu_time": cpu.user + cpu.system,
+            "rss": process.memory_info().rss,
+            "read_bytes": 0,
+            "write_bytes": 0,
+        }
+        try:
+            io = process.io_counters()
+            # read_chars/write_chars count the socket traffic too (Linux)
+            sample["read_bytes"] = getattr(io, "read_chars", io.read_bytes)
+            sample["write_bytes"] = getattr(io, "write_chars", io.write_bytes)
+        except (psutil.AccessDenied, AttributeError, NotImplementedError):
+            pass
+    return sample
+
+
+class ChildStats:
+    """the latest counters and derived rates of one child"""
+
+    def __init__(self, process, entry):
+        self.process = process
+        self.entry = entry
+        self.sampled_at = None
+        self.last = None
+        self.cpu_percent = 0.0
+        self.read_rate = 0.0
+        self.write_rate = 0.0
+        self.transitions = []
+
+    def update(self, sample, now):
+        last = self.last
+        if last is not None:
+            elapsed = now - self.sampled_at
+            if elapsed > 0:
+                cpu_time = sample["cpu_time"] - last["cpu_time"]
+                read_bytes = sample["read_bytes"] - last["read_bytes"]
+                write_bytes = sample["write_bytes"] - last["write_bytes"]
+                self.cpu_percent = 100 * cpu_time / elapsed
+                self.read_rate = read_bytes / elapsed
+                self.write_rate = write_bytes / elapsed
+            if sample["status"] != last["status"]:
+                self.transition(last["status"], sample["status"], now)
+        self.last = sample
+        self.sampled_at = now
+
+    def transition(self, old, new, when):
+        self.transitions.append({"time": when, "from": old, "to": new})
+        del self.transitions[:-MAX_TRANSITIONS]
+
+    def to_dict(self):
+        sample = self.last or {}
+        return {
+            "pid": self.process.pid,
+            "kind": self.entry.get("kind"),
+            "station": self.entry.get("station", "N/A"),
+            "status": sample.get("status"),
+            "uptime": time.time() - self.entry.get("create_time", time.time()),
+            "cpu_percent": round(self.cpu_percent, 1),
+            "rss": sample.get("rss", 0),
+            "read_bytes": sample.get("read_bytes", 0),
+            "write_bytes": sample.get("write_bytes", 0),
+            "read_rate": round(self.read_rate),
+            "write_rate": round(self.write_rate),
+            "transitions": list(self.transitions),
+            # copied to the registry by the owner, see radioactive.progress
+            "progress": self.entry.get("progress"),
+            "sampled_at": self.sampled_at,
+        }
+
+
+class Sampler:
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL, registry=None):
+        self.interval = interval
+        self.registry = registry or Registry()
+        self.children = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        """reads every registered child once"""
+        now = time.time()
+        seen = set()
+        for process, entry in self.registry.children():
+            key = (process.pid, entry.get("create_time"))
+            seen.add(key)
+            with self.lock:
+                stats = self.children.get(key)
+            if stats is None:
+                # keep the psutil.Process, it caches the static details
+                stats = ChildStats(process, entry)
+            stats.entry = entry
+            try:
+                sample = read_process(stats.process)
+            except psutil.Error as e:
+                log.debug("Error: {}".format(e))
+                continue
+            stats.update(sample, now)
+            with self.lock:
+                self.children[key] = stats
+
+        with self.lock:
+            # the registry already dropped the children that exited
+            for key in list(self.children):
+                if key not in seen:
+                    del self.children[key]
+
+    def snapshot(self):
+        """the latest stats of every child, as plain dicts"""
+        with self.lock:
+            return [stats.to_dict() for stats in self.children.values()]
+
+    def get(self, pid):
+        for child in self.snapshot():
+            if child["pid"] == pid:
+                return child
+        return None
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                log.debug("Error: {}".format(e))
+            self.stopped.wait(self.interval)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.interval + 1)
+            self.thread = None
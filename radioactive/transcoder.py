@@ -0,0 +1,297 @@
+""" Conversion of finished recordings to mp3/opus.
+
+Recordings are always captured with a stream copy, which costs almost no CPU.
+When another format was asked for, a job is written to a queue file and a
+small pool of niced ffmpeg workers converts it afterwards. The queue lives in
+a hidden file, so jobs left over when radioactive quits are picked up by the
+next run (or by `radio --transcode`).
+"""
+
+import atexit
+import json
+import os
+import os.path
+import subprocess
+import threading
+import time
+from shutil import which
+
+import psutil
+from zenlog import log
+
+from radioactive.library import Library
+from radioactive.registry import CREATE_TIME_TOLERANCE, Registry, file_lock
+
+DEFAULT_TRANSCODE_WORKERS = 2
+MAX_ATTEMPTS = 3
+POLL_INTERVAL = 5
+NICENESS = 10
+
+# target format => ffmpeg audio options
+TARGET_FORMATS = {
+    "mp3": ["-c:a", "libmp3lame", "-q:a", "2"],
+    "opus": ["-c:a", "libopus", "-b:a", "96k"],
+}
+
+# stream codec (as ffprobe or the radio-browser API name it) => extension of
+# a stream-copy capture
+CAPTURE_EXTENSIONS = {
+    "mp3": "mp3",
+    "aac": "aac",
+    "aac+": "aac",
+    "opus": "opus",
+    "vorbis": "ogg",
+    "ogg": "ogg",
+    "flac": "flac",
+}
+# matroska takes any codec
+FALLBACK_EXTENSION = "mka"
+
+
+def capture_extension(codec):
+    return CAPTURE_EXTENSIONS.get((codec or "").lower(), FALLBACK_EXTENSION)
+
+
+def transcode_command(source, target, fmt):
+    return (
+        ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y"]
+        + ["-i", source, "-vn"]
+        + TARGET_FORMATS[fmt]
+        + [target]
+    )
+
+
+def lower_priority(pid):
+    """the conversion must never starve a live capture. set after the spawn,
+    a preexec_fn is not safe with the worker threads running"""
+    if os.name != "posix":
+        return
+    try:
+        process = psutil.Process(pid)
+        process.nice(process.nice() + NICENESS)
+    except psutil.Error as e:
+        log.debug("Error: {}".format(e))
+
+
+def owner_alive(job):
+    """the process that claimed a job still runs. the start time guards
+    against a pid reused by an unrelated process"""
+    if not job.get("owner"):
+        return False
+    try:
+        process = psutil.Process(job["owner"])
+        return (
+            abs(process.create_time() - job.get("owner_created", 0))
+            < CREATE_TIME_TOLERANCE
+        )
+    except psutil.Error:
+        return False
+
+
+class TranscodeQueue:
+    """The persistent job list, shared by every radioactive process"""
+
+    def __init__(self):
+        self.queue_path = os.path.join(
+            os.path.expanduser("~"), ".radio-active-transcodes"
+        )
+        self.lock_path = self.queue_path + ".lock"
+
+    def load(self):
+        try:
+            with open(self.queue_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except Exception as e:
+            log.debug("Could not read the transcode queue: {}".format(e))
+            return []
+
+    def save(self, jobs):
+        try:
+            tmp_path = self.queue_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(jobs, f, indent=1)
+            os.replace(tmp_path, self.queue_path)
+        except Exception as e:
+            log.debug("Could not save the transcode queue: {}".format(e))
+
+    def add(self, source, target, fmt):
+        if fmt not in TARGET_FORMATS:
+            raise ValueError("can not convert to {}".format(fmt))
+        job = {
+            "source": source,
+            "target": target,
+            "format": fmt,
+            "status": "pending",
+            "attempts": 0,
+            "owner": None,
+            "added": time.time(),
+        }
+        with file_lock(self.lock_path):
+            jobs = self.load()
+            jobs.append(job)
+            self.save(jobs)
+        log.debug("Transcode: queued {} => {}".format(source, target))
+        return job
+
+    def claim(self):
+        """marks the oldest pending job as running by this process"""
+        with file_lock(self.lock_path):
+            jobs = self.load()
+            for job in jobs:
+                if job["status"] == "running" and not owner_alive(job):
+                    # its process died, run it again
+                    job["status"] = "pending"
+            for job in jobs:
+                if job["status"] == "pending":
+                    job["status"] = "running"
+                    job["owner"] = os.getpid()
+                    job["owner_created"] = psutil.Process().create_time()
+                    job["attempts"] += 1
+                    self.save(jobs)
+                    return dict(job)
+            self.save(jobs)
+        return None
+
+    def update(self, claimed, **changes):
+        with file_lock(self.lock_path):
+            jobs = self.load()
+            for job in jobs:
+                if job["source"] == claimed["source"]:
+                    job.update(changes)
+            # finished jobs are dropped, failed ones are kept for --transcode
+            jobs = [job for job in jobs if job["status"] != "done"]
+            self.save(jobs)
+
+    def release(self, pid=None):
+        """puts the jobs of a process that is quitting back to pending"""
+        pid = pid or os.getpid()
+        with file_lock(self.lock_path):
+            jobs = self.load()
+            for job in jobs:
+                if job["status"] == "running" and job["owner"] == pid:
+                    job["status"] = "pending"
+                    job["attempts"] -= 1
+            self.save(jobs)
+
+    def pending(self):
+        return [job for job in self.load() if job["status"] != "failed"]
+
+
+class Transcoder:
+    """A bounded pool of workers converting the queued recordings"""
+
+    def __init__(self, workers=DEFAULT_TRANSCODE_WORKERS, queue=None):
+        self.workers = max(1, workers)
+        self.queue = queue or TranscodeQueue()
+        self.registry = Registry()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.threads = []
+        self.processes = {}
+        self.lock = threading.Lock()
+        self.idle = 0
+
+    def submit(self, source, target, fmt):
+        job = self.queue.add(source, target, fmt)
+        self.start()
+        self.wakeup.set()
+        return job
+
+    def start(self):
+        if self.threads:
+            return self
+        if which("ffmpeg") is None:
+            log.warning("FFmpeg not found, recordings will be converted later")
+            return self
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self.work)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        atexit.register(self.stop)
+        return self
+
+    def work(self):
+        while not self.stopped.is_set():
+            job = self.queue.claim()
+            if job is None:
+                with self.lock:
+                    self.idle += 1
+                self.wakeup.wait(POLL_INTERVAL)
+                self.wakeup.clear()
+                with self.lock:
+                    self.idle -= 1
+                continue
+            self.convert(job)
+
+    def convert(self, job):
+        source, target = job["source"], job["target"]
+        tmp_target = "{}.part.{}".format(os.path.splitext(target)[0], job["format"])
+        command = transcode_command(source, tmp_target, job["format"])
+        try:
+            process = subprocess.Popen(
+                command,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+        except OSError as e:
+            log.debug("Error: {}".format(e))
+            self.queue.update(job, status="pending", owner=None)
+            return
+        lower_priority(process.pid)
+        with self.lock:
+            self.processes[process.pid] = process
+        self.registry.register(process.pid, "transcode", path=target)
+        try:
+            _, errors = process.communicate()
+        finally:
+            self.registry.unregister(process.pid)
+            with self.lock:
+                self.processes.pop(process.pid, None)
+
+        if self.stopped.is_set():
+            # interrupted, release() puts it back
+            if os.path.exists(tmp_target):
+                os.remove(tmp_target)
+            return
+        if process.returncode == 0:
+            os.replace(tmp_target, target)
+            os.remove(source)
+            self.queue.update(job, status="done")
+            Library().converted(source, target, os.path.getsize(target))
+            log.info("Recording converted: {}".format(target))
+            return
+
+        log.debug("Transcode: {} failed: {}".format(source, errors.strip()))
+        if os.path.exists(tmp_target):
+            os.remove(tmp_target)
+        if job["attempts"] >= MAX_ATTEMPTS:
+            log.error("Could not convert {}, it is kept as is".format(source))
+            self.queue.update(job, status="failed", owner=None)
+        else:
+            self.queue.update(job, status="pending", owner=None)
+
+    def drain(self):
+        """runs until the queue is empty, for `radio --transcode`"""
+        self.start()
+        while self.threads and not self.stopped.is_set():
+            with self.lock:
+                busy = self.processes or self.idle < len(self.threads)
+            if not busy and not self.queue.pending():
+                break
+            time.sleep(0.5)
+        self.stop()
+
+    def stop(self):
+        """ends the running conversions, their jobs are redone next time"""
+        self.stopped.set()
+        self.wakeup.set()
+        with self.lock:
+            processes = list(self.processes.values())
+        for process in processes:
+            process.terminate()
+        self.queue.release()
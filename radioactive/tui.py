@@ -0,0 +1,306 @@
+""" Terminal interface of the listen loop.
+
+While a station plays, single keys (no Enter needed) run the commands and a
+status line at the bottom of the terminal shows the elapsed time, the bitrate,
+the audio buffered by the player and for next/previous and the title that is
+playing.
+
+It runs on an asyncio loop: a key is read when the terminal has one
+(loop.add_reader) and the status line is redrawn once a second for the clock,
+or when a new title comes in, but never more often than REDRAW_INTERVAL. The
+loop sleeps in between, an idle player costs next to no CPU.
+
+Windows, or a stdin that is not a terminal, keeps the line based prompt of
+handle_listen_keypress.
+"""
+
+import asyncio
+import os
+import shutil
+import signal
+import sys
+import time
+from contextlib import contextmanager
+
+from zenlog import log
+
+from radioactive.cache import human_size
+from radioactive.library import IcyReader
+
+try:
+    import termios
+    import tty
+except ImportError:  # Windows
+    termios = tty = None
+
+# at most one redraw in this many seconds
+REDRAW_INTERVAL = 0.25
+# the clock of the status line
+TICK_INTERVAL = 1.0
+
+CLEAR_LINE = "\r\x1b[K"
+
+
+def tui_supported(stdin=None, stdout=None):
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    return termios is not None and stdin.isatty() and stdout.isatty()
+
+
+def format_elapsed(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return "{:02d}:{:02d}:{:02d}".format(hours, rest // 60, rest % 60)
+
+
+def to_kbps(value):
+    try:
+        return int(str(value).split(",")[0])
+    except (TypeError, ValueError):
+        return 0
+
+
+class NowPlaying:
+
+    """What the status line shows about the station that plays. With
+    track_titles the title comes from a second connection to the stream
+    (see IcyReader), the buffer from the statistics of the player (see
+    radioactive.progress)
+    """
+
+    def __init__(self, on_change=None, zapper=None, progress=None, track_titles=False):
+        self.on_change = on_change
+        self.zapper = zapper
+        # returns the Progress of the player that runs now
+        self.progress = progress
+        # the connection downloads the audio too and counts as a listener
+        self.track_titles = track_titles
+        self.station_name = ""
+        self.station = None
+        self.started = time.time()
+        self.title = ""
+        self.icy = None
+
+    def play(self, station_name, url, station=None):
+        """a station (re)starts playing, station is its API record if known"""
+        self.stop()
+        self.station_name = station_name
+        self.station = station
+        self.started = time.time()
+        self.title = ""
+        if self.track_titles:
+            self.icy = IcyReader(url, self.on_title).start()
+        self.changed()
+
+    def stop(self):
+        if self.icy is not None:
+            self.icy.stop()
+            self.icy = None
+
+    def on_title(self, title):
+        self.title = title
+        self.changed()
+
+    def changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def stats(self):
+        progress = self.progress() if self.progress is not None else None
+        return progress.to_dict() if progress is not None else {}
+
+    def bitrate(self, stats):
+        """kbps announced by the stream, else the one of the station record
+        or the one measured by an ffmpeg player"""
+        if self.icy is not None and self.icy.headers.get("icy-br"):
+            return to_kbps(self.icy.headers.get("icy-br"))
+        if self.station and to_kbps(self.station.get("bitrate")):
+            return to_kbps(self.station.get("bitrate"))
+        return int(stats.get("bitrate") or 0)
+
+    def buffered(self):
+        """(ready, bytes) of the next/previous stations kept warm"""
+        if self.zapper is None:
+            return 0, 0
+        streams = [s for s in list(self.zapper.streams.values()) if s.ready]
+        return len(streams), sum(s.buffered for s in streams)
+
+    def fields(self):
+        fields = [format_elapsed(time.time() - self.started)]
+        stats = self.stats()
+        bitrate = self.bitrate(stats)
+        codec = self.station.get("codec") if self.station else ""
+        if bitrate or codec:
+            fields.append(
+                " ".join(
+                    part
+                    for part in ("{} kbps".format(bitrate) if bitrate else "", codec)
+                    if part
+                )
+            )
+        if stats.get("buffer") is not None:
+            fields.append("buffer {}".format(human_size(stats["buffer"])))
+        if stats.get("errors"):
+            fields.append("{} errors".format(stats["errors"]))
+        ready, size = self.buffered()
+        if ready:
+            fields.append("warm {} ({})".format(ready, human_size(size)))
+        fields.append(self.title or self.station_name)
+        return fields
+
+    def render(self, width):
+        line = " | ".join(self.fields())
+        return line if len(line) < width else line[: max(0, width - 2)] + "…"
+
+
+class ListenUI:
+
+    """Single key commands and the status line. commands maps a key to a
+    function, which runs with the terminal back in its normal mode so it can
+    print and ask for input. A command returning False ends the UI
+    """
+
+    def __init__(self, now_playing, commands, stdin=None, stdout=None):
+        self.now_playing = now_playing
+        self.now_playing.on_change = self.changed
+        self.commands = commands
+        self.stdin = stdin or sys.stdin
+        self.stdout = stdout or sys.stdout
+        self.fd = self.stdin.fileno()
+        self.saved_mode = None
+        self.loop = None
+        self.ticker = None
+        self.keys = None
+        self.redraw_handle = None
+        self.last_redraw = 0.0
+        self.last_line = None
+        self.paused = False
+
+    def run(self):
+        # python 3.6 has no asyncio.run
+        loop = asyncio.new_event_loop()
+        main = loop.create_task(self.main(loop))
+        try:
+            loop.run_until_complete(main)
+        finally:
+            # ctrl+c or a command quitting leave tasks behind, they still
+            # have to clean up before the terminal is restored
+            for task in (main, self.ticker):
+                if task is not None and not task.done():
+                    task.cancel()
+                    try:
+                        loop.run_until_complete(task)
+                    except (asyncio.CancelledError, Exception):
+                        pass
+            self.restore()
+            self.now_playing.stop()
+            loop.close()
+
+    async def main(self, loop):
+        self.loop = loop
+        self.keys = asyncio.Queue()
+        self.cbreak()
+        loop.add_reader(self.fd, self.on_input)
+        loop.add_signal_handler(signal.SIGWINCH, self.changed)
+        self.ticker = loop.create_task(self.tick())
+        try:
+            while True:
+                key = await self.keys.get()
+                if key is None:
+                    return  # stdin is closed
+                command = self.commands.get(key)
+                if command is None:
+                    continue
+                with self.suspended():
+                    keep_going = command()
+                if keep_going is False:
+                    return
+        finally:
+            self.paused = True
+            self.ticker.cancel()
+            loop.remove_signal_handler(signal.SIGWINCH)
+            loop.remove_reader(self.fd)
+            self.clear()
+
+    # ------------------------------- terminal ------------------------------- #
+    def cbreak(self):
+        """keys arrive one by one and are not echoed, ctrl+c still works"""
+        if self.saved_mode is None:
+            self.saved_mode = termios.tcgetattr(self.fd)
+        tty.setcbreak(self.fd)
+
+    def restore(self):
+        if self.saved_mode is not None:
+            termios.tcsetattr(self.fd, termios.TCSADRAIN, self.saved_mode)
+
+    @contextmanager
+    def suspended(self):
+        """the terminal as the commands expect it: lines, echo, no status"""
+        self.paused = True
+        self.clear()
+        self.loop.remove_reader(self.fd)
+        self.restore()
+        # a command that fails or quits leaves the terminal as it is
+        yield
+        self.cbreak()
+        self.loop.add_reader(self.fd, self.on_input)
+        self.paused = False
+        self.changed()
+
+    def on_input(self):
+        try:
+            data = os.read(self.fd, 64).decode("utf-8", "ignore")
+        except OSError as e:
+            log.debug("Error: {}".format(e))
+            data = ""
+        if not data:
+            self.loop.remove_reader(self.fd)
+            self.keys.put_nowait(None)
+            return
+        if data.startswith("\x1b"):
+            return  # arrow and function keys
+        for key in data:
+            self.keys.put_nowait(key)
+
+    # -------------------------------- status -------------------------------- #
+    async def tick(self):
+        while True:
+            self.changed()
+            await asyncio.sleep(TICK_INTERVAL)
+
+    def changed(self):
+        """asks for a redraw, from any thread. redraws are throttled"""
+        if self.loop is None or self.loop.is_closed():
+            return
+        try:
+            self.loop.call_soon_threadsafe(self.schedule_redraw)
+        except RuntimeError:
+            pass  # the loop was closed meanwhile
+
+    def schedule_redraw(self):
+        if self.redraw_handle is not None:
+            return
+        delay = max(0.0, self.last_redraw + REDRAW_INTERVAL - time.monotonic())
+        self.redraw_handle = self.loop.call_later(delay, self.redraw)
+
+    def redraw(self):
+        self.redraw_handle = None
+        if self.paused:
+            return
+        self.last_redraw = time.monotonic()
+        width = shutil.get_terminal_size().columns
+        line = self.now_playing.render(width)
+        if line == self.last_line:
+            return
+        self.last_line = line
+        self.stdout.write(CLEAR_LINE + line)
+        self.stdout.flush()
+
+    def clear(self):
+        if self.redraw_handle is not None:
+            self.redraw_handle.cancel()
+            self.redraw_handle = None
+        if self.last_line is not None:
+            self.stdout.write(CLEAR_LINE)
+            self.stdout.flush()
+        self.last_line = None
@@ -1,8 +1,10 @@
 """Handler functions for __main__.py"""
 
 import datetime
+import json
 import os
 import sys
+import time
 
 from pick import pick
 from rich import print
@@ -12,9 +14,25 @@ from rich.table import Table
 from rich.text import Text
 from zenlog import log
 
+from radioactive.cache import human_size
+from radioactive.errors import (APIError, QueryError, RadioactiveError,
+                                StationNotFound)
 from radioactive.last_station import Last_station
+from radioactive.library import Library, RecordingMonitor
 from radioactive.player import kill_background_ffplays
-from radioactive.recorder import record_audio_auto_codec, record_audio_from_url
+from radioactive.playlist import read_playlist, write_playlist
+from radioactive.prefetch import DEFAULT_PREFETCH, Prefetcher
+from radioactive.progress import describe
+from radioactive.recorder import (record_audio_auto_codec, record_audio_from_url,
+                                  recording_name)
+from radioactive.telemetry import DEFAULT_SAMPLE_INTERVAL, Sampler
+from radioactive.transcoder import (CAPTURE_EXTENSIONS,
+                                    DEFAULT_TRANSCODE_WORKERS, TARGET_FORMATS,
+                                    TranscodeQueue, Transcoder,
+                                    capture_extension)
+from radioactive.tui import ListenUI, NowPlaying, tui_supported
+from radioactive.zapper import (DEFAULT_WARM, Zapper, zap_list_from_favorites,
+                                zap_list_from_results)
 
 RED_COLOR = "\033[91m"
 END_COLOR = "\033[0m"
@@ -34,30 +52,34 @@ def handle_record(
     curr_station_name,
     record_file_path,
     record_file,
-    record_file_format,  # auto/mp3
+    record_file_format,  # auto/mp3/opus
     loglevel,
+    transcoder=None,
+    station_uuid="",
+    codec="",
+    track_titles=False,
 ):
+    """records a stream as it is, codec is the one the API lists for the
+    station. the stream is probed (ffprobe) only when that one is unknown.
+    track_titles indexes the titles the station announces, over a second
+    connection to the stream"""
     log.info("Press 'q' to stop recording")
-    force_mp3 = False
 
-    if record_file_format != "mp3" and record_file_format != "auto":
+    if record_file_format not in ["auto"] + list(TARGET_FORMATS):
         record_file_format = "mp3"  # default to mp3
         log.debug("Error: wrong codec supplied!. falling back to mp3")
-        force_mp3 = True
-    elif record_file_format == "auto":
+
+    # the stream is captured as it is, a conversion runs afterwards
+    if (codec or "").lower() not in CAPTURE_EXTENSIONS:
         log.debug("Codec: fetching stream codec")
-        codec = record_audio_auto_codec(target_url)
-        if codec is None:
-            record_file_format = "mp3"  # default to mp3
-            force_mp3 = True
-            log.debug("Error: could not detect codec. falling back to mp3")
-        else:
-            record_file_format = codec
-            log.debug("Codec: found {}".format(codec))
-    elif record_file_format == "mp3":
-        # always save to mp3 to eliminate any runtime issues
-        # it is better to leave it on libmp3lame
-        force_mp3 = True
+        codec = record_audio_auto_codec(target_url) or codec
+    capture_format = capture_extension(codec)
+    log.debug("Codec: found {}, capturing as {}".format(codec, capture_format))
+    if record_file_format == "auto" or record_file_format == capture_format:
+        record_file_format = capture_format
+        convert = False
+    else:
+        convert = True
 
     if record_file_path and not os.path.exists(record_file_path):
         log.debug("filepath: {}".format(record_file_path))
@@ -73,28 +95,159 @@ def handle_record(
             log.error("Could not make default directory")
             sys.exit(1)
 
-    now = datetime.datetime.now()
-    month_name = now.strftime("%b").upper()
-    # Format AM/PM as 'AM' or 'PM'
-    am_pm = now.strftime("%p")
-
-    # format is : day-monthname-year@hour-minute-second-(AM/PM)
-    formatted_date_time = now.strftime(f"%d-{month_name}-%Y@%I-%M-%S-{am_pm}")
-
-    if not record_file_format.strip():
-        record_file_format = "mp3"
-
     if not record_file:
-        record_file = "{}-{}".format(
-            curr_station_name.strip(), formatted_date_time
-        ).replace(" ", "-")
+        record_file = recording_name(curr_station_name)
 
     tmp_filename = f"{record_file}.{record_file_format}"
     outfile_path = os.path.join(record_file_path, tmp_filename)
+    capture_path = outfile_path
+    if convert:
+        capture_path = os.path.join(record_file_path, f"{record_file}.{capture_format}")
 
     log.info(f"Recording will be saved as: \n{outfile_path}")
 
-    record_audio_from_url(target_url, outfile_path, force_mp3, loglevel)
+    # the library index follows the recording while it is written
+    library = Library()
+    recording = library.start(
+        capture_path, curr_station_name.strip(), station_uuid, target_url, codec
+    )
+    title_url = target_url if track_titles else None
+    monitor = RecordingMonitor(library, recording, capture_path, title_url).start()
+    recorded = record_audio_from_url(target_url, capture_path, loglevel)
+    monitor.stop(recorded)
+    if not recorded:
+        return
+    if convert:
+        if transcoder is None:
+            transcoder = Transcoder()
+        transcoder.submit(capture_path, outfile_path, record_file_format)
+        log.info("Converting to {} in the background".format(record_file_format))
+
+
+def handle_transcode(workers=DEFAULT_TRANSCODE_WORKERS):
+    """converts the queued recordings in the foreground"""
+    queue = TranscodeQueue()
+    jobs = queue.pending()
+    if not jobs:
+        log.info("No recordings waiting to be converted")
+    else:
+        log.info("Converting {} recordings".format(len(jobs)))
+        Transcoder(workers, queue).drain()
+    for job in queue.load():
+        if job["status"] == "failed":
+            log.warning("Could not convert: {}".format(job["source"]))
+
+
+def close_stdout():
+    """the reader of stdout went away (e.g. piped into head). stdout is
+    pointed at devnull, else python reports the broken pipe again when it
+    flushes stdout at exit"""
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+    sys.exit(1)
+
+
+def handle_json_output(handler, options):
+    """streams the full station records of a search/discovery as NDJSON
+    to stdout, one station per line. returns the exit code
+    """
+    limit = options["limit"]
+    if options["discover_near"]:
+        return write_nearby_json(handler, options)
+    if options["discover_tags"]:
+        return write_tag_query_json(handler, options)
+    if options["discover_country_code"]:
+        country = options["discover_country_code"].strip()
+        if len(country) == 2:
+            params = {"countrycode": country}
+        else:
+            try:
+                code = handler.find_country_code(country)
+            except StationNotFound:
+                log.error("Not a valid country name")
+                return 1
+            except RadioactiveError as e:
+                log.debug("Error: {}".format(e))
+                log.error("Something went wrong. please try again.")
+                return 1
+            params = {"countrycode": code, "country_exact": True}
+    elif options["discover_state"]:
+        params = {"state": options["discover_state"]}
+    elif options["discover_language"]:
+        params = {"language": options["discover_language"]}
+    elif options["discover_tag"]:
+        params = {"tag": options["discover_tag"]}
+    elif options["search_station_name"] is not None:
+        params = {"name": options["search_station_name"], "name_exact": False}
+    else:
+        log.error(
+            "--json needs --search, --country, --state, --language, --tag, "
+            "--tags or --near"
+        )
+        return 1
+
+    count = 0
+    try:
+        for station in handler.stream_search(limit=limit, **params):
+            sys.stdout.write(json.dumps(station, ensure_ascii=False))
+            sys.stdout.write("\n")
+            count += 1
+        sys.stdout.flush()
+    except BrokenPipeError:
+        close_stdout()
+    except Exception as e:
+        log.debug("Error: {}".format(e))
+        log.error("Something went wrong. please try again.")
+        return 1
+
+    log.debug("Streamed {} stations".format(count))
+    return 0
+
+
+def write_tag_query_json(handler, options):
+    """--json for --tags"""
+    try:
+        stations = handler.find_by_tags(options["discover_tags"], options["limit"])
+    except QueryError as e:
+        log.error("Invalid tag query: {}".format(e))
+        return 1
+    except RadioactiveError as e:
+        log.debug("Error: {}".format(e))
+        log.error("Something went wrong. please try again.")
+        return 1
+    try:
+        for station in stations:
+            sys.stdout.write(json.dumps(station.to_dict(), ensure_ascii=False))
+            sys.stdout.write("\n")
+        sys.stdout.flush()
+    except BrokenPipeError:
+        close_stdout()
+    return 0
+
+
+def write_nearby_json(handler, options):
+    """--json for --near, the records get their distance in km"""
+    try:
+        nearby = handler.find_nearby(
+            options["discover_near"], options["radius"], options["limit"]
+        )
+    except StationNotFound:
+        log.error("Unknown place, use a city, state, country or lat,lon")
+        return 1
+    except RadioactiveError as e:
+        log.debug("Error: {}".format(e))
+        log.error("Something went wrong. please try again.")
+        return 1
+    try:
+        for station, km in nearby:
+            record = station.to_dict()
+            record["distance_km"] = round(km, 1)
+            sys.stdout.write(json.dumps(record, ensure_ascii=False))
+            sys.stdout.write("\n")
+        sys.stdout.flush()
+    except BrokenPipeError:
+        close_stdout()
+    return 0
 
 
 def handle_welcome_screen():
@@ -144,6 +297,253 @@ def handle_favorite_table(alias):
         log.info("You have no favorite station list")
 
 
+def format_duration(seconds):
+    if not seconds:
+        return "?"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "{}:{:02}:{:02}".format(hours, minutes, seconds)
+
+
+def handle_library(text="", limit=100):
+    """lists the recordings from the library index, newest first. text
+    matches the station or a track title"""
+    library = Library()
+    recordings = library.recordings(text, limit)
+    if not recordings:
+        log.info("No recordings found" + (" for: {}".format(text) if text else ""))
+        return 0
+
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Started", justify="left")
+    table.add_column("Station", justify="left")
+    table.add_column("Length", justify="right")
+    table.add_column("Size", justify="right")
+    table.add_column("Tracks", justify="left")
+    table.add_column("File", justify="left")
+    for recording in recordings:
+        if text and recording["tracks"]:
+            # the titles that matched
+            titles = [track["title"] for track in library.tracks(recording["id"], text)]
+        else:
+            titles = []
+        tracks = ", ".join(titles[:2]) or str(recording["tracks"] or "")
+        name = os.path.basename(recording["path"])
+        if recording["status"] != "done":
+            name += " ({})".format(recording["status"])
+        table.add_row(
+            datetime.datetime.fromtimestamp(recording["started"]).strftime(
+                "%Y-%m-%d %H:%M"
+            ),
+            recording["station"],
+            format_duration(recording["duration"]),
+            human_size(recording["size"] or 0),
+            tracks,
+            name,
+        )
+    print(table)
+    return 0
+
+
+def handle_library_usage():
+    """disk usage of the recordings per station, from the library index"""
+    usage = Library().usage()
+    if not usage:
+        log.info("No recordings in the library, try --library-scan")
+        return 0
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Station", justify="left")
+    table.add_column("Recordings", justify="right")
+    table.add_column("Length", justify="right")
+    table.add_column("Size", justify="right")
+    table.add_column("Latest", justify="left")
+    for row in usage:
+        table.add_row(
+            row["station"],
+            str(row["recordings"]),
+            format_duration(row["duration"]),
+            human_size(row["size"]),
+            datetime.datetime.fromtimestamp(row["latest"]).strftime("%Y-%m-%d"),
+        )
+    table.add_row(
+        "[bold]Total[/bold]",
+        str(sum(row["recordings"] for row in usage)),
+        format_duration(sum(row["duration"] for row in usage)),
+        human_size(sum(row["size"] for row in usage)),
+        "",
+    )
+    print(table)
+    return 0
+
+
+def handle_library_scan(directory=None):
+    """adds the recordings of a directory to the library index and drops
+    the ones that were deleted"""
+    added, updated, removed = Library().scan(directory)
+    log.info(
+        "Library: {} recordings added, {} updated, {} removed".format(
+            added, updated, removed
+        )
+    )
+    return 0
+
+
+def handle_import(handler, alias, path):
+    """adds the stations of an M3U/PLS/OPML file to the favorite list, the
+    uuids in it are checked with a few batched API requests"""
+    try:
+        entries = read_playlist(path)
+    except RadioactiveError as e:
+        log.error(str(e))
+        return 1
+
+    uuids = [entry["stationuuid"] for entry in entries if entry["stationuuid"]]
+    found = None
+    if uuids:
+        try:
+            found = handler.find_stations_by_uuids(uuids)
+        except APIError as e:
+            log.debug("Error: {}".format(e))
+            log.warning("Could not reach radio-browser, uuids are added unchecked")
+
+    favorites = []
+    for entry in entries:
+        uuid = entry["stationuuid"]
+        if uuid and found is not None:
+            station = found.get(uuid)
+            if station is None and not entry["url"]:
+                log.warning("Unknown station uuid skipped: {}".format(uuid))
+                continue
+            if station is None:
+                # the uuid is gone, the stream URL may still work
+                uuid = ""
+            elif not entry["name"]:
+                entry["name"] = station["name"]
+        favorites.append((entry["name"] or uuid, uuid or entry["url"]))
+
+    added = alias.add_entries(favorites)
+    log.info(
+        "Added {} stations to your favorite list ({} skipped)".format(
+            added, len(entries) - added
+        )
+    )
+    return 0
+
+
+def handle_export(handler, alias, path):
+    """writes the favorite list as M3U/PLS/OPML, uuid entries get their
+    stream URL from one batched lookup"""
+    uuids = [
+        entry["uuid_or_url"].strip()
+        for entry in alias.alias_map
+        if "://" not in entry["uuid_or_url"]
+    ]
+    found = {}
+    if uuids:
+        try:
+            found = handler.find_stations_by_uuids(uuids)
+        except APIError as e:
+            log.debug("Error: {}".format(e))
+            log.warning("Could not reach radio-browser, using known stream URLs")
+
+    entries = []
+    for favorite in alias.alias_map:
+        target = favorite["uuid_or_url"].strip()
+        if "://" in target:
+            entries.append({"name": favorite["name"], "url": target})
+            continue
+        station = found.get(target) or handler.stations.get(target)
+        if station is None:
+            log.warning("No stream URL for {}, skipped".format(favorite["name"]))
+            continue
+        entries.append(
+            {
+                "name": favorite["name"],
+                "url": station.get("url_resolved") or station["url"],
+                "stationuuid": target,
+            }
+        )
+
+    try:
+        write_playlist(path, entries)
+    except RadioactiveError as e:
+        log.error(str(e))
+        return 1
+    log.info("Exported {} stations to {}".format(len(entries), path))
+    return 0
+
+
+def handle_cache_command(session, command):
+    policy = session.policy
+    if policy is None or policy.connection is None:
+        log.error("The API cache is not available")
+        return 1
+
+    if command == "clear":
+        policy.clear()
+        log.info("API cache cleared")
+        return 0
+
+    stats = policy.stats()
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Cache", justify="left")
+    table.add_column("Value", justify="left")
+    table.add_row("Location", stats["path"])
+    table.add_row("Entries", str(stats["entries"]))
+    table.add_row(
+        "Size", "{} / {}".format(human_size(stats["size"]), human_size(stats["max_size"]))
+    )
+    table.add_row("On disk", human_size(stats["disk"]))
+    table.add_row("Hits", str(stats["hits"]))
+    table.add_row("Misses", str(stats["misses"]))
+    table.add_row("Hit rate", "{:.1f}%".format(stats["hit_rate"]))
+    print(table)
+    return 0
+
+
+def handle_status(interval=DEFAULT_SAMPLE_INTERVAL):
+    """shows the ffplay/ffmpeg processes started by radioactive and what
+    they use, the rates are measured over one sample interval"""
+    sampler = Sampler(interval)
+    sampler.sample()
+    if interval > 0 and sampler.snapshot():
+        time.sleep(interval)
+        sampler.sample()
+
+    children = sampler.snapshot()
+    if not children:
+        log.info("No background radios or recordings are running!")
+        return
+
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("PID", justify="center")
+    table.add_column("Process", justify="center")
+    table.add_column("Station", justify="left")
+    table.add_column("Running for", justify="center")
+    table.add_column("State", justify="center")
+    table.add_column("CPU", justify="right")
+    table.add_column("Memory", justify="right")
+    table.add_column("In/s", justify="right")
+    table.add_column("Out/s", justify="right")
+    table.add_column("Stream", justify="left")
+    table.add_column("Errors", justify="right")
+    for child in children:
+        table.add_row(
+            str(child["pid"]),
+            child["kind"],
+            child["station"],
+            str(datetime.timedelta(seconds=int(child["uptime"]))),
+            child["status"],
+            "{:.1f}%".format(child["cpu_percent"]),
+            human_size(child["rss"]),
+            human_size(child["read_rate"]),
+            human_size(child["write_rate"]),
+            describe(child["progress"]),
+            str(child["progress"]["errors"]) if child["progress"] else "",
+        )
+    print(table)
+
+
 def handle_add_station(alias):
     left = input("Enter station name:")
     right = input("Enter station stream-url or radio-browser uuid:")
@@ -170,11 +570,9 @@ def handle_add_to_favorite(alias, station_name, station_uuid_url):
 def handle_station_uuid_play(handler, station_uuid):
     log.debug("Searching API for: {}".format(station_uuid))
 
+    # the click count is queued by the handler once the station is found
     handler.play_by_station_uuid(station_uuid)
 
-    log.debug("increased click count for: {}".format(station_uuid))
-
-    handler.vote_for_uuid(station_uuid)
     try:
         station_name = handler.target_station["name"]
         station_url = handler.target_station["url"]
@@ -186,6 +584,35 @@ def handle_station_uuid_play(handler, station_uuid):
     return station_name, station_url
 
 
+def handle_favorite_uuid_play(handler, station_uuid):
+    """plays a favorite from its snapshot, the API is only asked when there
+    is none yet"""
+    try:
+        station = handler.find_favorite(station_uuid)
+    except StationNotFound:
+        log.error("No station found with the uuid: {}".format(station_uuid))
+        sys.exit(1)
+    except RadioactiveError as e:
+        log.debug("Error: {}".format(e))
+        log.error("Something went wrong. please try again.")
+        sys.exit(1)
+
+    handler.target_station = station
+    handler.vote_for_uuid(station_uuid)
+    return station["name"], station["url"]
+
+
+def handle_refresh_favorites(handler, alias):
+    """refreshes the old favorite snapshots in one batched background lookup"""
+    uuids = [
+        entry["uuid_or_url"].strip()
+        for entry in alias.alias_map
+        if "://" not in entry["uuid_or_url"]
+    ]
+    if uuids:
+        handler.refresh_snapshots(uuids)
+
+
 def handle_search_stations(handler, station_name, limit):
     log.debug("Searching API for: {}".format(station_name))
 
@@ -245,7 +672,7 @@ def handle_station_selection_menu(handler, last_station, alias):
     else:
         # UUID
         station_uuid = station_option_url
-        return handle_station_uuid_play(handler, station_uuid)
+        return handle_favorite_uuid_play(handler, station_uuid)
 
 
 def handle_save_last_station(last_station, station_name, station_url):
@@ -259,6 +686,31 @@ def handle_save_last_station(last_station, station_name, station_url):
     last_station.save_info(last_played_station)
 
 
+def ask_record_file(record_file_format):
+    """asks for the file name of a recording, returns (name, format).
+    if no extension is provided the codec is auto detected, else if
+    ".mp3"/".opus" is provided it is converted to it after the capture"""
+    user_input = input("Enter output filename: ")
+    # try to get extension from filename
+    try:
+        file_name, file_ext = user_input.split(".")
+        if file_ext in TARGET_FORMATS:
+            log.debug("codec: force {}".format(file_ext))
+            # overwrite original codec
+            record_file_format = file_ext
+        else:
+            log.warning("You can only specify mp3 or opus as file extension.\n")
+            log.warning("Do not provide any extension to autodetect the codec.\n")
+    except:
+        file_name = user_input
+    return file_name, record_file_format
+
+
+def station_codec(station):
+    """the codec the API lists for a station, "" when it is not known"""
+    return (station.get("codec") or "") if station else ""
+
+
 def handle_listen_keypress(
     alias,
     target_url,
@@ -268,7 +720,34 @@ def handle_listen_keypress(
     record_file,
     record_file_format,
     loglevel,
+    zapper=None,
+    switch=None,
+    transcoder=None,
+    station_uuid="",
+    station=None,
+    tui=False,
+    progress=None,
+    track_titles=False,
 ):
+    if tui and tui_supported():
+        return handle_listen_tui(
+            alias,
+            target_url,
+            station_name,
+            station_url,
+            record_file_path,
+            record_file,
+            record_file_format,
+            loglevel,
+            zapper,
+            switch,
+            transcoder,
+            station_uuid,
+            station,
+            progress,
+            track_titles,
+        )
+
     log.info("Press '?' to see available commands\n")
     while True:
         user_input = input("Enter a command to perform an action: ")
@@ -280,28 +759,14 @@ def handle_listen_keypress(
                 record_file,
                 record_file_format,
                 loglevel,
+                transcoder,
+                station_uuid,
+                station_codec(station),
+                track_titles=track_titles,
             )
         elif user_input == "rf" or user_input == "RF" or user_input == "recordfile":
-            # if no filename is provided try to auto detect
-            # else if ".mp3" is provided, use libmp3lame to force write to mp3
-
-            user_input = input("Enter output filename: ")
-            # try to get extension from filename
-            try:
-                file_name, file_ext = user_input.split(".")
-                if file_ext == "mp3":
-                    log.debug("codec: force mp3")
-                    # overwrite original codec with "mp3"
-                    record_file_format = "mp3"
-                else:
-                    log.warning("You can only specify mp3 as file extension.\n")
-                    log.warning(
-                        "Do not provide any extension to autodetect the codec.\n"
-                    )
-            except:
-                file_name = user_input
-
-            if user_input.strip() != "":
+            file_name, record_file_format = ask_record_file(record_file_format)
+            if file_name.strip() != "":
                 handle_record(
                     target_url,
                     station_name,
@@ -309,6 +774,10 @@ def handle_listen_keypress(
                     file_name,
                     record_file_format,
                     loglevel,
+                    transcoder,
+                    station_uuid,
+                    station_codec(station),
+                    track_titles=track_titles,
                 )
 
         elif user_input == "f" or user_input == "F" or user_input == "fav":
@@ -317,6 +786,22 @@ def handle_listen_keypress(
         elif user_input == "q" or user_input == "Q" or user_input == "quit":
             kill_background_ffplays()
             sys.exit(0)
+        elif user_input in ["n", "N", "next", "p", "P", "prev"]:
+            if zapper is None or switch is None:
+                log.warning("No result or favorite list to switch through")
+                continue
+            try:
+                if user_input in ["n", "N", "next"]:
+                    station, stream = zapper.next()
+                else:
+                    station, stream = zapper.previous()
+            except RadioactiveError as e:
+                log.error(str(e))
+                continue
+            station_name, target_url = switch(station, stream)
+            station_url = target_url
+            station_uuid = station.get("stationuuid") or ""
+
         elif user_input == "w" or user_input == "W" or user_input == "list":
             alias.generate_map()
             handle_favorite_table(alias)
@@ -331,10 +816,148 @@ def handle_listen_keypress(
             log.info("q/quit: Quit radioactive")
             log.info("r/record: Record a station")
             log.info("f/fav: Add station to favorite list")
+            log.info("n/next, p/prev: Switch to the next/previous station")
             log.info("rf/recordfile: Specify a filename for the recording")
             # TODO: u for uuid, link for url, p for setting path
 
 
+def handle_listen_tui(
+    alias,
+    target_url,
+    station_name,
+    station_url,
+    record_file_path,
+    record_file,
+    record_file_format,
+    loglevel,
+    zapper=None,
+    switch=None,
+    transcoder=None,
+    station_uuid="",
+    station=None,
+    progress=None,
+    track_titles=False,
+):
+    """the listen loop with single key commands and a live status line (see
+    radioactive.tui). station is the API record of the station, if known,
+    progress returns the statistics of the player"""
+    now_playing = NowPlaying(
+        zapper=zapper, progress=progress, track_titles=track_titles
+    )
+    current = {
+        "name": station_name,
+        "url": target_url,
+        "station_url": station_url,
+        "uuid": station_uuid,
+        "codec": station_codec(station),
+    }
+
+    def record():
+        handle_record(
+            current["url"],
+            current["name"],
+            record_file_path,
+            record_file,
+            record_file_format,
+            loglevel,
+            transcoder,
+            current["uuid"],
+            current["codec"],
+            track_titles=track_titles,
+        )
+
+    def record_to_file():
+        file_name, file_format = ask_record_file(record_file_format)
+        if file_name.strip() != "":
+            handle_record(
+                current["url"],
+                current["name"],
+                record_file_path,
+                file_name,
+                file_format,
+                loglevel,
+                transcoder,
+                current["uuid"],
+                current["codec"],
+                track_titles=track_titles,
+            )
+
+    def favorite():
+        handle_add_to_favorite(alias, current["name"], current["station_url"])
+
+    def favorites():
+        alias.generate_map()
+        handle_favorite_table(alias)
+
+    def stop():
+        kill_background_ffplays()
+        sys.exit(0)
+
+    def zap(offset):
+        if zapper is None or switch is None:
+            log.warning("No result or favorite list to switch through")
+            return
+        try:
+            station, stream = zapper.step(offset)
+        except RadioactiveError as e:
+            log.error(str(e))
+            return
+        current["name"], current["url"] = switch(station, stream)
+        current["station_url"] = current["url"]
+        current["uuid"] = station.get("stationuuid") or ""
+        current["codec"] = station_codec(station)
+        now_playing.play(current["name"], current["url"], station)
+
+    def show_help():
+        log.info("?/h: Show this help message")
+        log.info("q: Quit radioactive")
+        log.info("r: Record the station")
+        log.info("R: Record the station to a file name you enter")
+        log.info("f: Add the station to the favorite list")
+        log.info("w: Show the favorite list")
+        log.info("n/p: Switch to the next/previous station")
+
+    commands = {
+        "r": record,
+        "R": record_to_file,
+        "f": favorite,
+        "F": favorite,
+        "w": favorites,
+        "W": favorites,
+        "q": stop,
+        "Q": stop,
+        "n": lambda: zap(1),
+        "N": lambda: zap(1),
+        "p": lambda: zap(-1),
+        "P": lambda: zap(-1),
+        "?": show_help,
+        "h": show_help,
+        "H": show_help,
+    }
+
+    log.info("Press '?' to see available commands\n")
+    now_playing.play(station_name, target_url, station)
+    ListenUI(now_playing, commands).run()
+
+
+def handle_zapper(handler, alias, station_name, target_url, warm=DEFAULT_WARM):
+    """next/previous go through the result list the station was picked from,
+    or else through the favorite list"""
+    if len(handler.results) > 1:
+        stations = zap_list_from_results(handler.results)
+        index = handler.result_index
+    else:
+        stations = zap_list_from_favorites(alias, handler.stations)
+        index = -1  # next starts at the first favorite
+        for position, station in enumerate(stations):
+            if station["name"] == station_name or station["url"] == target_url:
+                index = position
+                break
+    if not stations:
+        return None
+    return Zapper(stations, index, warm, resolve=handler.find_stream).rewarm()
+
+
 def handle_current_play_panel(curr_station_name=""):
     panel_station_name = Text(curr_station_name, justify="center")
 
@@ -343,41 +966,71 @@ def handle_current_play_panel(curr_station_name=""):
     console.print(station_panel)
 
 
-def handle_user_choice_from_search_result(handler, response):
+def handle_prefetched_play(handler, prefetcher, station_uuid):
+    """plays a station resolved in the background, falls back to the API"""
+    station = prefetcher.get(station_uuid)
+    prefetcher.cancel()
+    if station is None:
+        return handle_station_uuid_play(handler, station_uuid)
+
+    log.debug("Playing prefetched station: {}".format(station["name"]))
+    handler.target_station = station
+    handler.stations.remember(station)
+    handler.vote_for_uuid(station_uuid)
+    # the same url handle_station_uuid_play plays
+    return station["name"], station["url"]
+
+
+def handle_user_choice_from_search_result(
+    handler, response, prefetch=DEFAULT_PREFETCH
+):
     if not response:
         log.debug("No result found!")
         sys.exit(0)
-    if len(response) == 1:
-        # single station found
-        log.debug("Exactly one result found")
-
-        user_input = input("Want to play this station? Y/N: ")
-        if user_input == ("y" or "Y"):
-            log.debug("Playing UUID from single response")
-            return handle_station_uuid_play(handler, response[0]["stationuuid"])
-        else:
-            log.debug("Quitting")
-            sys.exit(0)
-    else:
-        # multiple station
-        log.debug("Asking for user input")
 
-        user_input = input("Type the result ID to play: ")
-        try:
-            user_input = int(user_input) - 1  # because ID starts from 1
-            if user_input in range(0, len(response)):
-                target_response = response[user_input]
-                log.debug("Selected: {}".format(target_response))
-                return handle_station_uuid_play(handler, target_response["stationuuid"])
+    # resolve the likely choices while the user reads the table
+    prefetcher = Prefetcher(handler, response, top=prefetch).start()
+    try:
+        if len(response) == 1:
+            # single station found
+            log.debug("Exactly one result found")
+
+            user_input = input("Want to play this station? Y/N: ")
+            if user_input == ("y" or "Y"):
+                log.debug("Playing UUID from single response")
+                handler.results, handler.result_index = response, 0
+                return handle_prefetched_play(
+                    handler, prefetcher, response[0]["stationuuid"]
+                )
             else:
-                log.error("Please enter an ID within the range")
+                log.debug("Quitting")
+                sys.exit(0)
+        else:
+            # multiple station
+            log.debug("Asking for user input")
+
+            user_input = input("Type the result ID to play: ")
+            try:
+                user_input = int(user_input) - 1  # because ID starts from 1
+                if user_input in range(0, len(response)):
+                    target_response = response[user_input]
+                    log.debug("Selected: {}".format(target_response))
+                    handler.results, handler.result_index = response, user_input
+                    return handle_prefetched_play(
+                        handler, prefetcher, target_response["stationuuid"]
+                    )
+                else:
+                    log.error("Please enter an ID within the range")
+                    sys.exit(1)
+            except:
+                log.err("Please enter an valid ID number")
                 sys.exit(1)
-        except:
-            log.err("Please enter an valid ID number")
-            sys.exit(1)
+    finally:
+        # also on quit, a wrong ID or ctrl+c: nothing new starts after this
+        prefetcher.cancel()
 
 
-def handle_direct_play(alias, station_name_or_url=""):
+def handle_direct_play(alias, station_name_or_url="", handler=None):
     """Play a station directly with UUID or direct stream URL"""
     if "http" in station_name_or_url.strip():
         log.debug("Direct play: URL provided")
@@ -395,6 +1048,11 @@ def handle_direct_play(alias, station_name_or_url=""):
             sys.exit(1)
         else:
             log.debug("Direct play: {}".format(response))
+            if "://" not in response["uuid_or_url"] and handler is not None:
+                _, station_url = handle_favorite_uuid_play(
+                    handler, response["uuid_or_url"].strip()
+                )
+                return response["name"], station_url
             return response["name"], response["uuid_or_url"]
 
 
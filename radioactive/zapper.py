@@ -0,0 +1,213 @@
+""" Next/previous station zapping.
+
+The stations next to the playing one (in the result list or the favorite
+list) are kept connected in the background. Each WarmStream keeps the last
+few seconds of its stream in a ring buffer, so on a switch the player is fed
+the buffered audio through its stdin and starts right away, then the live
+connection is handed over to it.
+"""
+
+import queue
+import threading
+from collections import deque
+
+import requests
+from zenlog import log
+
+from radioactive.metrics import STREAM_CONNECTS, STREAM_FAILURES
+from radioactive.prefetch import open_stream
+
+DEFAULT_WARM = 2
+# ~4 seconds of a 128kbps stream
+WARM_BUFFER_BYTES = 64 * 1024
+WARM_CHUNK_SIZE = 4096
+WARM_TIMEOUT = (3, 10)
+
+
+def zap_list_from_results(response):
+    return [
+        {
+            "name": station["name"],
+            "url": station.get("url_resolved") or station.get("url", ""),
+            "stationuuid": station.get("stationuuid"),
+        }
+        for station in response
+    ]
+
+
+def zap_list_from_favorites(alias, snapshots=None):
+    """uuid favorites take the stream URL of their snapshot, if there is one"""
+    stations = []
+    for entry in alias.alias_map:
+        target = entry["uuid_or_url"].strip()
+        if "http" in target:
+            stations.append({"name": entry["name"], "url": target})
+            continue
+        snapshot = snapshots.get(target) if snapshots is not None else None
+        url = (snapshot or {}).get("url") or ""
+        stations.append({"name": entry["name"], "url": url, "stationuuid": target})
+    return stations
+
+
+class WarmStream:
+    """A background connection to a station that buffers its latest audio"""
+
+    def __init__(
+        self, station, resolve=None, buffer_bytes=WARM_BUFFER_BYTES, session=None
+    ):
+        self.station = dict(station)
+        self.resolve = resolve
+        self.buffer_bytes = buffer_bytes
+        self.session = session or requests.Session()
+        self.buffer = deque()
+        self.buffered = 0
+        self.live = None
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.failed = False
+        self.response = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return self.station.get("url")
+
+    @property
+    def ready(self):
+        """has audio buffered and the connection is still up"""
+        return self.buffered > 0 and not self.failed
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def run(self):
+        try:
+            if not self.url and self.resolve is not None:
+                self.station.update(self.resolve(self.station["stationuuid"]))
+            self.response = open_stream(self.session, self.url, WARM_TIMEOUT)
+            STREAM_CONNECTS.labels("warm").inc()
+            self.station["url"] = self.response.url
+            for chunk in self.response.iter_content(chunk_size=WARM_CHUNK_SIZE):
+                if self.closed.is_set():
+                    break
+                if chunk:
+                    self.push(chunk)
+        except Exception as e:
+            if not self.closed.is_set():
+                STREAM_FAILURES.labels("warm").inc()
+                log.debug("Warm stream {}: {}".format(self.station["name"], e))
+        finally:
+            self.failed = True
+            with self.lock:
+                if self.live is not None:
+                    self.live.put(None)
+
+    def push(self, chunk):
+        with self.lock:
+            if self.live is not None:
+                self.live.put(chunk)
+                return
+            self.buffer.append(chunk)
+            self.buffered += len(chunk)
+            # keep only the latest audio
+            while self.buffered - len(self.buffer[0]) >= self.buffer_bytes:
+                self.buffered -= len(self.buffer.popleft())
+
+    def take(self):
+        """hands the buffered audio and the live connection over, returns a
+        generator of byte chunks"""
+        with self.lock:
+            self.live = queue.Queue()
+            for chunk in self.buffer:
+                self.live.put(chunk)
+            self.buffer.clear()
+            if self.failed:
+                self.live.put(None)
+        return self.chunks()
+
+    def chunks(self):
+        while not self.closed.is_set():
+            try:
+                chunk = self.live.get(timeout=WARM_TIMEOUT[1])
+            except queue.Empty:
+                return
+            if chunk is None:
+                return
+            yield chunk
+
+    def close(self):
+        self.closed.set()
+        with self.lock:
+            if self.live is not None:
+                self.live.put(None)
+        if self.response is not None:
+            self.response.close()
+
+
+class Zapper:
+    """Walks a station list and keeps the neighbors of the current one warm"""
+
+    def __init__(self, stations, index=0, warm=DEFAULT_WARM, resolve=None):
+        self.stations = stations
+        self.index = index % len(stations) if stations else 0
+        self.warm = max(0, warm)
+        self.resolve = resolve
+        self.streams = {}
+        self.session = requests.Session()
+
+    def __len__(self):
+        return len(self.stations)
+
+    def neighbors(self):
+        """indexes to keep warm, alternating next and previous"""
+        indexes = []
+        offset = 1
+        while len(indexes) < min(self.warm, len(self.stations) - 1):
+            for step in (offset, -offset):
+                index = (self.index + step) % len(self.stations)
+                if index != self.index and index not in indexes:
+                    indexes.append(index)
+            offset += 1
+        return indexes[: self.warm]
+
+    def rewarm(self):
+        wanted = self.neighbors()
+        for index in list(self.streams):
+            if index not in wanted:
+                self.streams.pop(index).close()
+        for index in wanted:
+            if index not in self.streams:
+                self.streams[index] = WarmStream(
+                    self.stations[index], self.resolve, session=self.session
+                ).start()
+        return self
+
+    def step(self, offset):
+        """moves through the list, returns (station, warm stream or None)"""
+        self.index = (self.index + offset) % len(self.stations)
+        stream = self.streams.pop(self.index, None)
+        if stream is not None and not stream.ready:
+            stream.close()
+            stream = None
+        if stream is not None:
+            self.stations[self.index] = stream.station
+        self.rewarm()
+        station = self.stations[self.index]
+        if not station.get("url") and self.resolve is not None:
+            station.update(self.resolve(station["stationuuid"]))
+        return station, stream
+
+    def next(self):
+        return self.step(1)
+
+    def previous(self):
+        return self.step(-1)
+
+    def close(self):
+        for stream in self.streams.values():
+            stream.close()
+        self.streams = {}
+        self.session.close()
@@ -37,6 +37,7 @@ setup(
         "console_scripts": [
             "radioactive = radioactive.__main__:main",
             "radio = radioactive.__main__:main",
+            "radioctl = radioactive.control:main",
         ]
     },
     packages=find_packages(exclude=["test*"]),
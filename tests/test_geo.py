@@ -0,0 +1,104 @@
+import math
+import random
+
+import pytest
+
+from radioactive.geo import (EARTH_RADIUS_KM, GeoIndex, chord_to_km, parse_point,
+                             position)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def random_stations(count, seed=42):
+    rng = random.Random(seed)
+    return [
+        {
+            "stationuuid": "u{}".format(i),
+            "geo_lat": rng.uniform(-90, 90),
+            "geo_long": rng.uniform(-180, 180),
+            "state": rng.choice(["Berlin", "Bavaria", ""]),
+            "countrycode": rng.choice(["de", "fr", "us"]),
+        }
+        for i in range(count)
+    ]
+
+
+def brute_force(stations, lat, lon, limit, radius=None):
+    found = [
+        (s["stationuuid"], haversine(lat, lon, s["geo_lat"], s["geo_long"]))
+        for s in stations
+    ]
+    if radius is not None:
+        found = [item for item in found if item[1] <= radius]
+    return sorted(found, key=lambda item: item[1])[:limit]
+
+
+@pytest.mark.parametrize(
+    "lat,lon,limit,radius",
+    [
+        (52.52, 13.40, 10, None),
+        (-33.87, 151.21, 25, None),
+        (89.9, 0.0, 5, None),  # close to the pole
+        (0.0, 179.9, 15, None),  # across the date line
+        (48.85, 2.35, 50, 1500.0),
+        (10.0, 10.0, 1, None),
+    ],
+)
+def test_nearest_matches_brute_force(lat, lon, limit, radius):
+    stations = random_stations(2000)
+    index = GeoIndex.from_stations(stations)
+    nearest = index.nearest(lat, lon, limit, radius)
+    expected = brute_force(stations, lat, lon, limit, radius)
+
+    assert [uuid for uuid, _ in nearest] == [uuid for uuid, _ in expected]
+    for (_, km), (_, expected_km) in zip(nearest, expected):
+        assert km == pytest.approx(expected_km, abs=1e-6)
+
+
+def test_radius_can_leave_nothing():
+    index = GeoIndex.from_stations(random_stations(100))
+    assert index.nearest(0.0, 0.0, 10, radius=0.001) == []
+    assert GeoIndex().nearest(0.0, 0.0) == []
+
+
+def test_stations_without_a_position_are_left_out():
+    stations = [
+        {"stationuuid": "a", "geo_lat": None, "geo_long": None},
+        {"stationuuid": "b", "geo_lat": 0, "geo_long": 0},
+        {"stationuuid": "c", "geo_lat": "91", "geo_long": "10"},
+        {"stationuuid": "d", "geo_lat": "52.5", "geo_long": "13.4"},
+    ]
+    assert [position(s) for s in stations] == [None, None, None, (52.5, 13.4)]
+    assert GeoIndex.from_stations(stations).uuids == ["d"]
+
+
+def test_parse_point():
+    assert parse_point("52.52,13.40") == (52.52, 13.40)
+    assert parse_point("52.52;13.40") == (52.52, 13.40)
+    assert parse_point("Berlin") is None
+    assert parse_point("95,10") is None
+
+
+def test_locate_and_save_load(tmp_path):
+    stations = random_stations(300)
+    index = GeoIndex.from_stations(stations)
+    path = str(tmp_path / "geo_index.json")
+    index.save(path)
+    loaded = GeoIndex.load(path)
+
+    assert loaded.uuids == index.uuids
+    assert loaded.nearest(1.0, 2.0, 20) == index.nearest(1.0, 2.0, 20)
+    assert loaded.locate("berlin") is not None
+    assert loaded.locate("DE") is not None
+    assert loaded.locate("Atlantis") is None
+
+
+def test_chord_to_km_of_antipodes():
+    assert chord_to_km(2.0) == pytest.approx(math.pi * EARTH_RADIUS_KM)
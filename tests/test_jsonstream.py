@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from radioactive.jsonstream import iter_array
+
+STATIONS = [
+    {"stationuuid": "a1", "name": "Radio Paradise", "tags": "rock,eclectic"},
+    {"stationuuid": "b2", "name": "Café del Mar", "votes": 12, "bitrate": 128},
+    {"stationuuid": "c3", "name": '[brackets], "quotes" and \\', "tags": ""},
+]
+
+
+def chunked(data, size):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 100000])
+def test_items_are_the_same_for_any_chunk_size(size):
+    data = json.dumps(STATIONS, ensure_ascii=False).encode("utf-8")
+    assert list(iter_array(chunked(data, size))) == STATIONS
+
+
+def test_pretty_printed_array():
+    data = json.dumps(STATIONS, indent=4).encode("utf-8")
+    assert list(iter_array(chunked(data, 5))) == STATIONS
+
+
+def test_empty_array():
+    assert list(iter_array([b"  [ ", b" ]\n"])) == []
+
+
+def test_items_are_yielded_before_the_array_ends():
+    items = iter_array(iter([b'[{"a": 1}, {"b"', b": 2}]"]))
+    assert next(items) == {"a": 1}
+    assert next(items) == {"b": 2}
+
+
+def test_not_an_array():
+    with pytest.raises(ValueError):
+        list(iter_array([b'{"error": "rate limited"}']))
+
+
+def test_truncated_array():
+    with pytest.raises(ValueError):
+        list(iter_array([b'[{"a": 1}, {"b": ']))
@@ -0,0 +1,78 @@
+import pytest
+
+from radioactive.errors import PlaylistError
+from radioactive.playlist import (format_of, parse_m3u, parse_opml, parse_pls,
+                                  read_playlist, write_playlist)
+
+ENTRIES = [
+    {
+        "name": "Radio Paradise",
+        "url": "http://stream.radioparadise.com/mp3-192",
+        "stationuuid": "9617a958-0601-11e8-ae97-52543be04c81",
+    },
+    {
+        "name": 'Café "Jazz" & <Blues>, Live',
+        "url": "https://example.com/live?type=.mp3&id=1",
+        "stationuuid": "",
+    },
+]
+
+
+@pytest.mark.parametrize("suffix", [".m3u", ".m3u8", ".opml", ".xml"])
+def test_round_trip_keeps_the_uuid(tmp_path, suffix):
+    path = str(tmp_path / ("favorites" + suffix))
+    write_playlist(path, ENTRIES)
+    assert read_playlist(path) == ENTRIES
+
+
+def test_pls_round_trip_keeps_name_and_url(tmp_path):
+    path = str(tmp_path / "favorites.pls")
+    write_playlist(path, ENTRIES)
+    assert read_playlist(path) == [dict(item, stationuuid="") for item in ENTRIES]
+
+
+def test_m3u_without_names_and_plain_uuids():
+    text = "\n".join(
+        [
+            "#EXTM3U",
+            "http://a.example/stream",
+            "",
+            "# a comment",
+            "9617a958-0601-11e8-ae97-52543be04c81",
+            '#EXTINF:-1 tvg-logo="x.png",Named',
+            "http://b.example/stream",
+        ]
+    )
+    assert [(e["name"], e["url"], e["stationuuid"]) for e in parse_m3u(text)] == [
+        ("http://a.example/stream", "http://a.example/stream", ""),
+        ("", "", "9617a958-0601-11e8-ae97-52543be04c81"),
+        ("Named", "http://b.example/stream", ""),
+    ]
+
+
+def test_pls_entries_are_numbered():
+    text = "[playlist]\nFile2=http://b\nTitle1=One\nFile1=http://a\nNumberOfEntries=2\n"
+    assert parse_pls(text) == [
+        {"name": "One", "url": "http://a", "stationuuid": ""},
+        {"name": "http://b", "url": "http://b", "stationuuid": ""},
+    ]
+
+
+def test_opml_folders_are_walked():
+    text = """<opml version="1.0"><body>
+        <outline text="Jazz">
+            <outline type="audio" title="Inner" url="http://inner" />
+        </outline>
+    </body></opml>"""
+    assert parse_opml(text) == [
+        {"name": "Inner", "url": "http://inner", "stationuuid": ""}
+    ]
+
+
+def test_errors():
+    with pytest.raises(PlaylistError):
+        format_of("favorites.txt")
+    with pytest.raises(PlaylistError):
+        parse_opml("<opml><body>")
+    with pytest.raises(PlaylistError):
+        read_playlist("/nonexistent/favorites.m3u")
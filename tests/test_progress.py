@@ -0,0 +1,117 @@
+import pytest
+
+from radioactive.progress import Progress, describe, to_number
+
+BLOCK = (
+    b"bitrate=128.0kbits/s\n"
+    b"total_size=81920\n"
+    b"out_time_us=5120000\n"
+    b"out_time_ms=5120000\n"
+    b"out_time=00:00:05.120000\n"
+    b"dup_frames=0\n"
+    b"drop_frames=0\n"
+    b"speed=1.01x\n"
+    b"progress=continue\n"
+)
+# two blocks of `ffmpeg -nostats -progress pipe:2 -i <stream> -c copy out.mp3`
+# (ffmpeg 6), the first before any audio arrived. some values are padded
+FFMPEG_OUTPUT = (
+    b"bitrate=N/A\n"
+    b"total_size=0\n"
+    b"out_time_us=N/A\n"
+    b"out_time_ms=N/A\n"
+    b"out_time=N/A\n"
+    b"dup_frames=0\n"
+    b"drop_frames=0\n"
+    b"speed=N/A\n"
+    b"progress=continue\n"
+    b"bitrate= 127.9kbits/s\n"
+    b"total_size=163884\n"
+    b"out_time_us=10251000\n"
+    b"out_time_ms=10251000\n"
+    b"out_time=00:00:10.251000\n"
+    b"dup_frames=0\n"
+    b"drop_frames=0\n"
+    b"speed=   1x\n"
+    b"progress=continue\n"
+)
+FFPLAY_STATUS = b"  12.34 M-A:  0.000 fd=   3 aq=   24KB vq=    0KB sq=    0B \r"
+
+
+def chunked(data, size):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 5, 4096])
+def test_ffmpeg_block_in_chunks_of_any_size(size):
+    progress = Progress()
+    for chunk in chunked(BLOCK, size):
+        assert progress.feed_data(chunk) == []
+    stats = progress.to_dict()
+    assert stats["updates"] == 1
+    assert stats["errors"] == 0
+    assert stats["bytes"] == 81920
+    assert stats["time"] == 5.12
+    assert stats["bitrate"] == 128.0
+    assert stats["speed"] == 1.01
+    assert stats["dropped"] == 0
+    assert not progress.ended
+
+
+def test_ffmpeg_output_with_padded_values():
+    progress = Progress()
+    assert progress.feed_data(FFMPEG_OUTPUT[:200]) == []
+    assert progress.to_dict()["bitrate"] is None
+    assert progress.feed_data(FFMPEG_OUTPUT[200:]) == []
+    stats = progress.to_dict()
+    assert (stats["errors"], stats["last_error"]) == (0, "")
+    assert stats["updates"] == 2
+    assert stats["bytes"] == 163884
+    assert stats["time"] == 10.251
+    assert stats["bitrate"] == 127.9
+    assert stats["speed"] == 1.0
+
+
+def test_values_change_only_when_a_block_is_complete():
+    progress = Progress()
+    progress.feed_data(BLOCK)
+    progress.feed_data(b"total_size=90000\nout_time_us=6000000\n")
+    assert progress.to_dict()["bytes"] == 81920
+    progress.feed_data(b"progress=end\n")
+    assert progress.to_dict()["bytes"] == 90000
+    assert progress.ended
+
+
+def test_error_lines_are_returned_and_counted():
+    progress = Progress()
+    errors = progress.feed_data(
+        b"[http @ 0x55d0] HTTP error 404 Not Found\n" + BLOCK + b"\n"
+    )
+    assert errors == ["[http @ 0x55d0] HTTP error 404 Not Found"]
+    stats = progress.to_dict()
+    assert (stats["errors"], stats["last_error"]) == (1, errors[0])
+    assert stats["bytes"] == 81920
+
+
+def test_ffplay_status_line():
+    progress = Progress()
+    assert progress.feed_data(FFPLAY_STATUS * 3) == []
+    stats = progress.to_dict()
+    assert stats["time"] == 12.34
+    assert stats["dropped"] == 3
+    assert stats["buffer"] == 24 * 1024
+    assert stats["updates"] == 3
+
+
+def test_to_number():
+    assert to_number("128.0kbits/s") == 128.0
+    assert to_number("1234", int) == 1234
+    assert to_number("N/A") is None
+    assert to_number(None) is None
+
+
+def test_describe():
+    progress = Progress()
+    assert describe(progress.to_dict()) == ""
+    progress.feed_data(BLOCK)
+    assert describe(progress.to_dict()) == "0:00:05, 80.0 KB, 128 kbps, 1.01x"
@@ -0,0 +1,99 @@
+import random
+
+import pytest
+
+from radioactive.ranking import normalize_name, normalize_url, rank_stations
+
+
+def station(name, url, votes=0, clicks=0, bitrate=128, ok=1, country="DE"):
+    return {
+        "name": name,
+        "url": url,
+        "votes": votes,
+        "clickcount": clicks,
+        "bitrate": bitrate,
+        "lastcheckok": ok,
+        "countrycode": country,
+    }
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "http://Stream.Example.com:80/live/;",
+        "https://stream.example.com:443/live",
+        "stream.example.com/live/",
+    ],
+)
+def test_normalize_url(url):
+    assert normalize_url(url) == "stream.example.com/live"
+
+
+@pytest.mark.parametrize(
+    "name",
+    ["Radio X (128 kbps)", "Radio X - HQ", "radio x 320k", "Radio X [AAC+]"],
+)
+def test_normalize_name_drops_quality_markers(name):
+    assert normalize_name(name) == "radio x"
+
+
+def test_normalize_name_keeps_numbers_that_are_not_bitrates():
+    assert normalize_name("1LIVE Kaktus") == "1live kaktus"
+    assert normalize_name("Radio 21") == "radio 21"
+
+
+def test_order_is_ok_then_votes_clicks_bitrate():
+    stations = [
+        station("a", "http://a", votes=10, clicks=5, bitrate=64),
+        station("b", "http://b", votes=10, clicks=5, bitrate=320),
+        station("c", "http://c", votes=10, clicks=9),
+        station("d", "http://d", votes=99, ok=0),
+        station("e", "http://e", votes=11),
+    ]
+    assert [s["name"] for s in rank_stations(stations)] == ["e", "c", "b", "a", "d"]
+
+
+def test_duplicates_keep_the_best_copy():
+    stations = [
+        station("Radio X 128k", "http://x.example/128", votes=5),
+        station("Radio X HQ", "http://x.example/320", votes=50),
+        station("Radio X", "http://X.example:80/320/;", votes=7),
+        station("Radio X", "http://other.example/", votes=1, country="FR"),
+    ]
+    ranked = rank_stations(stations)
+    assert [(s["name"], s["countrycode"]) for s in ranked] == [
+        ("Radio X HQ", "DE"),
+        ("Radio X", "FR"),
+    ]
+    assert len(rank_stations(stations, dedupe=False)) == 4
+
+
+def test_odd_values_are_clamped():
+    stations = [
+        station("a", "http://a", votes=None),
+        station("b", "http://b", votes="12"),
+        station("c", "http://c", votes=-3),
+        station("d", "http://d", votes=1 << 40),
+    ]
+    assert [s["name"] for s in rank_stations(stations)] == ["d", "b", "a", "c"]
+
+
+def test_same_as_sorting_on_the_fields():
+    rng = random.Random(7)
+    stations = [
+        station(
+            "s{}".format(i),
+            "http://host/{}".format(i),
+            votes=rng.randrange(5),
+            clicks=rng.randrange(5),
+            bitrate=rng.choice([64, 128]),
+            ok=rng.randrange(2),
+        )
+        for i in range(500)
+    ]
+    expected = sorted(
+        stations,
+        key=lambda s: (s["lastcheckok"], s["votes"], s["clickcount"], s["bitrate"]),
+        reverse=True,
+    )
+    assert rank_stations(stations) == expected
@@ -0,0 +1,85 @@
+import json
+
+from radioactive.station import EXTRA_FIELDS, Station, pack, unpack
+
+RECORD = {
+    "changeuuid": "610cafba-71d8-40fc-bf68-1456ec973b9d",
+    "stationuuid": "9617a958-0601-11e8-ae97-52543be04c81",
+    "serveruuid": None,
+    "name": "Radio Paradise",
+    "url": "http://stream.radioparadise.com/mp3-192",
+    "url_resolved": "http://stream.radioparadise.com/mp3-192",
+    "homepage": "https://radioparadise.com/",
+    "favicon": "",
+    "tags": "eclectic,rock",
+    "country": "The United States Of America",
+    "countrycode": "US",
+    "iso_3166_2": None,
+    "state": "California",
+    "language": "english",
+    "languagecodes": "en",
+    "votes": 1234,
+    "lastchangetime_iso8601": "2023-01-01T10:00:00Z",
+    "codec": "MP3",
+    "bitrate": 192,
+    "hls": 0,
+    "lastcheckok": 1,
+    "clickcount": 77,
+    "clicktrend": -2,
+    "ssl_error": 0,
+    "geo_lat": 39.7,
+    "geo_long": -121.6,
+    "has_extended_info": False,
+}
+
+
+def test_round_trip_of_an_api_record():
+    station = Station.from_api(RECORD)
+    assert station.to_dict() == RECORD
+    assert dict(station) == RECORD
+    assert len(station) == len(RECORD)
+
+
+def test_fields_read_like_the_api_dict():
+    station = Station.from_api(RECORD)
+    assert station["stationuuid"] == station.uuid == RECORD["stationuuid"]
+    assert station["geo_lat"] == 39.7
+    assert station.get("homepage") == "https://radioparadise.com/"
+    assert station.get("not a field") is None
+    assert station["lastcheckok"] == 1 and station.lastcheckok is True
+    assert station.stream_url == RECORD["url_resolved"]
+
+
+def test_unknown_fields_are_kept_with_their_name():
+    record = dict(RECORD, new_api_field=[1, "two"])
+    station = Station.from_api(record)
+    assert station["new_api_field"] == [1, "two"]
+    assert station.to_dict() == record
+
+
+def test_pack_leaves_the_known_names_out():
+    rest = {"geo_lat": 1.5, "hls": 0, "custom": "x"}
+    packed = pack(dict(rest))
+    assert b"geo_lat" not in packed and b"custom" in packed
+    mask, values, unknown = json.loads(packed.decode("utf-8"))
+    assert mask == (1 << EXTRA_FIELDS.index("hls")) | (
+        1 << EXTRA_FIELDS.index("geo_lat")
+    )
+    assert values == [0, 1.5]
+    assert unknown == {"custom": "x"}
+    assert unpack(packed) == rest
+    assert unpack(b"") == {}
+
+
+def test_shared_values_are_interned():
+    first = Station.from_api(dict(RECORD, countrycode="".join(["U", "S"])))
+    second = Station.from_api(dict(RECORD, countrycode="".join(["U", "S"])))
+    assert first.countrycode is second.countrycode
+
+
+def test_odd_values():
+    record = {"stationuuid": "u", "name": "X", "url": "http://x", "lastcheckok": 0}
+    station = Station.from_api(dict(record, bitrate=None, votes="12"))
+    assert (station.bitrate, station.votes, station.lastcheckok) == (0, 12, False)
+    assert station.url_resolved == "" and station.stream_url == "http://x"
+    assert Station.from_url("http://y").stream_url == "http://y"
@@ -0,0 +1,123 @@
+import pytest
+
+from radioactive.errors import QueryError
+from radioactive.tags import (TagIndex, journal, normalize_tag, parse_query,
+                              split_tags, tokenize)
+
+STATIONS = [
+    {"stationuuid": "u1", "tags": "Jazz,Smooth-Jazz", "votes": 5},
+    {"stationuuid": "u2", "tags": "jazz, bebop", "votes": 50},
+    {"stationuuid": "u3", "tags": "rock,80s", "votes": 20},
+    {"stationuuid": "u4", "tags": "metal, 80s", "votes": 1},
+    {"stationuuid": "u5", "tags": "smooth_jazz,lounge", "votes": 9},
+    {"stationuuid": "u6", "tags": "", "votes": 3},
+]
+
+
+def build():
+    index = TagIndex()
+    index.update(STATIONS)
+    return index
+
+
+def matches(node, tags):
+    """the query evaluated against the tags of one station"""
+    kind = node[0]
+    if kind == "tag":
+        return node[1] in tags
+    if kind == "not":
+        return not matches(node[1], tags)
+    if kind == "and":
+        return matches(node[1], tags) and matches(node[2], tags)
+    return matches(node[1], tags) or matches(node[2], tags)
+
+
+def brute_force(query):
+    node = parse_query(query)
+    found = [s for s in STATIONS if matches(node, split_tags(s["tags"]))]
+    found.sort(key=lambda s: -s["votes"])
+    return [s["stationuuid"] for s in found]
+
+
+def test_normalize_tag():
+    assert normalize_tag("Smooth-Jazz") == "smooth jazz"
+    assert normalize_tag(" smooth_jazz  ") == "smooth jazz"
+    assert split_tags("Jazz, jazz,Smooth  Jazz,") == ("jazz", "smooth jazz")
+
+
+def test_tokenize_keeps_the_words_of_a_tag_together():
+    assert tokenize("smooth jazz AND NOT 80s") == [
+        ("tag", "smooth jazz"),
+        ("&", None),
+        ("!", None),
+        ("tag", "80s"),
+    ]
+    assert tokenize('"and" | (a)') == [
+        ("tag", "and"),
+        ("|", None),
+        ("(", None),
+        ("tag", "a"),
+        (")", None),
+    ]
+
+
+def test_precedence():
+    assert parse_query("a OR b AND NOT c") == (
+        "or",
+        ("tag", "a"),
+        ("and", ("tag", "b"), ("not", ("tag", "c"))),
+    )
+    assert parse_query("(a OR b) c") == (
+        "and",
+        ("or", ("tag", "a"), ("tag", "b")),
+        ("tag", "c"),
+    )
+
+
+@pytest.mark.parametrize("query", ["", "jazz AND", "(jazz", "jazz)", "OR jazz"])
+def test_invalid_queries(query):
+    with pytest.raises(QueryError):
+        parse_query(query)
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "jazz",
+        "smooth jazz",
+        "jazz AND NOT smooth jazz",
+        "NOT jazz",
+        "(rock OR metal) AND 80s",
+        "jazz OR lounge OR 80s",
+        "NOT (jazz OR 80s)",
+        "unknown",
+    ],
+)
+def test_query_matches_brute_force(query):
+    assert build().query(query) == brute_force(query)
+
+
+def test_query_limit_keeps_the_most_voted():
+    assert build().query("jazz OR 80s", limit=2) == ["u2", "u3"]
+
+
+def test_update_returns_only_changes():
+    index = build()
+    assert index.update(STATIONS) == []
+    changed = dict(STATIONS[0], tags="jazz,bebop")
+    assert index.update([changed]) == [("u1", ("jazz", "bebop"), 5)]
+    assert index.query("smooth jazz") == ["u5"]
+    assert index.query("bebop") == ["u2", "u1"]
+
+
+def test_save_load_and_journal(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    build().save()
+    loaded = TagIndex.load()
+    journal(loaded.update([dict(STATIONS[3], tags="metal,thrash")]))
+
+    replayed = TagIndex.load()
+    assert replayed.journal_entries == 1
+    assert replayed.query("thrash") == ["u4"]
+    assert replayed.query("80s") == ["u3"]
+    assert replayed.query("jazz AND NOT smooth jazz") == ["u2"]